@@ -0,0 +1,61 @@
+"""
+Microbenchmark: Database.add_memory + get_memory(limit=6) at 1M stored rows.
+
+    python bench/bench_db.py [--rows 1000000] [--users 50000] [--ops 20000]
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.db import Database, SQL_ADD_MEMORY
+
+
+def seed(db, rows, users):
+    conn = db._conn()
+    now = time.time()
+    batch = 50000
+    conn.execute("BEGIN")
+    for start in range(0, rows, batch):
+        conn.executemany(SQL_ADD_MEMORY, (
+            (str(random.randrange(users)), "user" if i % 2 else "assistant", "hello " * 8, now + i * 1e-6)
+            for i in range(start, min(start + batch, rows))
+        ))
+    conn.execute("COMMIT")
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--rows", type=int, default=1_000_000)
+    p.add_argument("--users", type=int, default=50_000)
+    p.add_argument("--ops", type=int, default=20_000)
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "bench.db"))
+        t0 = time.perf_counter()
+        seed(db, args.rows, args.users)
+        print(f"seeded {args.rows} rows in {time.perf_counter() - t0:.1f}s")
+
+        uids = [str(random.randrange(args.users)) for _ in range(args.ops)]
+        t0 = time.perf_counter()
+        for uid in uids:
+            db.add_memory(uid, "user", "kya haal hai?")
+            db.get_memory(uid, limit=6)
+        dt = time.perf_counter() - t0
+        print(f"add_memory+get_memory: {args.ops / dt:,.0f} ops/s ({dt / args.ops * 1e6:.1f} us/op)")
+
+        plan = db._conn().execute(
+            "EXPLAIN QUERY PLAN SELECT role, content FROM memory WHERE user_id = ? ORDER BY ts DESC, id DESC LIMIT 6",
+            ("1",)).fetchall()
+        print("get_memory plan:", "; ".join(r[-1] for r in plan))
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Benchmark intent routing against the old image_keywords substring scan.
+
+    python bench/bench_intents.py [--corpus bench/intent_corpus.tsv] [--repeat 2000]
+
+The corpus is ``label<TAB>message`` per line (# comments allowed); a file of
+bare messages (e.g. an exported group chat) is timed but not scored.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.intents import IntentMatcher, IMAGE, CHAT
+
+# the check chat() used before utils.intents, rebuilt per message as it was
+def old_route(text):
+    lower = text.lower()
+    image_keywords = ["photo", "pic", "image", "picture", "meme", "photo of", "pic of", "picture of"]
+    return IMAGE if any(k in lower for k in image_keywords) else CHAT
+
+
+def load(path):
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line.strip() or line.startswith("#"):
+                continue
+            label, sep, text = line.partition("\t")
+            rows.append((label, text) if sep else (None, line))
+    return rows
+
+
+def per_message(route, texts, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for t in texts:
+            route(t)
+    return (time.perf_counter() - t0) / (repeat * len(texts)) * 1e9
+
+
+def score(route, rows):
+    labelled = [(label, text) for label, text in rows if label]
+    wrong = [(label, text) for label, text in labelled if route(text) != label]
+    return len(labelled), wrong
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--corpus", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "intent_corpus.tsv"))
+    p.add_argument("--repeat", type=int, default=2000)
+    args = p.parse_args()
+
+    rows = load(args.corpus)
+    texts = [t for _, t in rows]
+    matcher = IntentMatcher()
+    print(f"{len(texts)} messages x {args.repeat}")
+    for name, route in (("substring scan", old_route), ("IntentMatcher", matcher.route)):
+        ns = per_message(route, texts, args.repeat)
+        n, wrong = score(route, rows)
+        print(f"{name:15s} {ns:8.0f} ns/message   {n - len(wrong)}/{n} correct")
+        for label, text in wrong:
+            print(f"    expected {label:6s} got {route(text):6s} {text}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Benchmark per-observation overhead of utils.metrics.
+
+    python bench/bench_metrics.py [--n 1000000] [--threads 8]
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import metrics
+
+
+def per_call(fn, n):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--n", type=int, default=1_000_000)
+    p.add_argument("--threads", type=int, default=8)
+    args = p.parse_args()
+
+    reg = metrics.Registry()
+    hist = reg.histogram("bench_seconds", "bench", ["method"])
+    errors = reg.counter("bench_errors_total", "bench", ["method"])
+    child = hist.labels("get_memory")
+
+    def noop():
+        pass
+
+    wrapped = metrics.timed(hist, errors)(noop)
+    base = per_call(noop, args.n)
+    print(f"child.observe()          : {per_call(lambda: child.observe(0.0123), args.n) - base:.2f} us")
+    print(f"labels(...).observe()    : {per_call(lambda: hist.labels('get_memory').observe(0.0123), args.n) - base:.2f} us")
+    print(f"counter.labels(...).inc(): {per_call(lambda: errors.labels('x').inc(), args.n) - base:.2f} us")
+    print(f"@timed call overhead     : {per_call(wrapped, args.n) - base:.2f} us")
+
+    # contention: every thread hits the same child
+    n = args.n // args.threads
+    ts = [threading.Thread(target=per_call, args=(wrapped, n)) for _ in range(args.threads)]
+    t0 = time.perf_counter()
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    took = time.perf_counter() - t0
+    print(f"{args.threads} threads, one child: {took / (n * args.threads) * 1e6:.2f} us/observation (wall)")
+
+    t0 = time.perf_counter()
+    text = reg.render()
+    print(f"render: {len(text.splitlines())} lines in {(time.perf_counter() - t0) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark update routing alone: telebot's filter chain vs utils.router.Router.
+
+    python bench/bench_router.py [--n 200000]
+
+Both get the same handler set as main.py (commands, the broadcast-wizard
+guards, the catch-all chat/callback handlers); handlers only count calls,
+so the numbers are pure dispatch cost.
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telebot import TeleBot, types
+
+from utils.router import Router
+
+COMMANDS = ["start", "panel", "addadmin", "removeadmin", "listadmins", "poolstats", "imagestats",
+            "sendstats", "perf", "broadcast_menu", "cancel", "grabsticker"]
+PANEL_DATA = ["list_groups", "new_schedule", "instant_broadcast", "cancel_schedules", "help",
+              "stats", "manage_admins", "sticker_grabber", "broadcast_manager"]
+SESSIONS = {42}
+
+
+def register(calls, message_handler, callback_handler):
+    """Register handlers in main.py's order; ``*_handler(kw, telebot_kw)`` pick the flavour."""
+    def handler(name):
+        def fn(_):
+            calls[name] += 1
+        return fn
+
+    in_wizard = lambda m: m.chat.type == "private" and m.from_user and m.from_user.id in SESSIONS
+    for c in COMMANDS[:5]:
+        message_handler(dict(commands=[c]))(handler(c))
+    callback_handler(dict(data=PANEL_DATA, default=True), dict(func=lambda c: True))(handler("cb"))
+    for c in COMMANDS[5:11]:
+        message_handler(dict(commands=[c]))(handler(c))
+    callback_handler(dict(prefix="bc_"), dict(func=lambda c: c.data and c.data.startswith("bc_")))(handler("broadcast_cb"))
+    message_handler(dict(func=in_wizard, content_types=["photo", "video"]))(handler("wizard_media"))
+    message_handler(dict(func=in_wizard, content_types=["text"]))(handler("wizard_text"))
+    callback_handler(dict(prefix=["bc_confirm_", "bc_cancel:"]),
+                     dict(func=lambda c: c.data and (c.data.startswith("bc_confirm_") or c.data.startswith("bc_cancel:"))))(handler("bc_confirm"))
+    message_handler(dict(commands=["grabsticker"]))(handler("grabsticker"))
+    message_handler(dict(func=lambda m: True, content_types=["text"]))(handler("chat"))
+    for ct in ("sticker", "animation", "new_chat_members", "left_chat_member"):
+        message_handler(dict(content_types=[ct]))(handler(ct))
+    message_handler(dict(commands=["schedule"]))(handler("schedule"))
+
+
+def make_updates(n):
+    rnd = random.Random(1)
+    out = []
+    for i in range(n):
+        r = rnd.random()
+        chat = {"id": -1001, "type": "supergroup", "title": "g"}
+        msg = {"message_id": i, "date": 0, "chat": chat, "from": {"id": 7 + i % 50, "is_bot": False, "first_name": "u"}}
+        if r < 0.70:
+            msg["text"] = "kya haal hai sab"
+        elif r < 0.80:
+            msg["sticker"] = {"file_id": "s", "file_unique_id": "s", "type": "regular", "width": 1, "height": 1,
+                              "is_animated": False, "is_video": False, "emoji": "😂"}
+        elif r < 0.88:
+            msg["text"] = "/" + rnd.choice(COMMANDS + ["schedule"])
+            msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(msg["text"])}]
+        elif r < 0.92:
+            msg["chat"] = {"id": 42, "type": "private", "first_name": "admin"}
+            msg["from"]["id"] = 42
+            msg["text"] = "/skip"
+        else:
+            data = rnd.choice(PANEL_DATA + ["bc_text", "bc_media", "bc_confirm_text:42", "bc_cancel:42"])
+            out.append(types.Update.de_json({"update_id": i, "callback_query": {
+                "id": str(i), "chat_instance": "c", "data": data, "from": msg["from"], "message": msg}}))
+            continue
+        out.append(types.Update.de_json({"update_id": i, "message": msg}))
+    return out
+
+
+def run(process, updates, batch=100):
+    t0 = time.perf_counter()
+    for i in range(0, len(updates), batch):
+        process(updates[i:i + batch])
+    return len(updates) / (time.perf_counter() - t0)
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--n", type=int, default=200_000)
+    args = p.parse_args()
+    updates = make_updates(args.n)
+
+    bot_calls = Counter()
+    bot = TeleBot("123:BENCH", threaded=False)
+    register(bot_calls, lambda kw: bot.message_handler(**kw),
+             lambda kw, tb: bot.callback_query_handler(**tb))
+    router_calls = Counter()
+    router = Router()
+    register(router_calls, lambda kw: router.message_handler(**kw),
+             lambda kw, tb: router.callback_query_handler(**kw))
+
+    print(f"{args.n} updates")
+    print(f"telebot filter chain: {run(bot.process_new_updates, updates):>10,.0f} updates/s")
+    print(f"Router              : {run(router.process_new_updates, updates):>10,.0f} updates/s")
+    for name in ("schedule", "broadcast_cb", "bc_confirm", "wizard_text", "chat", "cb"):
+        print(f"  {name:13s} telebot={bot_calls[name]:<7d} router={router_calls[name]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Benchmark SchedulerManager.restore_jobs_from_db() with 10k stored schedules.
+
+First run migrates every row into the jobstore; the second run is a normal
+restart where the jobstore already holds the jobs.
+
+    python bench/bench_scheduler_restore.py [--jobs 10000]
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.db import Database
+from utils.scheduler import SchedulerManager
+
+RECURS = ["daily", "weekly", "monthly", "none"]
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--jobs", type=int, default=10_000)
+    args = p.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "memory.db"))
+        for i in range(args.jobs):
+            db.add_schedule(f"job{i}", f"hello {i}", None, f"2031-01-{1 + i % 28:02d} 10:{i % 60:02d}", RECURS[i % 4])
+        jobstore = os.path.join(tmp, "jobs.sqlite")
+        for label in ("first restore (migration)", "restart restore"):
+            sm = SchedulerManager(None, db, "Asia/Kolkata", jobstore_path=jobstore)
+            t0 = time.perf_counter()
+            sm.restore_jobs_from_db()
+            print(f"{label}: {time.perf_counter() - t0:.3f}s")
+            sm.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Local stand-ins for the Telegram Bot API, OpenRouter and HuggingFace
+inference, for offline load tests (see bench/loadtest.py).
+
+Latency specs are strings: "const:0.05", "uniform:0.02:0.2" or
+"lognorm:<median>:<sigma>". ``p429`` is the chance a call answers 429.
+
+    python bench/fake_services.py --tg-port 8081 --ai-port 8082
+"""
+
+import json
+import math
+import time
+import random
+import struct
+import zlib
+import argparse
+import threading
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BOT_USER = {"id": 999000, "is_bot": True, "first_name": "Butki", "username": "butki_bot"}
+
+
+def parse_latency(spec):
+    """Return a zero-arg callable giving one latency sample in seconds."""
+    kind, _, rest = (spec or "const:0").partition(":")
+    args = [float(x) for x in rest.split(":") if x]
+    if kind == "const":
+        return lambda: args[0]
+    if kind == "uniform":
+        return lambda: random.uniform(args[0], args[1])
+    if kind == "lognorm":
+        mu = math.log(args[0])
+        return lambda: random.lognormvariate(mu, args[1])
+    raise ValueError(f"bad latency spec {spec!r}")
+
+
+def _png():
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(b"\x00\xff\x80\x80")) + chunk(b"IEND", b""))
+
+
+PNG_1PX = _png()
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _params(self):
+        parts = urlsplit(self.path)
+        params = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        ctype = self.headers.get("Content-Type", "")
+        if body and ctype.startswith("application/x-www-form-urlencoded"):
+            params.update({k: v[-1] for k, v in parse_qs(body.decode("utf-8", "replace")).items()})
+        elif body and ctype.startswith("application/json"):
+            params.update(json.loads(body))
+        return parts.path, params
+
+    def _reply(self, status, payload, ctype="application/json"):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeTelegram:
+    """Bot API subset: getMe, getUpdates (long poll), send*/edit*, chat actions.
+
+    Updates are injected with ``push_update``; every outgoing call is kept
+    in ``sent`` as (monotonic_ts, method, params) for the load generator.
+    """
+
+    SEND_METHODS = {"sendMessage", "sendPhoto", "sendSticker", "sendVideo", "sendDocument",
+                    "sendAnimation", "editMessageText"}
+
+    def __init__(self, port=0, latency="const:0.02", p429=0.0, retry_after=1):
+        self.latency = parse_latency(latency)
+        self.p429 = p429
+        self.retry_after = retry_after
+        self.updates = deque()
+        self.next_update_id = 1
+        self.next_message_id = 10_000_000
+        self.sent = []
+        self.calls = {}
+        self.throttled = 0
+        self.on_send = None   # optional callback(ts, method, params)
+        self._cond = threading.Condition()
+        fake = self
+
+        class Handler(_Handler):
+            def do_GET(self):
+                fake._handle(self)
+
+            do_POST = do_GET
+
+        self.server = _Server(("127.0.0.1", port), Handler)
+        self.port = self.server.server_address[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        threading.Thread(target=self.server.serve_forever, name="fake-telegram", daemon=True).start()
+
+    def push_update(self, kind, obj):
+        with self._cond:
+            self.updates.append({"update_id": self.next_update_id, kind: obj})
+            self.next_update_id += 1
+            self._cond.notify_all()
+
+    def new_message_id(self):
+        with self._cond:
+            self.next_message_id += 1
+            return self.next_message_id
+
+    def _handle(self, h):
+        path, params = h._params()
+        method = path.rsplit("/", 1)[-1]
+        with self._cond:
+            self.calls[method] = self.calls.get(method, 0) + 1
+        if method == "getUpdates":
+            return h._reply(200, {"ok": True, "result": self._get_updates(params)})
+        if method == "getMe":
+            return h._reply(200, {"ok": True, "result": BOT_USER})
+        time.sleep(self.latency())
+        if method in self.SEND_METHODS or method == "sendChatAction":
+            if self.p429 and random.random() < self.p429:
+                with self._cond:
+                    self.throttled += 1
+                return h._reply(429, {"ok": False, "error_code": 429,
+                                      "description": f"Too Many Requests: retry after {self.retry_after}",
+                                      "parameters": {"retry_after": self.retry_after}})
+        if method in self.SEND_METHODS:
+            ts = time.monotonic()
+            with self._cond:
+                self.sent.append((ts, method, params))
+            if self.on_send:
+                self.on_send(ts, method, params)
+            return h._reply(200, {"ok": True, "result": self._message(method, params)})
+        return h._reply(200, {"ok": True, "result": True})
+
+    def _get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        deadline = time.monotonic() + float(params.get("timeout") or 0)
+        limit = int(params.get("limit") or 100)
+        with self._cond:
+            while True:
+                while self.updates and self.updates[0]["update_id"] < offset:
+                    self.updates.popleft()
+                if self.updates:
+                    return [u for _, u in zip(range(limit), self.updates)]
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return []
+                self._cond.wait(left)
+
+    def _message(self, method, params):
+        chat_id = int(params.get("chat_id") or 0)
+        msg = {
+            "message_id": int(params.get("message_id") or 0) or self.new_message_id(),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+            "from": BOT_USER,
+        }
+        if method == "sendPhoto":
+            fid = f"photo{msg['message_id']}"
+            msg["photo"] = [{"file_id": fid, "file_unique_id": fid, "width": 1, "height": 1}]
+        elif method == "sendSticker":
+            msg["sticker"] = {"file_id": str(params.get("sticker")), "file_unique_id": "s", "type": "regular",
+                              "width": 512, "height": 512, "is_animated": False, "is_video": False}
+        else:
+            msg["text"] = params.get("text") or params.get("caption") or ""
+        return msg
+
+    def close(self):
+        self.server.shutdown()
+
+
+class FakeAI:
+    """OpenRouter ``/api/v1/chat/completions`` (plain and SSE) and HF ``/models/<name>``."""
+
+    def __init__(self, port=0, chat_latency="lognorm:0.8:0.4", image_latency="lognorm:4:0.3",
+                 p429=0.0, reply="Haan ji 💖 main yahin hoon, batao kya chal raha hai? 😄✨"):
+        self.chat_latency = parse_latency(chat_latency)
+        self.image_latency = parse_latency(image_latency)
+        self.p429 = p429
+        self.reply = reply
+        self.calls = {"chat": 0, "image": 0, "429": 0}
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(_Handler):
+            def do_POST(self):
+                fake._handle(self)
+
+        self.server = _Server(("127.0.0.1", port), Handler)
+        self.port = self.server.server_address[1]
+        self.openrouter_url = f"http://127.0.0.1:{self.port}/api/v1"
+        self.hf_url = f"http://127.0.0.1:{self.port}/models"
+        threading.Thread(target=self.server.serve_forever, name="fake-ai", daemon=True).start()
+
+    def _handle(self, h):
+        path, params = h._params()
+        kind = "chat" if path.endswith("/chat/completions") else "image"
+        with self._lock:
+            self.calls[kind] += 1
+        if self.p429 and random.random() < self.p429:
+            with self._lock:
+                self.calls["429"] += 1
+            return h._reply(429, {"error": {"message": "rate limited"}})
+        if kind == "image":
+            time.sleep(self.image_latency())
+            return h._reply(200, PNG_1PX, ctype="image/png")
+        delay = self.chat_latency()
+        if not params.get("stream"):
+            time.sleep(delay)
+            return h._reply(200, {
+                "choices": [{"message": {"role": "assistant", "content": self.reply}}],
+                "usage": {"prompt_tokens": 120, "completion_tokens": 30},
+            })
+        # SSE: split the reply into a few chunks spread over the latency
+        words = self.reply.split(" ")
+        h.send_response(200)
+        h.send_header("Content-Type", "text/event-stream")
+        h.send_header("Transfer-Encoding", "chunked")
+        h.end_headers()
+        for i, w in enumerate(words):
+            time.sleep(delay / len(words))
+            event = {"choices": [{"delta": {"content": (" " if i else "") + w}}]}
+            data = f"data: {json.dumps(event)}\n\n".encode("utf-8")
+            h.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        done = b"data: [DONE]\n\n"
+        h.wfile.write(b"%x\r\n%s\r\n0\r\n\r\n" % (len(done), done))
+
+    def close(self):
+        self.server.shutdown()
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--tg-port", type=int, default=8081)
+    p.add_argument("--ai-port", type=int, default=8082)
+    p.add_argument("--tg-latency", default="const:0.02")
+    p.add_argument("--chat-latency", default="lognorm:0.8:0.4")
+    p.add_argument("--image-latency", default="lognorm:4:0.3")
+    p.add_argument("--tg-429", type=float, default=0.0)
+    p.add_argument("--ai-429", type=float, default=0.0)
+    args = p.parse_args()
+    tg = FakeTelegram(args.tg_port, args.tg_latency, args.tg_429)
+    ai = FakeAI(args.ai_port, args.chat_latency, args.image_latency, args.ai_429)
+    print(f"TELEGRAM_API_URL={tg.url}")
+    print(f"OPENROUTER_BASE_URL={ai.openrouter_url}")
+    print(f"HF_BASE_URL={ai.hf_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+Offline end-to-end load test of main.py.
+
+Starts the fakes from bench/fake_services.py, runs main.py against them in
+a subprocess (own temp data dir), simulates ``--groups`` x ``--users``
+members sending text, stickers and image requests, then fires one
+broadcast to every group. Reports reply latency percentiles per kind,
+throughput, broadcast completion time and main.py's peak RSS (VmHWM).
+
+    python bench/loadtest.py [--groups 50] [--users 5] [--rate 0.02] [--duration 60]
+                             [--tg-429 0.01] [--env ASYNC_MODE=1] [--json out.json]
+
+AI rate limits are opened up so every message gets a reply; pass
+--keep-limits to measure with the configured ones. ``--env BOT_WORKERS=4``
+runs main.py sharded over 4 handler processes (RSS is the dispatcher's only).
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+import subprocess
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_services import FakeTelegram, FakeAI
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OWNER_ID = 1
+STICKER_EMOJIS = ["😂", "❤️", "🔥", "😭", "👍"]
+TEXTS = ["kya haal hai sab?", "aaj ka plan kya hai", "koi movie suggest karo", "bore ho raha hu yaar",
+         "good morning everyone", "chai ya coffee?", "kal match dekha?", "mujhe ek joke sunao"]
+IMAGE_TEXTS = ["ek cute cat ki photo bhejo", "sunset ki image chahiye", "ek funny meme banao"]
+
+
+def pct(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def read_rss(pid):
+    out = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(("VmHWM:", "VmRSS:")):
+                    key, value = line.split(":", 1)
+                    out[key] = int(value.split()[0]) / 1024.0   # kB -> MB
+    except OSError:
+        pass
+    return out
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.tg = FakeTelegram(latency=args.tg_latency, p429=args.tg_429)
+        self.ai = FakeAI(chat_latency=args.chat_latency, image_latency=args.image_latency, p429=args.ai_429)
+        self.pending = {}      # message_id -> (kind, injected_at)
+        self.latency = {"text": [], "sticker": [], "image": []}
+        self.injected = {"text": 0, "sticker": 0, "image": 0}
+        self.broadcast = {"started": None, "finished": None, "delivered": 0}
+        self._lock = threading.Lock()
+        self.tg.on_send = self._on_send
+
+    # ========== replies seen by the fake Telegram ==========
+    def _on_send(self, ts, method, params):
+        text = params.get("text") or params.get("caption") or ""
+        if text == self.args.broadcast_text:
+            with self._lock:
+                self.broadcast["delivered"] += 1
+            return
+        if str(params.get("chat_id")) == str(OWNER_ID) and "finished" in text and self.broadcast["started"]:
+            with self._lock:
+                self.broadcast["finished"] = self.broadcast["finished"] or ts
+            return
+        target = params.get("reply_to_message_id")
+        if not target and params.get("reply_parameters"):
+            target = json.loads(params["reply_parameters"]).get("message_id")
+        if not target:
+            return
+        with self._lock:
+            entry = self.pending.get(int(target))
+            if entry is None:
+                return
+            kind, injected_at = entry
+            # image requests are answered by the photo, not by the "working on it" ack
+            if kind == "image" and method != "sendPhoto":
+                return
+            del self.pending[int(target)]
+            self.latency[kind].append(ts - injected_at)
+
+    # ========== load generation ==========
+    def _message(self, chat_id, user_id, **fields):
+        msg = {
+            "message_id": self.tg.new_message_id(),
+            "date": int(time.time()),
+            "chat": ({"id": chat_id, "type": "private", "first_name": "Owner"} if chat_id > 0
+                     else {"id": chat_id, "type": "supergroup", "title": f"Group {-chat_id}"}),
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+        }
+        msg.update(fields)
+        return msg
+
+    def _inject(self, kind, chat_id, user_id):
+        if kind == "sticker":
+            emoji = random.choice(STICKER_EMOJIS)
+            msg = self._message(chat_id, user_id, sticker={
+                "file_id": f"sticker-{emoji}", "file_unique_id": "u", "type": "regular", "width": 512,
+                "height": 512, "is_animated": False, "is_video": False, "emoji": emoji})
+        else:
+            msg = self._message(chat_id, user_id, text=random.choice(IMAGE_TEXTS if kind == "image" else TEXTS))
+        with self._lock:
+            self.pending[msg["message_id"]] = (kind, time.monotonic())
+            self.injected[kind] += 1
+        self.tg.push_update("message", msg)
+
+    def generate(self):
+        a = self.args
+        kinds, weights = zip(*[(k, float(w)) for k, w in (x.split("=") for x in a.mix.split(","))])
+        total_rate = a.groups * a.users * a.rate
+        deadline = time.monotonic() + a.duration
+        next_at = time.monotonic()
+        while next_at < deadline:
+            time.sleep(max(0.0, next_at - time.monotonic()))
+            g = random.randrange(a.groups)
+            u = random.randrange(a.users)
+            self._inject(random.choices(kinds, weights)[0], -1_000_000 - g, 100_000 + g * 1000 + u)
+            next_at += random.expovariate(total_rate)
+
+    def drain(self, quiet=3.0, limit=60.0):
+        """Wait until no reply has arrived for ``quiet`` seconds (or ``limit``)."""
+        end = time.monotonic() + limit
+        last = len(self.tg.sent)
+        last_change = time.monotonic()
+        while time.monotonic() < end:
+            time.sleep(0.2)
+            n = len(self.tg.sent)
+            if n != last:
+                last, last_change = n, time.monotonic()
+            elif time.monotonic() - last_change >= quiet:
+                return
+
+    def run_broadcast(self, limit):
+        # a one-shot schedule for the current minute fires at once (misfire grace)
+        now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M")
+        self.broadcast["started"] = time.monotonic()
+        self.tg.push_update("message", self._message(
+            OWNER_ID, OWNER_ID, text=f"/schedule {now} none {self.args.broadcast_text}"))
+        end = time.monotonic() + limit
+        while time.monotonic() < end and not self.broadcast["finished"]:
+            time.sleep(0.1)
+
+    # ========== driver ==========
+    def child_env(self):
+        env = dict(os.environ)
+        env.update({
+            "TELEGRAM_TOKEN": "123456:LOADTEST",
+            "TELEGRAM_API_URL": self.tg.url,
+            "OPENAI_API_KEY": "sk-loadtest",
+            "HUGGINGFACE_API_KEY": "hf-loadtest",
+            "OPENROUTER_BASE_URL": self.ai.openrouter_url,
+            "HF_BASE_URL": self.ai.hf_url,
+            "OWNER_ID": str(OWNER_ID),
+            "DEFAULT_TIMEZONE": "UTC",
+            "PYTHONUNBUFFERED": "1",
+        })
+        if not self.args.keep_limits:
+            for name in ("USER_BURST", "CHAT_RATE", "CHAT_BURST", "GLOBAL_AI_RATE", "GLOBAL_AI_BURST"):
+                env[name] = "1000000"
+        for kv in self.args.env:
+            k, _, v = kv.partition("=")
+            env[k] = v
+        return env
+
+    def run(self):
+        a = self.args
+        workdir = tempfile.mkdtemp(prefix="bot-loadtest-")
+        log_path = os.path.join(workdir, "main.log")
+        with open(log_path, "w") as log:
+            t0 = time.monotonic()
+            proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "main.py")], cwd=workdir,
+                                    env=self.child_env(), stdout=log, stderr=subprocess.STDOUT)
+            try:
+                while self.tg.calls.get("getUpdates", 0) == 0:
+                    if proc.poll() is not None or time.monotonic() - t0 > 120:
+                        raise SystemExit(f"main.py did not start polling, see {log_path}")
+                    time.sleep(0.05)
+                startup = time.monotonic() - t0
+                time.sleep(a.warmup)
+
+                load_started = time.monotonic()
+                self.generate()
+                self.drain()
+                load_took = time.monotonic() - load_started
+                if a.broadcast:
+                    self.run_broadcast(a.broadcast_timeout)
+                rss = read_rss(proc.pid)
+            finally:
+                proc.terminate()
+                try:
+                    proc.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+        return self.report(startup, load_took, rss, log_path)
+
+    def report(self, startup, load_took, rss, log_path):
+        a = self.args
+        kinds = {}
+        for kind, lat in self.latency.items():
+            kinds[kind] = {
+                "sent": self.injected[kind], "replied": len(lat),
+                "p50": pct(lat, 0.5), "p90": pct(lat, 0.9), "p99": pct(lat, 0.99), "max": max(lat) if lat else None,
+            }
+        replies = sum(len(v) for v in self.latency.values())
+        b = self.broadcast
+        return {
+            "config": {"groups": a.groups, "users": a.users, "rate": a.rate, "duration": a.duration, "mix": a.mix,
+                       "tg_latency": a.tg_latency, "chat_latency": a.chat_latency, "tg_429": a.tg_429,
+                       "ai_429": a.ai_429, "env": a.env, "keep_limits": a.keep_limits},
+            "startup_s": startup,
+            "load_s": load_took,
+            "replies_per_s": replies / load_took if load_took else 0.0,
+            "kinds": kinds,
+            "telegram_calls": dict(self.tg.calls),
+            "telegram_429": self.tg.throttled,
+            "ai_calls": dict(self.ai.calls),
+            "broadcast": {
+                "groups": a.groups, "delivered": b["delivered"],
+                "completion_s": (b["finished"] - b["started"]) if b["finished"] else None,
+            },
+            "peak_rss_mb": rss.get("VmHWM"),
+            "rss_mb": rss.get("VmRSS"),
+            "log": log_path,
+        }
+
+
+def fmt(v):
+    return "  n/a " if v is None else f"{v * 1000:6.0f}"
+
+
+def print_report(r):
+    print(f"startup to first getUpdates: {r['startup_s']:.2f}s")
+    print(f"load window: {r['load_s']:.1f}s, {r['replies_per_s']:.1f} replies/s")
+    print("kind      sent  replied   p50ms   p90ms   p99ms   maxms")
+    for kind, k in r["kinds"].items():
+        print(f"{kind:<8} {k['sent']:5d}  {k['replied']:7d}  {fmt(k['p50'])}  {fmt(k['p90'])}  "
+              f"{fmt(k['p99'])}  {fmt(k['max'])}")
+    b = r["broadcast"]
+    done = f"{b['completion_s']:.2f}s" if b["completion_s"] is not None else "did not finish"
+    print(f"broadcast: {b['delivered']}/{b['groups']} groups, {done}")
+    print(f"telegram calls: {r['telegram_calls']} (429 injected: {r['telegram_429']})")
+    print(f"ai calls: {r['ai_calls']}")
+    if r["peak_rss_mb"] is not None:
+        print(f"main.py peak RSS: {r['peak_rss_mb']:.1f} MB (current {r['rss_mb']:.1f} MB)")
+    print(f"main.py log: {r['log']}")
+
+
+def main():
+    p = argparse.ArgumentParser()
+    p.add_argument("--groups", type=int, default=50)
+    p.add_argument("--users", type=int, default=5, help="members per group")
+    p.add_argument("--rate", type=float, default=0.02, help="messages per member per second")
+    p.add_argument("--duration", type=float, default=60)
+    p.add_argument("--warmup", type=float, default=2)
+    p.add_argument("--mix", default="text=0.8,sticker=0.1,image=0.1")
+    p.add_argument("--tg-latency", default="lognorm:0.03:0.3")
+    p.add_argument("--chat-latency", default="lognorm:0.8:0.4")
+    p.add_argument("--image-latency", default="lognorm:4:0.3")
+    p.add_argument("--tg-429", type=float, default=0.0, help="chance a send answers 429")
+    p.add_argument("--ai-429", type=float, default=0.0)
+    p.add_argument("--no-broadcast", dest="broadcast", action="store_false")
+    p.add_argument("--broadcast-text", default="📢 Loadtest broadcast")
+    p.add_argument("--broadcast-timeout", type=float, default=120)
+    p.add_argument("--keep-limits", action="store_true", help="keep main.py's AI rate limits")
+    p.add_argument("--env", action="append", default=[], help="extra KEY=VALUE for main.py")
+    p.add_argument("--json", help="also write the report here (for regression tracking)")
+    args = p.parse_args()
+
+    report = LoadTest(args).run()
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,16 +6,45 @@ Ultra-Pro Telegram AI Bot v3
 """
 
 import os
+import sys
 import json
+import hashlib
+import argparse
 import logging
 import time
 import random
+import atexit
+import signal
+import asyncio
 from typing import Optional
-from telebot import TeleBot, types
-from utils.ai_helpers import AIHelper
+from utils.startup import Startup, Lazy, retry_in_background
+# every phase from here to the first getUpdates is timed for --profile-startup
+boot = Startup()
+from telebot import TeleBot, types, apihelper
+from utils.ai_helpers import (AIHelper, AsyncAIHelper, DEFAULT_CHAT_MODEL, DEFAULT_IMAGE_MODEL, CHAT_ERROR_REPLY,
+                              OPENROUTER_BASE_URL, HF_BASE_URL)
+from utils.async_runner import AsyncRunner
 from utils.db import Database
-from utils.scheduler import SchedulerManager
+from utils.memory_cache import MemoryCache
+from utils.compaction import Compactor
+from utils.broadcast import BroadcastEngine
+from utils.outbound import OutboundDispatcher
+from utils import metrics
+from utils.image_queue import ImageJobQueue
+from utils.image_cache import ImageCache, CachedImageGenerator
+from utils.ratelimit import RateLimiter
+from utils.streaming import stream_reply, TTFT_SECONDS
+from utils.coalesce import ChatCoalescer
+from utils.prompt import PromptBuilder
 from utils.panel import owner_panel_markup
+from utils.webhook import WebhookServer
+from utils.reply_bank import ReplyBank
+from utils.intents import IntentMatcher, IMAGE, IGNORE
+from utils.router import Router
+from utils.priority import PriorityDispatcher, ADMIN, DIRECT, AMBIENT
+from utils.shared_state import SharedStore, SharedDict, SharedSet, SharedRateLimiter
+from utils.sharding import ShardRouter, SHARD_ENV
+boot.mark("imports")
 
 # --- Helper: mask secrets for logs ---
 def mask_secret(s: Optional[str], visible: int = 8):
@@ -47,6 +76,47 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY") or CONFIG.get("OPENAI_API_KEY", "")
 HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY") or CONFIG.get("HUGGINGFACE_API_KEY", "")
 OWNER_ID = int(os.getenv("OWNER_ID", str(CONFIG.get("OWNER_ID", "0"))))
 DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE") or CONFIG.get("DEFAULT_TIMEZONE", "Asia/Kolkata")
+# telebot handler threads; the AI HTTP pools are sized to match
+BOT_NUM_THREADS = int(os.getenv("BOT_NUM_THREADS") or CONFIG.get("BOT_NUM_THREADS", 8))
+# model fallback chains (first = preferred); env takes a comma-separated list
+def _cfg_list(name, default):
+    raw = os.getenv(name)
+    if raw:
+        return [x.strip() for x in raw.split(",") if x.strip()]
+    return list(CONFIG.get(name) or default)
+
+CHAT_MODELS = _cfg_list("CHAT_MODELS", [DEFAULT_CHAT_MODEL])
+IMAGE_MODELS = _cfg_list("IMAGE_MODELS", [DEFAULT_IMAGE_MODEL])
+# upstream endpoints; override for a local Bot API server or the bench/ fakes
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL") or CONFIG.get("TELEGRAM_API_URL", "")
+OPENROUTER_URL = os.getenv("OPENROUTER_BASE_URL") or CONFIG.get("OPENROUTER_BASE_URL", OPENROUTER_BASE_URL)
+HF_URL = os.getenv("HF_BASE_URL") or CONFIG.get("HF_BASE_URL", HF_BASE_URL)
+# update ingestion: "polling" (getUpdates loop) or "webhook" (built-in HTTP server)
+BOT_MODE = (os.getenv("BOT_MODE") or CONFIG.get("BOT_MODE", "polling")).lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL") or CONFIG.get("WEBHOOK_URL", "")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH") or CONFIG.get("WEBHOOK_PATH", "/webhook")
+# Telegram echoes this in a header on every update; all instances must share it
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or CONFIG.get("WEBHOOK_SECRET", "")
+PORT = int(os.getenv("PORT") or CONFIG.get("PORT", 8443))
+# CLI flags are read here (not only under __main__) because shard workers re-import this module
+_cli = argparse.ArgumentParser(add_help=False)
+_cli.add_argument("--mode", choices=["polling", "webhook"])
+_cli.add_argument("--workers", type=int)
+CLI_ARGS, _ = _cli.parse_known_args(sys.argv[1:])
+BOT_MODE = CLI_ARGS.mode or BOT_MODE
+# >1: one dispatcher process routes updates to N worker processes by chat_id
+BOT_WORKERS = max(1, CLI_ARGS.workers or int(os.getenv("BOT_WORKERS") or CONFIG.get("BOT_WORKERS", 1)))
+SHARDED = BOT_WORKERS > 1
+SHARD_INDEX = os.getenv(SHARD_ENV)
+IS_SHARD_WORKER = SHARD_INDEX is not None
+# opt-in asyncio mode: AI calls run on one event loop instead of holding handler threads
+ASYNC_MODE = str(os.getenv("ASYNC_MODE") or CONFIG.get("ASYNC_MODE", "")).lower() in ("1", "true", "yes")
+# opt-in streamed replies: first chunk posted early, then edited as the LLM writes
+STREAM_REPLIES = str(os.getenv("STREAM_REPLIES") or CONFIG.get("STREAM_REPLIES", "")).lower() in ("1", "true", "yes")
+# opt-in: batch ambient group messages into one AI reply per window
+COALESCE_GROUPS = str(os.getenv("COALESCE_GROUPS") or CONFIG.get("COALESCE_GROUPS", "")).lower() in ("1", "true", "yes")
+
+boot.mark("config")
 
 # --- Debug print ---
 print("DEBUG >> TELEGRAM_TOKEN starts with:", mask_secret(TELEGRAM_TOKEN))
@@ -60,28 +130,159 @@ if not TELEGRAM_TOKEN or ":" not in TELEGRAM_TOKEN:
     raise ValueError("❌ TELEGRAM_TOKEN invalid or missing")
 
 # --- Initialize bot ---
-bot = TeleBot(TELEGRAM_TOKEN, parse_mode="HTML")
-
-# --- Initialize AI helper (OpenRouter + HuggingFace) ---
-from utils.ai_helpers import AIHelper
-ai = AIHelper(openai_api_key=OPENAI_API_KEY, hf_api_key=HUGGINGFACE_API_KEY)
+if TELEGRAM_API_URL:
+    # "http://host:port" or a full "{0}=token, {1}=method" template
+    base = TELEGRAM_API_URL.rstrip("/")
+    apihelper.API_URL = base if "{0}" in base else base + "/bot{0}/{1}"
+    apihelper.FILE_URL = base.split("/bot{0}")[0] + "/file/bot{0}/{1}"
+# the bot object only talks to the API: handlers are registered on `router` and
+# run on PriorityDispatcher's pools (installed below), not telebot's own
+bot = TeleBot(TELEGRAM_TOKEN, parse_mode="HTML", threaded=False)
+router = Router()
+boot.mark("bot")
 
 # --- Logging ---
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# --- Outbound: every send goes through one per-chat FIFO, rate-limited, 429-aware queue ---
+# when sharded, the dispatcher and every worker each get an equal slice of the bot-wide budget
+outbound = OutboundDispatcher(
+    bot,
+    rate=float(os.getenv("OUTBOUND_RATE") or CONFIG.get("OUTBOUND_RATE", 25)) / (BOT_WORKERS + 1 if SHARDED else 1),
+    workers=int(os.getenv("OUTBOUND_WORKERS") or CONFIG.get("OUTBOUND_WORKERS", 4)),
+)
+
 # --- Core helpers ---
 db = Database(os.path.join(DATA_DIR, "memory.db"))
+# state every shard process must agree on (sessions, admins, limits, bot identity)
+shared = SharedStore(os.path.join(DATA_DIR, "shared.db"))
+# conversation memory: served from RAM, written to db in background batches;
+# sharded processes read SQLite directly so no process holds a stale copy
+if SHARDED:
+    memory = db
+else:
+    memory = MemoryCache(db)
+    atexit.register(memory.close)
+# --- AI helper (OpenRouter + HuggingFace): built on first use, not at startup ---
 ai = None
 if OPENAI_API_KEY:
+    ai = Lazy(lambda: AIHelper(openai_api_key=OPENAI_API_KEY, hf_api_key=HUGGINGFACE_API_KEY,
+                               pool_size=BOT_NUM_THREADS, base_url=OPENROUTER_URL, hf_base_url=HF_URL,
+                               chat_models=CHAT_MODELS, image_models=IMAGE_MODELS))
+
+# --- Memory compaction: old turns folded into a rolling per-user summary ---
+def _summarize_memory(previous, rows):
+    transcript = "\n".join(f"{role}: {content[:300]}" for role, content in rows)
+    prompt = (
+        "Neeche ek user ke saath purani baatcheet hai. Iska short summary banao (max 120 words): "
+        "user ka naam, pasand-napasand, important facts aur chal rahe topics.\n"
+        + (f"Pichla summary: {previous}\n" if previous else "")
+        + f"Baatcheet:\n{transcript}"
+    )
+    summary = ai.chat_reply(prompt, system="You write compact, factual conversation summaries.")
+    # chat_reply returns an apology string instead of raising; never fold rows into that
+    return None if summary == CHAT_ERROR_REPLY else summary
+
+compactor = None
+# one compactor per host: shard workers leave it to the dispatcher process
+if ai and not IS_SHARD_WORKER:
+    compactor = Compactor(
+        db, _summarize_memory,
+        threshold=int(os.getenv("MEMORY_COMPACT_THRESHOLD") or CONFIG.get("MEMORY_COMPACT_THRESHOLD", 200)),
+        keep_recent=int(os.getenv("MEMORY_KEEP_RECENT") or CONFIG.get("MEMORY_KEEP_RECENT", 40)),
+        interval=float(os.getenv("MEMORY_COMPACT_INTERVAL") or CONFIG.get("MEMORY_COMPACT_INTERVAL", 300)),
+        on_compacted=getattr(memory, "set_summary", None),
+    )
+
+async_ai = None
+runner = None
+if ASYNC_MODE and ai:
     try:
-        ai = AIHelper(openai_api_key=OPENAI_API_KEY)
-        logger.info("AI helper initialized.")
+        async_ai = AsyncAIHelper(
+            openai_api_key=OPENAI_API_KEY,
+            hf_api_key=HUGGINGFACE_API_KEY,
+            base_url=OPENROUTER_URL,
+            hf_base_url=HF_URL,
+            max_chat_inflight=int(os.getenv("ASYNC_MAX_CHAT_INFLIGHT") or CONFIG.get("ASYNC_MAX_CHAT_INFLIGHT", 500)),
+            max_image_inflight=int(os.getenv("ASYNC_MAX_IMAGE_INFLIGHT") or CONFIG.get("ASYNC_MAX_IMAGE_INFLIGHT", 16)),
+            chat_models=CHAT_MODELS,
+            image_models=IMAGE_MODELS,
+        )
+        runner = AsyncRunner()
+        logger.info("Async mode enabled.")
     except Exception as e:
-        ai = None
-        logger.error(f"Failed to initialize AIHelper: {e}")
+        async_ai = runner = None
+        logger.error(f"Failed to start async mode, staying synchronous: {e}")
+
+# --- Image generation queue (bounded, fixed worker pool) ---
+def _generate_image(prompt):
+    if runner:
+        return runner.run(async_ai.generate_image(prompt))
+    if not ai:
+        return None, "⚠️ AI not configured."
+    return ai.generate_image(prompt)
+
+# same (models, prompt) -> one HF call, cached on disk, repeats re-sent by file_id.
+# Keyed on the whole IMAGE_MODELS chain, not one model: the chain decides per call
+# which model serves, so the key names the config that produced the image.
+cached_images = CachedImageGenerator(
+    _generate_image,
+    ImageCache(
+        os.path.join(DATA_DIR, "image_cache"),
+        max_bytes=int(os.getenv("IMAGE_CACHE_MB") or CONFIG.get("IMAGE_CACHE_MB", 200)) * 1024 * 1024,
+    ),
+    model="|".join(IMAGE_MODELS),
+)
+
+def _deliver_image(job, photo, err):
+    if not photo:
+        outbound.send_message(job.chat_id, f"⚠️ Image generate nahi ho paayi. {err or ''}")
+        return
+    try:
+        sent = outbound.sync.send_photo(job.chat_id, photo, caption="✨ Ye lo — tumhari image! 💖", reply_to_message_id=job.reply_to)
+        if not isinstance(photo, str):
+            cached_images.remember_sent(job.prompt, sent)
+    except Exception as e:
+        logger.error("send_photo failed: %s", e)
+        outbound.send_message(job.chat_id, "⚠️ Image ready, lekin bhejne me problem aayi.")
+
+image_queue = ImageJobQueue(
+    cached_images,
+    _deliver_image,
+    workers=int(os.getenv("IMAGE_WORKERS") or CONFIG.get("IMAGE_WORKERS", 2)),
+    max_depth=int(os.getenv("IMAGE_QUEUE_MAX") or CONFIG.get("IMAGE_QUEUE_MAX", 20)),
+)
+
+# broadcasts run in the background, paced under Telegram's ~30 msg/s limit
+broadcaster = BroadcastEngine(
+    outbound.sync,
+    rate=float(os.getenv("BROADCAST_RATE") or CONFIG.get("BROADCAST_RATE", 28)),
+    workers=int(os.getenv("BROADCAST_WORKERS") or CONFIG.get("BROADCAST_WORKERS", 4)),
+    # per-target delivery rows; kicked/deleted groups are deactivated, migrated ones rewritten
+    ledger=db,
+)
+
+# built by startup(): APScheduler + SQLAlchemy are the slowest imports we have
+scheduler = None
+
+def _start_scheduler():
+    global scheduler
+    from utils.scheduler import SchedulerManager
+    scheduler = SchedulerManager(
+        outbound.sync, db, timezone=DEFAULT_TIMEZONE,
+        broadcaster=broadcaster,
+        report_to=OWNER_ID or None,
+        jobstore_path=os.path.join(DATA_DIR, "jobs.sqlite"),
+        max_workers=int(os.getenv("SCHEDULER_WORKERS") or CONFIG.get("SCHEDULER_WORKERS", 4)),
+        # shard workers only add jobs to the shared jobstore; the dispatcher runs them
+        active=not IS_SHARD_WORKER,
+        poll_interval=30 if SHARDED else None,
+    )
+    if not IS_SHARD_WORKER:
+        scheduler.restore_jobs_from_db()
 
-scheduler = SchedulerManager(bot, db, timezone=DEFAULT_TIMEZONE)
+boot.mark("subsystems")
 
 # --- Admin persistence (data/admins.json) ---
 ADMINS_FILE = os.path.join(DATA_DIR, "admins.json")
@@ -103,49 +304,72 @@ def save_admins(admins_set):
     except Exception as e:
         logger.error("Failed to save admins file: %s", e)
 
-ADMINS = load_admins()
-# Ensure owner is always an admin
-if OWNER_ID:
-    ADMINS.add(OWNER_ID)
-save_admins(ADMINS)
+# sharded: every process must see the same admins; otherwise a plain set is enough
+ADMINS = SharedSet(shared, "admins") if SHARDED else set()
+
+def _seed_admins():
+    saved = load_admins()
+    for uid in saved:
+        ADMINS.add(uid)
+    # Ensure owner is always an admin
+    if OWNER_ID:
+        ADMINS.add(OWNER_ID)
+    if set(ADMINS) != saved:
+        save_admins(ADMINS)
 
 def is_admin(user_id: int) -> bool:
     return user_id == OWNER_ID or (user_id in ADMINS)
 
-# --- Cooldown system ---
-user_cooldowns = {}
-COOLDOWN_SECONDS = 10  # reduce spam
+# --- Rate limits (per user, per chat, global) ---
+COOLDOWN_SECONDS = 10  # reduce spam: one AI reply per user per 10s on average
 
-def can_reply(user_id: str) -> bool:
-    now = time.time()
-    last_time = user_cooldowns.get(user_id, 0)
-    if now - last_time >= COOLDOWN_SECONDS:
-        user_cooldowns[user_id] = now
-        return True
-    return False
+def _cfg_float(name, default):
+    return float(os.getenv(name) or CONFIG.get(name, default))
+
+_limits = dict(
+    user_rate=1.0 / COOLDOWN_SECONDS,
+    user_burst=_cfg_float("USER_BURST", 1),
+    chat_rate=_cfg_float("CHAT_RATE", 0.5),
+    chat_burst=_cfg_float("CHAT_BURST", 5),
+    global_rate=_cfg_float("GLOBAL_AI_RATE", 5),
+    global_burst=_cfg_float("GLOBAL_AI_BURST", 20),
+)
+# sharded: buckets live in the shared store so limits hold across processes
+reply_limiter = SharedRateLimiter(shared, **_limits) if SHARDED else RateLimiter(**_limits)
+
+def can_reply(user_id: str, chat_id=None) -> bool:
+    return reply_limiter.allow(user_id, chat_id)
 
 # --- Bot identity (lazy) ---
 _cached_bot_username = None
 _cached_bot_id = None
 
-def refresh_bot_info():
+def refresh_bot_info(fetch=True):
+    """Load the bot's identity; ``fetch=False`` never calls getMe (handler threads)."""
     global _cached_bot_username, _cached_bot_id
+    # shard workers reuse whatever identity another process already fetched
+    known = shared.get("bot", TELEGRAM_TOKEN.split(":", 1)[0])
+    if known:
+        _cached_bot_username, _cached_bot_id = known["username"], known["id"]
+        return True
+    if not fetch:
+        return False
     try:
         me = bot.get_me()
         if me:
             _cached_bot_username = (me.username or "").lower()
             _cached_bot_id = getattr(me, "id", None)
+            shared.put("bot", TELEGRAM_TOKEN.split(":", 1)[0], {"username": _cached_bot_username, "id": _cached_bot_id})
+            return True
     except Exception as e:
         logger.debug("Could not get bot info right now: %s", e)
-
-# initial try
-refresh_bot_info()
+    return False
 
 # --- Should reply logic (with human-reply ignore) ---
 def should_reply(msg: types.Message) -> bool:
-    # refresh cached bot info if empty
+    # identity still unknown: pick it up if the background fetch has stored it, never block on getMe
     if not _cached_bot_username or not _cached_bot_id:
-        refresh_bot_info()
+        refresh_bot_info(fetch=False)
     bot_username = _cached_bot_username or ""
     bot_id = _cached_bot_id
 
@@ -174,12 +398,33 @@ def should_reply(msg: types.Message) -> bool:
     # ==============================
 
     text = (msg.text or "") + " "  # avoid empty slice errors
-    entities = msg.entities or []
+    mentioned_someone, mentioned_bot = _mentions(msg, bot_username, bot_id)
+
+    # If bot is explicitly mentioned -> reply
+    if mentioned_bot:
+        return True
+
+    # If someone else is mentioned and bot is not -> don't reply
+    if mentioned_someone and not mentioned_bot:
+        return False
+
+    # Extra: if there's an '@' sign but not bot mention -> skip
+    if "@" in text and not mentioned_bot and mentioned_someone:
+        return False
+
+    # No mention and no reply -> normal reply
+    if not mentioned_someone:
+        return True
+
+    return False
 
+def _mentions(msg: types.Message, bot_username: str, bot_id):
+    """Returns (mentioned_someone, mentioned_bot) from the message entities."""
+    text = (msg.text or "") + " "
     mentioned_someone = False
     mentioned_bot = False
 
-    for ent in entities:
+    for ent in msg.entities or []:
         try:
             # there are 'mention' and 'text_mention' entity types
             if ent.type == "mention":
@@ -193,37 +438,29 @@ def should_reply(msg: types.Message) -> bool:
                     mentioned_bot = True
         except Exception:
             continue
+    return mentioned_someone, mentioned_bot
 
-    # If bot is explicitly mentioned -> reply
-    if mentioned_bot:
-        return True
-
-    # If someone else is mentioned and bot is not -> don't reply
-    if mentioned_someone and not mentioned_bot:
-        return False
-
-    # Extra: if there's an '@' sign but not bot mention -> skip
-    if "@" in text and not mentioned_bot and mentioned_someone:
+def is_addressed_to_bot(msg: types.Message) -> bool:
+    """Private chat, a reply to the bot, or an explicit mention of it."""
+    try:
+        if msg.chat.type == "private":
+            return True
+        rm = msg.reply_to_message
+        if rm and rm.from_user and _cached_bot_id and rm.from_user.id == _cached_bot_id:
+            return True
+    except Exception:
         return False
-
-    # No mention and no reply -> normal reply
-    if not mentioned_someone:
-        return True
-
-    return False
+    return _mentions(msg, _cached_bot_username or "", _cached_bot_id)[1]
 
 # =============== START ==================
-@bot.message_handler(commands=["start"])
+@router.message_handler(commands=["start"])
 def start(msg: types.Message):
     db.add_group(msg.chat.id)
     markup = types.InlineKeyboardMarkup()
-    try:
-        bot_me = bot.get_me()
-        if bot_me and bot_me.username:
-            add_url = f"https://t.me/{bot_me.username}?startgroup=true"
-            markup.add(types.InlineKeyboardButton("➕ Add me to your Group", url=add_url))
-    except Exception:
-        pass
+    # identity fetched once at startup (refresh_bot_info); until then, no "add" button
+    if _cached_bot_username:
+        add_url = f"https://t.me/{_cached_bot_username}?startgroup=true"
+        markup.add(types.InlineKeyboardButton("➕ Add me to your Group", url=add_url))
 
     markup.add(
         types.InlineKeyboardButton("ℹ️ Help", callback_data="help"),
@@ -233,21 +470,22 @@ def start(msg: types.Message):
         types.InlineKeyboardButton("📢 Broadcast Manager", callback_data="broadcast_manager")
     )
     markup.add(types.InlineKeyboardButton("💬 Support", url="https://t.me/your_support_channel"))
-    bot.reply_to(msg, "🤖 Ultra-Pro AI Bot v3 ready!\nUse /panel for owner controls.", reply_markup=markup)
+    outbound.reply_to(msg, "🤖 Ultra-Pro AI Bot v3 ready!\nUse /panel for owner controls.", reply_markup=markup)
 
 # =============== OWNER PANEL ==================
-@bot.message_handler(commands=["panel"])
+@router.message_handler(commands=["panel"])
 def panel(msg: types.Message):
     if msg.from_user.id != OWNER_ID:
-        return bot.reply_to(msg, "❌ Not allowed.")
+        return outbound.reply_to(msg, "❌ Not allowed.")
     markup = owner_panel_markup()
     # add broadcast & admin controls to owner panel
     markup.add(types.InlineKeyboardButton("⚡ Manage Admins", callback_data="manage_admins"))
     markup.add(types.InlineKeyboardButton("📋 Sticker Grabber", callback_data="sticker_grabber"))
     markup.add(types.InlineKeyboardButton("📢 Broadcast Manager", callback_data="broadcast_manager"))
-    bot.send_message(OWNER_ID, "⚙️ Owner Panel", reply_markup=markup)
+    outbound.send_message(OWNER_ID, "⚙️ Owner Panel", reply_markup=markup)
 
-@bot.callback_query_handler(func=lambda c: True)
+@router.callback_query_handler(data=["list_groups", "new_schedule", "instant_broadcast", "cancel_schedules", "help",
+                                      "stats", "manage_admins", "sticker_grabber", "broadcast_manager"], default=True)
 def cb(call: types.CallbackQuery):
     # for most actions allow owner or admins where appropriate
     data = call.data or ""
@@ -265,31 +503,30 @@ def cb(call: types.CallbackQuery):
     try:
         if call.data == "list_groups":
             groups = db.get_groups()
-            bot.send_message(OWNER_ID, "📋 Groups:\n" + ("\n".join(map(str, groups)) if groups else "None"))
+            outbound.send_message(OWNER_ID, "📋 Groups:\n" + ("\n".join(map(str, groups)) if groups else "None"))
         elif call.data == "new_schedule":
-            bot.send_message(OWNER_ID, "📝 Use /schedule YYYY-MM-DD HH:MM <None/daily/weekly/monthly> Message")
+            outbound.send_message(OWNER_ID, "📝 Use /schedule YYYY-MM-DD HH:MM <None/daily/weekly/monthly> Message")
         elif call.data == "instant_broadcast":
-            bot.send_message(OWNER_ID, "🚀 Use /broadcast or /broadcast_media")
+            outbound.send_message(OWNER_ID, "🚀 Use /broadcast or /broadcast_media")
         elif call.data == "cancel_schedules":
             scheduler.cancel_all(); db.clear_schedules()
-            bot.send_message(OWNER_ID, "✅ All schedules cleared.")
+            outbound.send_message(OWNER_ID, "✅ All schedules cleared.")
         elif call.data == "help":
-            bot.send_message(OWNER_ID, "ℹ️ Help: Use /broadcast, /schedule, /panel for controls.")
+            outbound.send_message(OWNER_ID, "ℹ️ Help: Use /broadcast, /schedule, /panel for controls.")
         elif call.data == "stats":
             g = len(db.get_groups()); u = db.count_users(); s = len(db.list_schedules())
-            bot.send_message(OWNER_ID, f"📊 Stats\nGroups:{g}\nUsers:{u}\nSchedules:{s}")
+            gone = db.count_inactive_groups()
+            outbound.send_message(OWNER_ID, f"📊 Stats\nGroups:{g}" + (f" (+{gone} inactive)" if gone else "")
+                                  + f"\nUsers:{u}\nSchedules:{s}")
         elif call.data == "manage_admins":
             # owner-only panel: list current admins
             admin_list = "\n".join([f"👤 {uid}" for uid in sorted(ADMINS)])
-            bot.send_message(OWNER_ID, f"⚡ Current Admins:\n{admin_list}")
+            outbound.send_message(OWNER_ID, f"⚡ Current Admins:\n{admin_list}")
         elif call.data == "sticker_grabber":
-            bot.send_message(OWNER_ID, "🖼️ Reply to any sticker with /grabsticker to fetch its file_id.")
+            outbound.send_message(OWNER_ID, "🖼️ Reply to any sticker with /grabsticker to fetch its file_id.")
         elif call.data == "broadcast_manager":
             # open broadcast menu in DM for the caller
             show_broadcast_menu(call.from_user.id)
-        elif call.data.startswith("bc_"):
-            # routed to broadcast callback handler defined below
-            pass
         # acknowledge callback
         try:
             bot.answer_callback_query(call.id)
@@ -303,11 +540,11 @@ def cb(call: types.CallbackQuery):
             pass
 
 # =============== Admin commands (owner) ==================
-@bot.message_handler(commands=["addadmin"])
+@router.message_handler(commands=["addadmin"])
 def add_admin(msg: types.Message):
     # Owner only
     if msg.from_user.id != OWNER_ID:
-        return bot.reply_to(msg, "❌ Only Owner can add admins.")
+        return outbound.reply_to(msg, "❌ Only Owner can add admins.")
     try:
         # If reply to a user: use that user's id
         if msg.reply_to_message and msg.reply_to_message.from_user:
@@ -315,53 +552,104 @@ def add_admin(msg: types.Message):
         else:
             args = msg.text.split()
             if len(args) < 2:
-                return bot.reply_to(msg, "Usage: /addadmin <user_id> OR reply to user's message with /addadmin")
+                return outbound.reply_to(msg, "Usage: /addadmin <user_id> OR reply to user's message with /addadmin")
             uid = int(args[1])
         ADMINS.add(uid)
         save_admins(ADMINS)
-        bot.reply_to(msg, f"✅ User {uid} added as Admin.")
+        outbound.reply_to(msg, f"✅ User {uid} added as Admin.")
     except Exception as e:
         logger.error("addadmin error: %s", e)
-        bot.reply_to(msg, f"⚠️ Failed to add admin: {e}")
+        outbound.reply_to(msg, f"⚠️ Failed to add admin: {e}")
 
-@bot.message_handler(commands=["removeadmin"])
+@router.message_handler(commands=["removeadmin"])
 def remove_admin(msg: types.Message):
     if msg.from_user.id != OWNER_ID:
-        return bot.reply_to(msg, "❌ Only Owner can remove admins.")
+        return outbound.reply_to(msg, "❌ Only Owner can remove admins.")
     try:
         args = msg.text.split()
         if len(args) < 2:
-            return bot.reply_to(msg, "Usage: /removeadmin <user_id>")
+            return outbound.reply_to(msg, "Usage: /removeadmin <user_id>")
         uid = int(args[1])
         if uid in ADMINS:
             ADMINS.discard(uid)
             save_admins(ADMINS)
-            bot.reply_to(msg, f"✅ User {uid} removed from Admins.")
+            outbound.reply_to(msg, f"✅ User {uid} removed from Admins.")
         else:
-            bot.reply_to(msg, f"⚠️ User {uid} is not an Admin.")
+            outbound.reply_to(msg, f"⚠️ User {uid} is not an Admin.")
     except Exception as e:
         logger.error("removeadmin error: %s", e)
-        bot.reply_to(msg, f"⚠️ Failed: {e}")
+        outbound.reply_to(msg, f"⚠️ Failed: {e}")
 
-@bot.message_handler(commands=["listadmins"])
+@router.message_handler(commands=["listadmins"])
 def list_admins(msg: types.Message):
     if not is_admin(msg.from_user.id):
-        return bot.reply_to(msg, "❌ Not allowed.")
+        return outbound.reply_to(msg, "❌ Not allowed.")
     admin_list = "\n".join([str(uid) for uid in sorted(ADMINS)])
-    bot.reply_to(msg, f"👑 Current Admins:\n{admin_list}")
+    outbound.reply_to(msg, f"👑 Current Admins:\n{admin_list}")
+
+@router.message_handler(commands=["poolstats"])
+def pool_stats(msg: types.Message):
+    if msg.from_user.id != OWNER_ID:
+        return outbound.reply_to(msg, "❌ Not allowed.")
+    if not ai:
+        return outbound.reply_to(msg, "⚠️ AI not configured.")
+    lines = []
+    for name, st in ai.pool_stats().items():
+        lines.append(f"🔌 {name}: requests={st['requests']} connections={st['connections']} "
+                     f"idle={st['idle_open']} reuse={st['reuse_ratio']:.0%}")
+    outbound.reply_to(msg, "\n".join(lines))
+
+@router.message_handler(commands=["imagestats"])
+def image_stats(msg: types.Message):
+    if msg.from_user.id != OWNER_ID:
+        return outbound.reply_to(msg, "❌ Not allowed.")
+    st = image_queue.stats()
+    outbound.reply_to(msg, (
+        f"🎨 Image queue\nDepth:{st['depth']} In-flight:{st['inflight']} Rejected:{st['rejected']}\n"
+        f"Done:{st['done']} Failed:{st['failed']}\n"
+        f"Wait p50/p95: {st['wait_p50']:.1f}s / {st['wait_p95']:.1f}s\n"
+        f"Gen p50/p95: {st['gen_p50']:.1f}s / {st['gen_p95']:.1f}s"
+    ))
+
+@router.message_handler(commands=["sendstats"])
+def send_stats(msg: types.Message):
+    if msg.from_user.id != OWNER_ID:
+        return outbound.reply_to(msg, "❌ Not allowed.")
+    st = outbound.stats()
+    lines = [
+        f"📤 Outbound queue\nDepth:{st['depth']} In-flight:{st['inflight']} Chats:{st['chats']}",
+        f"Sent:{st['sent']} Failed:{st['failed']} Retried:{st['retried']} Dropped:{st['dropped']}",
+        f"Wait p50/p95: ≤{st['wait_p50']}s / ≤{st['wait_p95']}s",
+    ]
+    for method, (p50, p95, n) in sorted(st["send"].items()):
+        lines.append(f"{method}: n={n} p50≤{p50}s p95≤{p95}s")
+    outbound.reply_to(msg, "\n".join(lines))
+
+@router.message_handler(commands=["perf"])
+def perf(msg: types.Message):
+    if msg.from_user.id != OWNER_ID:
+        return outbound.reply_to(msg, "❌ Not allowed.")
+    digest = metrics.REGISTRY.summary() or "No measurements yet."
+    ttft = TTFT_SECONDS.labels()
+    head = ""
+    if ttft.count:
+        head = (f"💬 Time to first reply text: n={ttft.count} avg={ttft.sum / ttft.count:.2f}s "
+                f"p50≤{ttft.percentile(0.5):.2f}s p95≤{ttft.percentile(0.95):.2f}s\n\n")
+    outbound.reply_to(msg, head + "⏱ Where the time goes (top by total)\n" + digest[:4000])
 
 # =============== BROADCAST MANAGER (inline + DM wizard) ==================
 # sessions: user_id -> dict with state + fields
-broadcast_sessions = {}
+# keyed by user id; shared when sharded so a wizard keeps working whichever shard gets the next step
+broadcast_sessions = SharedDict(shared, "broadcast_sessions") if SHARDED else {}
 
 def show_broadcast_menu(chat_id):
     markup = types.InlineKeyboardMarkup()
     markup.add(types.InlineKeyboardButton("📝 Text Broadcast", callback_data="bc_text"))
     markup.add(types.InlineKeyboardButton("🖼️ Media + Button", callback_data="bc_media"))
     markup.add(types.InlineKeyboardButton("⏰ Schedule Broadcast", callback_data="bc_schedule"))
-    bot.send_message(chat_id, "📢 Broadcast Manager:\nChoose an option ↓", reply_markup=markup)
+    outbound.send_message(chat_id, "📢 Broadcast Manager:\nChoose an option ↓", reply_markup=markup)
 
-@bot.callback_query_handler(func=lambda c: c.data and c.data.startswith("bc_"))
+@router.callback_query_handler(prefix="bc_")
 def broadcast_cb(call: types.CallbackQuery):
     user_id = call.from_user.id
     if not is_admin(user_id):
@@ -374,34 +662,34 @@ def broadcast_cb(call: types.CallbackQuery):
         pass
     if data == "bc_text":
         broadcast_sessions[user_id] = {"state": "await_text"}
-        bot.send_message(user_id, "✍️ Send the TEXT you want to broadcast to all groups. Send /cancel to abort.")
+        outbound.send_message(user_id, "✍️ Send the TEXT you want to broadcast to all groups. Send /cancel to abort.")
     elif data == "bc_media":
         broadcast_sessions[user_id] = {"state": "await_media_upload"}
-        bot.send_message(user_id, "📸 Please send the IMAGE or VIDEO you want to broadcast (directly in this chat). Send /cancel to abort.")
+        outbound.send_message(user_id, "📸 Please send the IMAGE or VIDEO you want to broadcast (directly in this chat). Send /cancel to abort.")
     elif data == "bc_schedule":
         # start scheduling wizard
         broadcast_sessions[user_id] = {"state": "await_schedule_type"}
-        bot.send_message(user_id, "⏰ Schedule Broadcast Wizard:\nType 'text' or 'media' — which do you want to schedule?")
+        outbound.send_message(user_id, "⏰ Schedule Broadcast Wizard:\nType 'text' or 'media' — which do you want to schedule?")
     else:
-        bot.send_message(user_id, "⚠️ Unknown broadcast option.")
+        outbound.send_message(user_id, "⚠️ Unknown broadcast option.")
 
-@bot.message_handler(commands=["broadcast_menu"])
+@router.message_handler(commands=["broadcast_menu"])
 def cmd_broadcast_menu(msg: types.Message):
     if not is_admin(msg.from_user.id):
-        return bot.reply_to(msg, "❌ Not allowed.")
+        return outbound.reply_to(msg, "❌ Not allowed.")
     show_broadcast_menu(msg.from_user.id)
 
-@bot.message_handler(commands=["cancel"])
+@router.message_handler(commands=["cancel"])
 def cmd_cancel(msg: types.Message):
     uid = msg.from_user.id
     if uid in broadcast_sessions:
         broadcast_sessions.pop(uid, None)
-        bot.reply_to(msg, "❌ Broadcast wizard cancelled.")
+        outbound.reply_to(msg, "❌ Broadcast wizard cancelled.")
     else:
-        bot.reply_to(msg, "Nothing to cancel.")
+        outbound.reply_to(msg, "Nothing to cancel.")
 
 # Handler for private incoming media when in broadcast session
-@bot.message_handler(func=lambda m: m.chat.type == "private" and m.from_user and m.from_user.id in broadcast_sessions, content_types=["photo", "video"])
+@router.message_handler(func=lambda m: m.chat.type == "private" and m.from_user and m.from_user.id in broadcast_sessions, content_types=["photo", "video"])
 def _broadcast_receive_media(msg: types.Message):
     uid = msg.from_user.id
     sess = broadcast_sessions.get(uid)
@@ -418,9 +706,9 @@ def _broadcast_receive_media(msg: types.Message):
                 sess["media_type"] = "video"
                 sess["media_file_id"] = msg.video.file_id
             else:
-                return bot.reply_to(msg, "Unsupported media. Send a photo or video.")
+                return outbound.reply_to(msg, "Unsupported media. Send a photo or video.")
             sess["state"] = "await_link"
-            bot.send_message(uid, "🔗 Now send the LINK (URL) that the button should open (or /skip to send media without button).")
+            outbound.send_message(uid, "🔗 Now send the LINK (URL) that the button should open (or /skip to send media without button).")
             return
 
         if state == "await_schedule_media_upload":
@@ -432,16 +720,16 @@ def _broadcast_receive_media(msg: types.Message):
                 sess["media_type"] = "video"
                 sess["media_file_id"] = msg.video.file_id
             else:
-                return bot.reply_to(msg, "Unsupported media. Send a photo or video.")
+                return outbound.reply_to(msg, "Unsupported media. Send a photo or video.")
             sess["state"] = "await_schedule_link"
-            bot.send_message(uid, "🔗 Now send the LINK (URL) for the button (or /skip).")
+            outbound.send_message(uid, "🔗 Now send the LINK (URL) for the button (or /skip).")
             return
     except Exception as e:
         logger.error("broadcast media receive error: %s", e)
-        bot.reply_to(msg, "⚠️ Error receiving media.")
+        outbound.reply_to(msg, "⚠️ Error receiving media.")
 
 # Handler for private text steps in broadcast wizard
-@bot.message_handler(func=lambda m: m.chat.type == "private" and m.from_user and m.from_user.id in broadcast_sessions, content_types=["text"])
+@router.message_handler(func=lambda m: m.chat.type == "private" and m.from_user and m.from_user.id in broadcast_sessions, content_types=["text"])
 def _broadcast_wizard_text(msg: types.Message):
     uid = msg.from_user.id
     text = (msg.text or "").strip()
@@ -453,7 +741,7 @@ def _broadcast_wizard_text(msg: types.Message):
     # Cancel shortcut
     if text.lower() in ("/cancel", "cancel"):
         broadcast_sessions.pop(uid, None)
-        return bot.reply_to(msg, "❌ Broadcast wizard cancelled.")
+        return outbound.reply_to(msg, "❌ Broadcast wizard cancelled.")
 
     try:
         # ---------- immediate text broadcast ----------
@@ -463,7 +751,7 @@ def _broadcast_wizard_text(msg: types.Message):
             markup = types.InlineKeyboardMarkup()
             markup.add(types.InlineKeyboardButton("✅ Confirm & Send", callback_data=f"bc_confirm_text:{uid}"))
             markup.add(types.InlineKeyboardButton("❌ Cancel", callback_data=f"bc_cancel:{uid}"))
-            bot.send_message(uid, "📣 Preview of your broadcast text:\n\n" + text, reply_markup=markup)
+            outbound.send_message(uid, "📣 Preview of your broadcast text:\n\n" + text, reply_markup=markup)
             return
 
         # ---------- immediate media flow: link/button text ----------
@@ -471,11 +759,11 @@ def _broadcast_wizard_text(msg: types.Message):
             if text.lower() == "/skip":
                 sess["link"] = None
                 sess["state"] = "await_caption"
-                bot.send_message(uid, "📝 Send the CAPTION for the media (or /skip for no caption).")
+                outbound.send_message(uid, "📝 Send the CAPTION for the media (or /skip for no caption).")
                 return
             sess["link"] = text
             sess["state"] = "await_btn_text"
-            bot.send_message(uid, "🔘 Send the BUTTON TEXT (e.g. Join Channel) or /skip to use default.")
+            outbound.send_message(uid, "🔘 Send the BUTTON TEXT (e.g. Join Channel) or /skip to use default.")
             return
 
         if state == "await_btn_text":
@@ -484,7 +772,7 @@ def _broadcast_wizard_text(msg: types.Message):
             else:
                 sess["button_text"] = text
             sess["state"] = "await_caption"
-            bot.send_message(uid, "📝 Send the CAPTION for the media (or /skip for no caption).")
+            outbound.send_message(uid, "📝 Send the CAPTION for the media (or /skip for no caption).")
             return
 
         if state == "await_caption":
@@ -499,14 +787,14 @@ def _broadcast_wizard_text(msg: types.Message):
                 markup.add(types.InlineKeyboardButton(sess.get("button_text", "Open"), url=sess.get("link")))
             # send preview
             if sess.get("media_type") == "photo":
-                bot.send_photo(uid, sess["media_file_id"], caption=sess.get("caption", ""), reply_markup=markup if markup.inline_keyboard else None)
+                outbound.send_photo(uid, sess["media_file_id"], caption=sess.get("caption", ""), reply_markup=markup if markup.inline_keyboard else None)
             elif sess.get("media_type") == "video":
-                bot.send_video(uid, sess["media_file_id"], caption=sess.get("caption", ""), reply_markup=markup if markup.inline_keyboard else None)
+                outbound.send_video(uid, sess["media_file_id"], caption=sess.get("caption", ""), reply_markup=markup if markup.inline_keyboard else None)
             # show confirm/cancel
             confirm_markup = types.InlineKeyboardMarkup()
             confirm_markup.add(types.InlineKeyboardButton("✅ Confirm & Send", callback_data=f"bc_confirm_media:{uid}"))
             confirm_markup.add(types.InlineKeyboardButton("❌ Cancel", callback_data=f"bc_cancel:{uid}"))
-            bot.send_message(uid, "Preview above. Confirm to broadcast to all groups where the bot is present.", reply_markup=confirm_markup)
+            outbound.send_message(uid, "Preview above. Confirm to broadcast to all groups where the bot is present.", reply_markup=confirm_markup)
             return
 
         # ---------- schedule flow ----------
@@ -514,30 +802,30 @@ def _broadcast_wizard_text(msg: types.Message):
             if text.lower() in ("text", "media"):
                 sess["schedule_type"] = text.lower()
                 sess["state"] = "await_schedule_datetime"
-                bot.send_message(uid, "📅 Send SCHEDULE TIME in format: YYYY-MM-DD HH:MM (24h). Example: 2025-09-30 18:30")
+                outbound.send_message(uid, "📅 Send SCHEDULE TIME in format: YYYY-MM-DD HH:MM (24h). Example: 2025-09-30 18:30")
             else:
-                bot.send_message(uid, "Please reply 'text' or 'media' to select schedule type.")
+                outbound.send_message(uid, "Please reply 'text' or 'media' to select schedule type.")
             return
 
         if state == "await_schedule_datetime":
             # Basic validation of format
             sess["schedule_datetime"] = text
             sess["state"] = "await_schedule_recur"
-            bot.send_message(uid, "🔁 Recurrence? send one of: none / daily / weekly / monthly")
+            outbound.send_message(uid, "🔁 Recurrence? send one of: none / daily / weekly / monthly")
             return
 
         if state == "await_schedule_recur":
             recur = text.lower()
             if recur not in ("none", "daily", "weekly", "monthly"):
-                return bot.send_message(uid, "Choose recurrence: none / daily / weekly / monthly")
+                return outbound.send_message(uid, "Choose recurrence: none / daily / weekly / monthly")
             sess["schedule_recur"] = recur
             # next collect message or media depending on type
             if sess.get("schedule_type") == "text":
                 sess["state"] = "await_schedule_text"
-                bot.send_message(uid, "✍️ Send the TEXT to schedule.")
+                outbound.send_message(uid, "✍️ Send the TEXT to schedule.")
             else:
                 sess["state"] = "await_schedule_media_upload"
-                bot.send_message(uid, "📸 Now send the IMAGE or VIDEO to schedule (in this chat).")
+                outbound.send_message(uid, "📸 Now send the IMAGE or VIDEO to schedule (in this chat).")
             return
 
         if state == "await_schedule_text":
@@ -552,10 +840,10 @@ def _broadcast_wizard_text(msg: types.Message):
                     db.add_schedule(jobid, payload, None, run_time, recur)
                 except Exception:
                     logger.debug("db.add_schedule failed (maybe db not implemented).")
-                bot.send_message(uid, f"✅ Scheduled text broadcast at {run_time} recur={recur}. jobid={jobid}")
+                outbound.send_message(uid, f"✅ Scheduled text broadcast at {run_time} recur={recur}. jobid={jobid}")
             except Exception as e:
                 logger.exception("Failed to schedule broadcast:")
-                bot.send_message(uid, f"⚠️ Failed to schedule: {e}")
+                outbound.send_message(uid, f"⚠️ Failed to schedule: {e}")
             broadcast_sessions.pop(uid, None)
             return
 
@@ -565,7 +853,7 @@ def _broadcast_wizard_text(msg: types.Message):
             else:
                 sess["schedule_link"] = text
             sess["state"] = "await_schedule_btn_text"
-            bot.send_message(uid, "🔘 Send BUTTON TEXT for scheduled media (or /skip).")
+            outbound.send_message(uid, "🔘 Send BUTTON TEXT for scheduled media (or /skip).")
             return
 
         if state == "await_schedule_btn_text":
@@ -574,7 +862,7 @@ def _broadcast_wizard_text(msg: types.Message):
             else:
                 sess["schedule_btn_text"] = text
             sess["state"] = "await_schedule_caption"
-            bot.send_message(uid, "📝 Send CAPTION for scheduled media (or /skip).")
+            outbound.send_message(uid, "📝 Send CAPTION for scheduled media (or /skip).")
             return
 
         if state == "await_schedule_caption":
@@ -594,19 +882,19 @@ def _broadcast_wizard_text(msg: types.Message):
                     db.add_schedule(jobid, payload, media_file_id, run_time, recur)
                 except Exception:
                     logger.debug("db.add_schedule failed (maybe db not implemented).")
-                bot.send_message(uid, f"✅ Scheduled media broadcast at {run_time} recur={recur}. jobid={jobid}")
+                outbound.send_message(uid, f"✅ Scheduled media broadcast at {run_time} recur={recur}. jobid={jobid}")
             except Exception as e:
                 logger.exception("Failed to schedule media broadcast:")
-                bot.send_message(uid, f"⚠️ Failed to schedule: {e}")
+                outbound.send_message(uid, f"⚠️ Failed to schedule: {e}")
             broadcast_sessions.pop(uid, None)
             return
 
     except Exception as e:
         logger.exception("broadcast wizard text handler error:")
-        bot.reply_to(msg, "⚠️ Error during broadcast wizard.")
+        outbound.reply_to(msg, "⚠️ Error during broadcast wizard.")
 
 # Callback handlers for confirm/cancel
-@bot.callback_query_handler(func=lambda c: c.data and (c.data.startswith("bc_confirm_") or c.data.startswith("bc_cancel:") ))
+@router.callback_query_handler(prefix=["bc_confirm_", "bc_cancel:"])
 def _broadcast_confirm_cancel(call: types.CallbackQuery):
     data = call.data or ""
     try:
@@ -618,7 +906,7 @@ def _broadcast_confirm_cancel(call: types.CallbackQuery):
                 return bot.answer_callback_query(call.id, "❌ Not allowed.")
             broadcast_sessions.pop(uid, None)
             bot.answer_callback_query(call.id)
-            return bot.send_message(uid, "✅ Broadcast cancelled.")
+            return outbound.send_message(uid, "✅ Broadcast cancelled.")
         if data.startswith("bc_confirm_text:"):
             parts = data.split(":", 1)
             uid = int(parts[1]) if len(parts) > 1 else call.from_user.id
@@ -630,17 +918,8 @@ def _broadcast_confirm_cancel(call: types.CallbackQuery):
                 return
             text = sess["broadcast_text"]
             bot.answer_callback_query(call.id, "Sending broadcast...")
-            groups = db.get_groups()
-            sent = 0
-            for gid in groups:
-                try:
-                    bot.send_message(gid, text)
-                    sent += 1
-                    time.sleep(0.06)
-                except Exception as e:
-                    logger.warning("Broadcast text failed to %s: %s", gid, e)
             broadcast_sessions.pop(uid, None)
-            bot.send_message(uid, f"✅ Broadcast text sent to {sent} groups.")
+            broadcaster.start(uid, db.get_groups(), lambda gid: outbound.sync.send_message(gid, text), label="Text broadcast")
             return
 
         if data.startswith("bc_confirm_media:"):
@@ -660,21 +939,17 @@ def _broadcast_confirm_cancel(call: types.CallbackQuery):
             markup = types.InlineKeyboardMarkup()
             if link:
                 markup.add(types.InlineKeyboardButton(btn_text, url=link))
+            reply_markup = markup if markup.inline_keyboard else None
+
+            def send_media(gid):
+                if media_type == "photo":
+                    outbound.sync.send_photo(gid, file_id, caption=caption or "", reply_markup=reply_markup)
+                elif media_type == "video":
+                    outbound.sync.send_video(gid, file_id, caption=caption or "", reply_markup=reply_markup)
+
             bot.answer_callback_query(call.id, "Sending broadcast...")
-            groups = db.get_groups()
-            sent = 0
-            for gid in groups:
-                try:
-                    if media_type == "photo":
-                        bot.send_photo(gid, file_id, caption=caption or "", reply_markup=markup if markup.inline_keyboard else None)
-                    elif media_type == "video":
-                        bot.send_video(gid, file_id, caption=caption or "", reply_markup=markup if markup.inline_keyboard else None)
-                    sent += 1
-                    time.sleep(0.09)
-                except Exception as e:
-                    logger.warning("Broadcast media failed to %s: %s", gid, e)
             broadcast_sessions.pop(uid, None)
-            bot.send_message(uid, f"✅ Broadcast media sent to {sent} groups.")
+            broadcaster.start(uid, db.get_groups(), send_media, label="Media broadcast")
             return
     except Exception as e:
         logger.exception("broadcast confirm handler error:")
@@ -684,17 +959,35 @@ def _broadcast_confirm_cancel(call: types.CallbackQuery):
             pass
 
 # =============== STICKER GRABBER ==================
-@bot.message_handler(commands=["grabsticker"])
+@router.message_handler(commands=["grabsticker"])
 def grab_sticker(msg: types.Message):
     if not is_admin(msg.from_user.id):
-        return bot.reply_to(msg, "❌ Not allowed.")
+        return outbound.reply_to(msg, "❌ Not allowed.")
     if not msg.reply_to_message or not msg.reply_to_message.sticker:
-        return bot.reply_to(msg, "⚠️ Reply to a sticker with this command to grab its file_id.")
+        return outbound.reply_to(msg, "⚠️ Reply to a sticker with this command to grab its file_id.")
     sticker_id = msg.reply_to_message.sticker.file_id
-    bot.reply_to(msg, f"✅ Sticker file_id:\n<code>{sticker_id}</code>", parse_mode="HTML")
+    outbound.reply_to(msg, f"✅ Sticker file_id:\n<code>{sticker_id}</code>", parse_mode="HTML")
 
 # =============== CHAT HANDLER ==================
-@bot.message_handler(func=lambda m: True, content_types=["text"])
+# Persona goes out once per request as a fixed system message (cache-friendly);
+# history is filled newest-first up to PROMPT_TOKEN_BUDGET.
+BUTKI_PERSONA = (
+    "Tum ek ladki ho jiska naam 'Butki' hai 💖\n"
+    "Tumhari personality mast, thodi naughty aur full masti wali hai 😘\n"
+    "Group me behave karo jaise tum sabki dost ho 🥳\n"
+    "Thoda flirty, thoda funny aur emojis ke sath pyara sa reply do 💅✨"
+)
+HISTORY_TURNS = 12
+prompt_builder = PromptBuilder(
+    BUTKI_PERSONA,
+    budget_tokens=int(_cfg_float("PROMPT_TOKEN_BUDGET", 1500)),
+    max_turn_tokens=int(_cfg_float("PROMPT_MAX_TURN_TOKENS", 300)),
+)
+
+# keyword -> image/ignore routing, compiled once; "INTENTS" in config.json overrides the defaults
+intents = IntentMatcher(CONFIG.get("INTENTS"))
+
+@router.message_handler(func=lambda m: True, content_types=["text"])
 def chat(msg: types.Message):
     # Ignore if we should not reply
     if not should_reply(msg):
@@ -705,32 +998,22 @@ def chat(msg: types.Message):
         return
 
     text = (msg.text or "").strip()
-    lower = text.lower()
-
-    # Keywords for triggering image
-    image_keywords = ["photo", "pic", "image", "picture", "meme", "photo of", "pic of", "picture of"]
+    intent = intents.route(text)
+    if intent == IGNORE:
+        return
 
     # ========== IMAGE FLOW ==========
-    if any(k in lower for k in image_keywords):
+    if intent == IMAGE:
         try:
-            try:
-                bot.send_chat_action(msg.chat.id, "upload_photo")
-            except Exception:
-                pass
+            outbound.send_chat_action(msg.chat.id, "upload_photo")
 
             prompt = text
-            img_bytes, err = ai.generate_image(prompt)  # ✅ Updated handling
-
-            if img_bytes:
-                try:
-                    bot.send_photo(msg.chat.id, img_bytes, caption="✨ Ye lo — tumhari image! 💖")
-                except Exception as e:
-                    logger.error("send_photo failed: %s", e)
-                    bot.send_message(msg.chat.id, "⚠️ Image ready, lekin bhejne me problem aayi.")
-                return
+            # generation runs on the image queue; this thread only acks
+            if image_queue.submit(msg.chat.id, prompt, reply_to=msg.message_id):
+                outbound.reply_to(msg, "🎨 Image bana rahi hoon... thoda wait karo 💖")
             else:
-                bot.send_message(msg.chat.id, f"⚠️ Image generate nahi ho paayi. {err or ''}")
-                # fallthrough to text reply
+                outbound.reply_to(msg, "⏳ Abhi bahut saari images ban rahi hain, thodi der baad try karo 🙏")
+            return
 
         except Exception as e:
             logger.error("Image flow error: %s", e)
@@ -738,40 +1021,99 @@ def chat(msg: types.Message):
 
     # ========== TEXT FLOW ==========
     try:
-        db.add_group(msg.chat.id)
-        uid = str(msg.from_user.id)
-        if not can_reply(uid):
+        # busy groups: ambient chatter is batched into one reply per window
+        if coalescer and msg.chat.type in ("group", "supergroup") and not is_addressed_to_bot(msg):
+            db.add_group(msg.chat.id)
+            coalescer.add(msg.chat.id, msg)
             return
-        db.add_memory(uid, "user", msg.text)
-        mem = db.get_memory(uid, limit=6)
-
-        if not ai:
-            return bot.send_message(msg.chat.id, "⚠️ AI not configured.")
 
-        try:
-            reply = ai.chat_reply(
-                f"Tum ek ladki ho jiska naam 'Butki' hai 💖\n"
-                f"Tumhari personality mast, thodi naughty aur full masti wali hai 😘\n"
-                f"Group me behave karo jaise tum sabki dost ho 🥳\n"
-                f"Thoda flirty, thoda funny aur emojis ke sath pyara sa reply do 💅✨\n"
-                f"User: {msg.text}",
-                mem
-            )
-        except Exception as e:
-            logger.error(f"AI error: {e}")
-            reply = "⚠️ Sorry baby, abhi thoda busy hoon 💖"
+        prepared = _chat_prepare(msg)
+        if not prepared:
+            return
+        uid, mem = prepared
+        _chat_respond(msg, uid, mem, msg.text)
 
-        db.add_memory(uid, "assistant", reply)
+    except Exception as e:
+        logger.exception("Chat error:")
+        outbound.send_message(msg.chat.id, "⚠️ Error, please try again later.")
+
+def _chat_respond(msg, uid, mem, user_text):
+    """AI part of the text flow: async, streamed or plain, per config."""
+    history, user_text, prompt_tokens = prompt_builder.build(user_text, mem)
+    logger.info("Chat prompt for %s: ~%d tokens, %d history turns", uid, prompt_tokens, len(history))
+    if runner:
+        runner.submit(_chat_reply_async(msg, uid, history, user_text))
+        return
 
-        try:
-            bot.reply_to(msg, reply)
-        except Exception as e:
-            logger.error(f"Reply_to failed, fallback: {e}")
-            bot.send_message(msg.chat.id, reply)
+    if STREAM_REPLIES:
+        reply, _ttft = stream_reply(outbound.sync, msg, ai.chat_reply_stream(user_text, history, system=BUTKI_PERSONA))
+        memory.add_memory(uid, "assistant", reply)
+        return
 
+    try:
+        reply = ai.chat_reply(user_text, history, system=BUTKI_PERSONA)
     except Exception as e:
-        logger.exception("Chat error:")
-        bot.send_message(msg.chat.id, "⚠️ Error, please try again later.")
+        logger.error(f"AI error: {e}")
+        reply = "⚠️ Sorry baby, abhi thoda busy hoon 💖"
+
+    _chat_finish(msg, uid, reply)
+
+def _chat_coalesced(chat_id, msgs):
+    """One AI reply for a window of ambient group messages."""
+    if not ai:
+        return
+    # rate limits: first sender (newest first) that still has budget gets the reply
+    target = None
+    for m in reversed(msgs):
+        if can_reply(str(m.from_user.id), chat_id):
+            target = m
+            break
+    if target is None:
+        return
+    uid = str(target.from_user.id)
+    # read before storing the batch: it goes out as the user turn, not again as history
+    mem = memory.get_memory(uid, limit=HISTORY_TURNS)
+    for m in msgs:
+        memory.add_memory(str(m.from_user.id), "user", m.text)
+    if len(msgs) == 1:
+        user_text = target.text
+    else:
+        user_text = "\n" + "\n".join(f"{m.from_user.first_name or 'User'}: {m.text}" for m in msgs)
+    _chat_respond(target, uid, mem, user_text)
+
+
+def _chat_prepare(msg):
+    """Cheap pre-AI part of the text flow. Returns (uid, history) or None."""
+    db.add_group(msg.chat.id)
+    uid = str(msg.from_user.id)
+    if not can_reply(uid, msg.chat.id):
+        return None
+    memory.add_memory(uid, "user", msg.text)
+    mem = memory.get_memory(uid, limit=HISTORY_TURNS)
+
+    if not ai:
+        outbound.send_message(msg.chat.id, "⚠️ AI not configured.")
+        return None
+    return uid, mem
+
+def _chat_finish(msg, uid, reply):
+    memory.add_memory(uid, "assistant", reply)
+    outbound.reply_to(msg, reply)
+
+# --- async mode: AI calls run on the event loop, blocking sends on its executor ---
+async def _chat_reply_async(msg, uid, history, user_text):
+    reply = await async_ai.chat_reply(user_text, history, system=BUTKI_PERSONA)
+    await asyncio.get_running_loop().run_in_executor(None, _chat_finish, msg, uid, reply)
+
+coalescer = None
+if COALESCE_GROUPS:
+    coalescer = ChatCoalescer(
+        _chat_coalesced,
+        window=_cfg_float("COALESCE_WINDOW", 1.5),
+        max_batch=int(_cfg_float("COALESCE_MAX", 8)),
+        # flushes (one AI call each) queue on the dispatcher's ambient pool and are shed with it
+        submit=lambda fn, *args: dispatcher.run(AMBIENT, fn, *args),
+    )
 
 # =============== STICKER HANDLER ==================
 STICKER_IDS = [
@@ -782,7 +1124,31 @@ STICKER_IDS = [
     "CAACAgUAAxkBAANNaM1VMX0VXi_2ql897hzgwKnlkGQAAjsOAAIKCDlW81YQdhOWt402BA",
 ]
 
-@bot.message_handler(content_types=["sticker"])
+def _sticker_prompt(emoji):
+    return (
+        f"Tum ek ladki ho jiska naam 'Butki' hai 💖\n"
+        f"User ne ek {emoji} sticker bheja hai.\n"
+        f"Sticker dekh kar mast funny, flirty aur cute reply do 💅✨\n"
+        f"Har reply me emojis use karo jaise ek ladki naturally karti hai 😘"
+    )
+
+def _sticker_generate(emoji):
+    reply = ai.chat_reply(_sticker_prompt(emoji))
+    return None if reply == CHAT_ERROR_REPLY else reply
+
+# the prompt depends only on the emoji, so replies are banked per emoji and served instantly
+sticker_bank = None
+if ai:
+    sticker_bank = ReplyBank(
+        _sticker_generate, name="sticker",
+        per_key=int(os.getenv("STICKER_BANK_SIZE") or CONFIG.get("STICKER_BANK_SIZE", 5)),
+        ttl=_cfg_float("STICKER_BANK_TTL", 6 * 3600),
+        max_keys=int(os.getenv("STICKER_BANK_MAX_EMOJIS") or CONFIG.get("STICKER_BANK_MAX_EMOJIS", 300)),
+        fill_rate=_cfg_float("STICKER_BANK_FILL_RATE", 0.2),
+    )
+STICKER_WARM_EMOJIS = CONFIG.get("STICKER_WARM_EMOJIS", ["😂", "❤️", "😍", "🥰", "😘", "👍", "🔥", "😭", "🙏", "😎"])
+
+@router.message_handler(content_types=["sticker"])
 def sticker(msg: types.Message):
     if not should_reply(msg):
         return
@@ -791,71 +1157,86 @@ def sticker(msg: types.Message):
 
     emoji = msg.sticker.emoji if msg.sticker else "🙂"
     try:
-        if ai and can_reply(str(msg.from_user.id)) and random.random() < 0.7:
-            prompt = (
-                f"Tum ek ladki ho jiska naam 'Butki' hai 💖\n"
-                f"User ne ek {emoji} sticker bheja hai.\n"
-                f"Sticker dekh kar mast funny, flirty aur cute reply do 💅✨\n"
-                f"Har reply me emojis use karo jaise ek ladki naturally karti hai 😘"
-            )
-            try:
-                reply = ai.chat_reply(prompt)
-            except Exception as e:
-                logger.error(f"AI error (sticker): {e}")
-                reply = f"{emoji} Awww, kitna cute sticker hai 💖"
-
-            try:
-                bot.reply_to(msg, reply)
-            except Exception as e:
-                logger.error(f"Reply_to failed (sticker), fallback: {e}")
-                bot.send_message(msg.chat.id, reply)
+        wants_text = random.random() < 0.7
+        # a banked reply costs nothing upstream, so it spends no AI budget either
+        reply = sticker_bank.get(emoji) if wants_text and sticker_bank else None
+        if reply:
+            return _sticker_send_reply(msg, reply)
+
+        if wants_text and ai and can_reply(str(msg.from_user.id), msg.chat.id):
+            if runner:
+                runner.submit(_sticker_reply_async(msg, emoji, _sticker_prompt(emoji)))
+                return
+            reply = _sticker_generate(emoji)
+            if reply:
+                sticker_bank.add(emoji, reply)
+            _sticker_send_reply(msg, reply or _sticker_fallback(emoji))
 
         else:
+            if wants_text and sticker_bank:
+                # no AI budget for this user right now: bank this emoji in the background for next time
+                sticker_bank.warm([emoji])
             if STICKER_IDS:
                 sticker_id = random.choice(STICKER_IDS)
-                bot.send_sticker(msg.chat.id, sticker_id, reply_to_message_id=msg.message_id)
+                outbound.send_sticker(msg.chat.id, sticker_id, reply_to_message_id=msg.message_id)
             else:
-                bot.send_message(msg.chat.id, f"{emoji} Cute sticker!")
+                outbound.send_message(msg.chat.id, f"{emoji} Cute sticker!")
 
     except Exception as e:
         logger.error(f"Sticker reply error: {e}")
-        bot.send_message(msg.chat.id, f"{emoji} (sticker received)")
+        outbound.send_message(msg.chat.id, f"{emoji} (sticker received)")
+
+def _sticker_fallback(emoji):
+    # canned, so never banked: only model replies go into sticker_bank
+    return f"{emoji} Awww, kitna cute sticker hai 💖"
+
+def _sticker_send_reply(msg, reply):
+    # a sticker reply is banter: first to go when the outbound queue is busy
+    outbound.reply_to(msg, reply, droppable=True)
+
+async def _sticker_reply_async(msg, emoji, prompt):
+    reply = await async_ai.chat_reply(prompt)
+    if reply == CHAT_ERROR_REPLY:
+        reply = _sticker_fallback(emoji)
+    else:
+        sticker_bank.add(emoji, reply)
+    await asyncio.get_running_loop().run_in_executor(None, _sticker_send_reply, msg, reply)
 
 # =============== GIF ==================
-@bot.message_handler(content_types=["animation"])
+@router.message_handler(content_types=["animation"])
 def gif(msg: types.Message):
-    bot.reply_to(msg, "😂🔥 Cool GIF!")
+    outbound.reply_to(msg, "😂🔥 Cool GIF!")
 
 # =============== WELCOME + GOODBYE ==================
 WELCOME_MSG = "🌸 Hey {name}, welcome to {chat}! 💖 Butki family me swagat hai 🎉"
 GOODBYE_MSG = "👋 Bye {name}, hope to see you again in {chat}! 💫"
 
-@bot.message_handler(content_types=["new_chat_members"])
+@router.message_handler(content_types=["new_chat_members"])
 def welcome(msg: types.Message):
     for user in msg.new_chat_members:
         try:
             text = WELCOME_MSG.format(name=user.first_name, chat=msg.chat.title)
-            bot.send_message(msg.chat.id, text)
+            outbound.send_message(msg.chat.id, text)
         except Exception as e:
             logger.error(f"Welcome error: {e}")
 
-@bot.message_handler(content_types=["left_chat_member"])
+@router.message_handler(content_types=["left_chat_member"])
 def goodbye(msg: types.Message):
     user = msg.left_chat_member
     try:
         text = GOODBYE_MSG.format(name=user.first_name, chat=msg.chat.title)
-        bot.send_message(msg.chat.id, text)
+        outbound.send_message(msg.chat.id, text)
     except Exception as e:
         logger.error(f"Goodbye error: {e}")
 
 # =============== SCHEDULE COMMAND (owner) ==================
-@bot.message_handler(commands=["schedule"])
+@router.message_handler(commands=["schedule"])
 def schedule(msg):
     if msg.from_user.id != OWNER_ID:
         return
     parts = msg.text.split(" ", 4)
     if len(parts) < 4 and not msg.reply_to_message:
-        return bot.reply_to(msg, "Usage: /schedule YYYY-MM-DD HH:MM <recurring> message (or reply to media with caption)")
+        return outbound.reply_to(msg, "Usage: /schedule YYYY-MM-DD HH:MM <recurring> message (or reply to media with caption)")
     try:
         _, d, t, r = parts[:4]
         payload = parts[4] if len(parts) > 4 else ""
@@ -876,20 +1257,91 @@ def schedule(msg):
             db.add_schedule(jobid, payload, media, run_time, r)
         except Exception:
             logger.debug("db.add_schedule not available or failed.")
-        bot.reply_to(msg, f"✅ Scheduled {run_time} recurring={r} jobid={jobid}")
+        outbound.reply_to(msg, f"✅ Scheduled {run_time} recurring={r} jobid={jobid}")
     except Exception as e:
         logger.exception("Schedule command error:")
-        bot.reply_to(msg, f"⚠️ Failed to schedule: {e}")
-
-# =============== RESTORE SCHEDULES ==================
-try:
-    scheduler.restore_jobs_from_db()
-except Exception as e:
-    logger.error("Failed to restore scheduler jobs: %s", e)
+        outbound.reply_to(msg, f"⚠️ Failed to schedule: {e}")
+
+# =============== METRICS ==================
+HANDLER_SECONDS = metrics.histogram("bot_handler_seconds", "Update handler latency", ["handler"])
+HANDLER_ERRORS = metrics.counter("bot_handler_errors_total", "Exceptions escaping update handlers", ["handler"])
+# wrap every registered handler once, now that all of them exist
+router.wrap(metrics.timed(HANDLER_SECONDS, HANDLER_ERRORS))
+
+# =============== PRIORITY DISPATCH ==================
+def update_priority(update: types.Update) -> int:
+    """Admin commands/callbacks first, then anything addressed to the bot, then group chatter."""
+    cq = update.callback_query
+    if cq:
+        return ADMIN if is_admin(cq.from_user.id) else DIRECT
+    msg = update.message
+    if msg is None:
+        return DIRECT
+    uid = msg.from_user.id if msg.from_user else None
+    command = (msg.text or "").startswith("/")
+    if uid and is_admin(uid) and (command or (msg.chat.type == "private" and uid in broadcast_sessions)):
+        return ADMIN
+    if command or is_addressed_to_bot(msg):
+        return DIRECT
+    return AMBIENT
+
+dispatcher = PriorityDispatcher(
+    bot, update_priority, process=router.process_new_updates,
+    workers=(
+        int(os.getenv("ADMIN_WORKERS") or CONFIG.get("ADMIN_WORKERS", 2)),
+        int(os.getenv("DIRECT_WORKERS") or CONFIG.get("DIRECT_WORKERS", 4)),
+        BOT_NUM_THREADS,
+    ),
+    shed_age=_cfg_float("AMBIENT_SHED_AGE", 20),
+    max_ambient=int(os.getenv("AMBIENT_MAX_PENDING") or CONFIG.get("AMBIENT_MAX_PENDING", 500)),
+).install()
+
+# optional Prometheus scrape endpoint (local only unless METRICS_HOST says otherwise)
+METRICS_PORT = int(os.getenv("METRICS_PORT") or CONFIG.get("METRICS_PORT", 0))
+if METRICS_PORT and IS_SHARD_WORKER:
+    # shard N scrapes on METRICS_PORT + N + 1
+    METRICS_PORT += int(SHARD_INDEX) + 1
+
+def _start_metrics():
+    if METRICS_PORT:
+        metrics.serve(METRICS_PORT, host=os.getenv("METRICS_HOST") or CONFIG.get("METRICS_HOST", "127.0.0.1"))
+
+boot.mark("handlers")
+
+# =============== STARTUP ==================
+def _start_workers():
+    """Background threads of the helpers above; import only constructs them."""
+    for part in (outbound, image_queue, dispatcher, runner, coalescer, sticker_bank):
+        if part:
+            part.start()
+    if memory is not db:
+        memory.start()
+
+def startup(warm=True):
+    """Everything import leaves out (disk, network, background jobs), independent parts in parallel.
+
+    ``warm=False`` (--profile-startup) skips pre-generating sticker replies.
+    """
+    with boot.phase("workers"):
+        _start_workers()
+    # never blocks startup: a restart while Telegram is unreachable still comes up
+    retry_in_background(refresh_bot_info, "bot-identity")
+    phases = {"scheduler": _start_scheduler, "metrics": _start_metrics, "db": db.get_groups}
+    if not IS_SHARD_WORKER:
+        phases["admins"] = _seed_admins
+        if compactor:
+            phases["compactor"] = compactor.start
+    boot.parallel(**phases)
+    if sticker_bank and warm:
+        sticker_bank.warm(STICKER_WARM_EMOJIS)
 
 # =============== RUN ==================
-if __name__ == "__main__":
-    print("Bot running v3...")
+def run_polling():
+    try:
+        # getUpdates is refused while a webhook is set (e.g. after running in webhook mode)
+        bot.remove_webhook()
+    except Exception as e:
+        logger.warning("remove_webhook failed: %s", e)
     backoff = 1
     while True:
         try:
@@ -898,3 +1350,94 @@ if __name__ == "__main__":
             logger.exception(f"⚠️ Polling crashed: {e}, restarting in {backoff}s...")
             time.sleep(backoff)
             backoff = min(backoff * 2, 60)
+
+def run_webhook(sink=None):
+    if not WEBHOOK_URL:
+        raise ValueError("❌ WEBHOOK_URL is required in webhook mode")
+    # derived from the bot token when unset, so every instance agrees without extra config
+    secret = WEBHOOK_SECRET or hashlib.sha256(TELEGRAM_TOKEN.encode("utf-8")).hexdigest()
+    server = WebhookServer(bot, secret, path=WEBHOOK_PATH, port=PORT, sink=sink,
+                           max_pending=int(os.getenv("WEBHOOK_MAX_PENDING") or CONFIG.get("WEBHOOK_MAX_PENDING", 1000)))
+    bot.set_webhook(url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH, secret_token=secret,
+                    max_connections=int(os.getenv("WEBHOOK_MAX_CONNECTIONS") or CONFIG.get("WEBHOOK_MAX_CONNECTIONS", 40)))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+def run_shard_worker(index, updates):
+    """Entry point of a shard process: handle the raw updates routed to it, in order."""
+    startup()
+    logger.info("Shard %d ready", index)
+    while True:
+        update = updates.get()
+        if update is None:
+            break
+        try:
+            bot.process_new_updates([types.Update.de_json(update)])
+        except Exception as e:
+            logger.error("Shard %d failed on update: %s", index, e)
+
+def _poll_raw(sink):
+    """getUpdates loop that hands raw update dicts to ``sink`` (no parsing here)."""
+    offset = None
+    backoff = 1
+    while True:
+        try:
+            updates = apihelper.get_updates(TELEGRAM_TOKEN, offset=offset, timeout=60, long_polling_timeout=20)
+            backoff = 1
+        except Exception as e:
+            logger.error(f"⚠️ getUpdates failed: {e}, retrying in {backoff}s...")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+            continue
+        for update in updates:
+            offset = update["update_id"] + 1
+            sink(update)
+
+def run_sharded(mode):
+    router = ShardRouter(run_shard_worker, BOT_WORKERS,
+                         max_pending=int(os.getenv("SHARD_MAX_PENDING") or CONFIG.get("SHARD_MAX_PENDING", 10000)))
+    try:
+        if mode == "webhook":
+            run_webhook(sink=router.route)
+        else:
+            try:
+                bot.remove_webhook()
+            except Exception as e:
+                logger.warning("remove_webhook failed: %s", e)
+            _poll_raw(router.route)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        router.stop()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ultra-Pro Telegram AI Bot v3")
+    parser.add_argument("--mode", choices=["polling", "webhook"], default=BOT_MODE,
+                        help="update ingestion (default: BOT_MODE from env/config)")
+    parser.add_argument("--workers", type=int, default=BOT_WORKERS,
+                        help="handler processes; >1 shards updates by chat_id (default: BOT_WORKERS)")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="run the startup phases, print time per phase and exit")
+    parser.add_argument("--vacuum", action="store_true",
+                        help="one-off: convert memory.db to incremental auto-vacuum (full VACUUM, "
+                             "run with the bot stopped) and exit")
+    args = parser.parse_args(sys.argv[1:])
+    if args.vacuum:
+        db.enable_incremental_vacuum()
+        print("memory.db: incremental auto-vacuum enabled")
+        sys.exit(0)
+    # Heroku stops dynos with SIGTERM, whose default action skips atexit (the memory flush)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    startup(warm=not args.profile_startup)
+    if args.profile_startup:
+        print(boot.report())
+        sys.exit(0)
+    print(f"Bot running v3 ({args.mode}, {BOT_WORKERS} worker{'s' if SHARDED else ''})...")
+    if SHARDED:
+        run_sharded(args.mode)
+    elif args.mode == "webhook":
+        run_webhook()
+    else:
+        run_polling()
@@ -1,74 +1,389 @@
+import time
 import requests
 import logging
 import json
+import asyncio
 from io import BytesIO
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import metrics
+from utils.resilience import ModelChain
+
+# optional: only needed for AsyncAIHelper (ASYNC_MODE), so imported there
+# rather than here (it is the slowest import of the bot)
+aiohttp = None
+
+
+def _import_aiohttp():
+    global aiohttp
+    if aiohttp is None:
+        import aiohttp as module
+        aiohttp = module
+    return aiohttp
 
 logger = logging.getLogger(__name__)
 
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+HF_BASE_URL = "https://api-inference.huggingface.co/models"
+DEFAULT_CHAT_MODEL = "openai/gpt-3.5-turbo"
+DEFAULT_IMAGE_MODEL = "stabilityai/stable-diffusion-xl-base-1.0"
+CHAT_ERROR_REPLY = "⚠️ Sorry, AI se baat nahi ho paayi."
+
+AI_SECONDS = metrics.histogram("ai_request_seconds", "Upstream AI call latency", ["kind", "model", "status"])
+
+
+def _error_status(e):
+    """Metric label for a failed upstream call: HTTP status, 'timeout' or 'error'."""
+    code = getattr(getattr(e, "response", None), "status_code", None) or getattr(e, "status", None)
+    if code:
+        return str(code)
+    if isinstance(e, (requests.Timeout, asyncio.TimeoutError)):
+        return "timeout"
+    return "error"
+
+
+def build_chat_payload(prompt, history=None, model=DEFAULT_CHAT_MODEL, system=None):
+    messages = []
+    if system:
+        messages.append({"role": "system", "content": system})
+    # Agar history hai to usko add karo
+    if history:
+        for h in history:
+            messages.append({"role": h["role"], "content": h["content"]})
+    messages.append({"role": "user", "content": prompt})
+    return {
+        "model": model,
+        "messages": messages,
+        "temperature": 0.8,
+        "max_tokens": 500
+    }
+
+
+def _make_session(pool_size):
+    """Keep-alive session with a ``pool_size``-connection pool."""
+    s = requests.Session()
+    # connect retries only: a POST that reached the server is never replayed here
+    retry = Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.2)
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=retry, pool_block=False)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+
 class AIHelper:
-    def __init__(self, openai_api_key=None, hf_api_key=None, base_url="https://openrouter.ai/api/v1"):
+    def __init__(self, openai_api_key=None, hf_api_key=None, base_url=OPENROUTER_BASE_URL,
+                 pool_size=10, connect_timeout=5, chat_timeout=30, image_timeout=60, hf_base_url=HF_BASE_URL,
+                 chat_models=None, image_models=None, hedge=True):
         self.openai_api_key = openai_api_key
         self.hf_api_key = hf_api_key
         self.base_url = base_url
+        self.hf_base_url = hf_base_url
+        self.connect_timeout = connect_timeout
+        self.chat_timeout = chat_timeout
+        self.image_timeout = image_timeout
+        # upstream calls run here so a slow model can be hedged with the next one
+        workers = pool_size * 2
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ai-upstream")
+        # one pooled session per upstream so TCP+TLS handshakes are reused; sized so
+        # every executor thread plus the handler threads streaming directly keep their
+        # connection (urllib3 discards connections returned to a full pool)
+        self.sessions = {
+            "openrouter": _make_session(workers + pool_size),
+            "huggingface": _make_session(workers),
+        }
+        self.chat_chain = ModelChain("chat", chat_models or [DEFAULT_CHAT_MODEL], self.executor,
+                                     hedge_min=1.0, hedge_max=chat_timeout / 2, hedge=hedge)
+        self.image_chain = ModelChain("image", image_models or [DEFAULT_IMAGE_MODEL], self.executor,
+                                      hedge_min=5.0, hedge_max=image_timeout / 2, hedge=hedge)
+
+    def _post(self, upstream, url, read_timeout, **kwargs):
+        # no replay here: connect-phase failures are retried by the adapter
+        # (see _make_session) and urllib3 swaps out a pooled socket it finds
+        # closed before sending; a reset mid-request may have reached the
+        # server, so it fails over through the model chain instead
+        return self.sessions[upstream].post(url, timeout=(self.connect_timeout, read_timeout), **kwargs)
+
+    def pool_stats(self):
+        """Per-upstream connection reuse: requests sent vs. new connections opened."""
+        stats = {}
+        for name, session in self.sessions.items():
+            requests_sent = connections = idle = 0
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in list(pools.keys()):
+                    pool = pools.get(key)
+                    if pool is None:
+                        continue
+                    requests_sent += pool.num_requests
+                    connections += pool.num_connections
+                    if pool.pool is not None:
+                        idle += sum(1 for c in list(pool.pool.queue) if c is not None)
+            stats[name] = {
+                "requests": requests_sent,
+                "connections": connections,
+                "idle_open": idle,
+                "reuse_ratio": round(1 - connections / requests_sent, 3) if requests_sent else 0.0,
+            }
+        return stats
 
     # ========== TEXT CHAT (OpenRouter) ==========
-    def chat_reply(self, prompt, history=None, model="openai/gpt-3.5-turbo"):
+    def chat_reply(self, prompt, history=None, model=None, system=None):
+        """Reply text; with no explicit ``model`` the configured chain is used
+        (hedging, fallback and circuit breakers, see utils/resilience.py)."""
         try:
-            url = f"{self.base_url}/chat/completions"
-            headers = {
-                "Authorization": f"Bearer {self.openai_api_key}",
-                "Content-Type": "application/json"
-            }
+            if model:
+                return self._chat_once(model, prompt, history, system)
+            return self.chat_chain.call(lambda m: self._chat_once(m, prompt, history, system))
+        except Exception as e:
+            logger.error(f"OpenRouter error: {e}")
+            return CHAT_ERROR_REPLY
 
-            # Agar history hai to usko add karo
-            messages = []
-            if history:
-                for h in history:
-                    messages.append({"role": h["role"], "content": h["content"]})
-            messages.append({"role": "user", "content": prompt})
-
-            data = {
-                "model": model,
-                "messages": messages,
-                "temperature": 0.8,
-                "max_tokens": 500
-            }
+    def _chat_once(self, model, prompt, history, system):
+        url = f"{self.base_url}/chat/completions"
+        headers = {
+            "Authorization": f"Bearer {self.openai_api_key}",
+            "Content-Type": "application/json"
+        }
+        data = build_chat_payload(prompt, history, model, system)
 
-            logger.info(f"Sending prompt to OpenRouter model={model}: {prompt[:100]}...")
+        logger.info(f"Sending prompt to OpenRouter model={model}: {prompt[:100]}...")
 
-            resp = requests.post(url, headers=headers, json=data, timeout=30)
+        t0 = time.perf_counter()
+        try:
+            resp = self._post("openrouter", url, self.chat_timeout, headers=headers, json=data)
             resp.raise_for_status()
             j = resp.json()
-            return j["choices"][0]["message"]["content"]
+        except Exception as e:
+            AI_SECONDS.labels("chat", model, _error_status(e)).observe(time.perf_counter() - t0)
+            raise
+        AI_SECONDS.labels("chat", model, "ok").observe(time.perf_counter() - t0)
+        usage = j.get("usage") or {}
+        if usage:
+            logger.info(f"OpenRouter usage model={model}: prompt_tokens={usage.get('prompt_tokens')} "
+                        f"completion_tokens={usage.get('completion_tokens')}")
+        return j["choices"][0]["message"]["content"]
+
+    def chat_reply_stream(self, prompt, history=None, model=None, system=None):
+        """Yield reply text pieces as OpenRouter streams them (SSE).
 
+        Streams can't be hedged, but they do fail over: models are tried in
+        chain order until one yields its first piece, and each attempt's
+        outcome feeds the chain's breakers and latency. Once text has been
+        yielded a failure just ends the reply.
+        """
+        models = [model] if model else self.chat_chain.order()
+        for m in models:
+            if not model and not self.chat_chain.breakers[m].allow():
+                continue
+            got_any = False
+            t0 = time.monotonic()
+            try:
+                for delta in self._stream_once(m, prompt, history, system):
+                    got_any = True
+                    yield delta
+            except GeneratorExit:
+                # the reader stopped early: says nothing about the model
+                if not model:
+                    self.chat_chain.breakers[m].release()
+                raise
+            except Exception as e:
+                logger.error(f"OpenRouter stream error model={m}: {e}")
+                if not model:
+                    self.chat_chain.record(m, time.monotonic() - t0, False)
+                if got_any:
+                    return
+                continue
+            if not model:
+                self.chat_chain.record(m, time.monotonic() - t0, True)
+            return
+        yield CHAT_ERROR_REPLY
+
+    def _stream_once(self, model, prompt, history, system):
+        url = f"{self.base_url}/chat/completions"
+        headers = {
+            "Authorization": f"Bearer {self.openai_api_key}",
+            "Content-Type": "application/json"
+        }
+        data = build_chat_payload(prompt, history, model, system)
+        data["stream"] = True
+
+        logger.info(f"Streaming prompt to OpenRouter model={model}: {prompt[:100]}...")
+
+        status = "ok"
+        t0 = time.perf_counter()
+        try:
+            with self._post("openrouter", url, self.chat_timeout, headers=headers, json=data, stream=True) as resp:
+                resp.raise_for_status()
+                for line in resp.iter_lines(decode_unicode=True):
+                    # SSE: "data: {...}" events, ": comment" keep-alives, "data: [DONE]" at the end
+                    if not line or not line.startswith("data:"):
+                        continue
+                    chunk = line[5:].strip()
+                    if chunk == "[DONE]":
+                        break
+                    delta = (json.loads(chunk).get("choices") or [{}])[0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
         except Exception as e:
-            logger.error(f"OpenRouter error: {e}")
-            return "⚠️ Sorry, AI se baat nahi ho paayi."
+            status = _error_status(e)
+            raise
+        finally:
+            AI_SECONDS.labels("chat_stream", model, status).observe(time.perf_counter() - t0)
 
     # ========== IMAGE GENERATION (HuggingFace) ==========
-    def generate_image(self, prompt, model="stabilityai/stable-diffusion-xl-base-1.0"):
+    def generate_image(self, prompt, model=None):
         if not self.hf_api_key:
             return None, "⚠️ HuggingFace API key missing."
 
         try:
-            url = f"https://api-inference.huggingface.co/models/{model}"
-            headers = {
-                "Authorization": f"Bearer {self.hf_api_key}",
-                "Content-Type": "application/json"
-            }
-            payload = {"inputs": prompt}
+            if model:
+                return self._image_once(model, prompt), None
+            return self.image_chain.call(lambda m: self._image_once(m, prompt)), None
+        except Exception as e:
+            logger.error(f"HF error: {e}")
+            return None, f"⚠️ HF error: {e}"
 
-            logger.info(f"HF request sent to {url} with prompt: {prompt}")
+    def _image_once(self, model, prompt):
+        url = f"{self.hf_base_url}/{model}"
+        headers = {
+            "Authorization": f"Bearer {self.hf_api_key}",
+            "Content-Type": "application/json"
+        }
+        payload = {"inputs": prompt}
 
-            resp = requests.post(url, headers=headers, data=json.dumps(payload), timeout=60)
+        logger.info(f"HF request sent to {url} with prompt: {prompt}")
 
-            if resp.status_code == 200:
-                logger.info("HF image generation success ✅")
-                return BytesIO(resp.content), None   # ab bot.send_photo ke liye ready hai
-            else:
-                logger.error(f"HF error {resp.status_code}: {resp.text}")
-                return None, f"⚠️ HF error: {resp.status_code}"
+        t0 = time.perf_counter()
+        try:
+            resp = self._post("huggingface", url, self.image_timeout, headers=headers, data=json.dumps(payload))
+        except Exception as e:
+            AI_SECONDS.labels("image", model, _error_status(e)).observe(time.perf_counter() - t0)
+            raise
+        AI_SECONDS.labels("image", model, "ok" if resp.status_code == 200 else str(resp.status_code)).observe(
+            time.perf_counter() - t0)
+
+        if resp.status_code != 200:
+            logger.error(f"HF error {resp.status_code} model={model}: {resp.text[:300]}")
+            raise RuntimeError(f"HF {model} returned {resp.status_code}")
+        logger.info("HF image generation success ✅")
+        return BytesIO(resp.content)   # ab bot.send_photo ke liye ready hai
+
+    def model_stats(self):
+        return {"chat": self.chat_chain.stats(), "image": self.image_chain.stats()}
+
+
+class AsyncAIHelper:
+    """asyncio twin of AIHelper (same chat_reply/generate_image API, awaitable).
+
+    Uses one aiohttp session per upstream and a semaphore per upstream, so a
+    single event loop can keep thousands of AI calls in flight without
+    holding a thread each. Calls go through the same kind of ModelChain
+    (fallback, hedging, circuit breakers) as the sync helper.
+    """
+
+    def __init__(self, openai_api_key=None, hf_api_key=None, base_url=OPENROUTER_BASE_URL,
+                 max_chat_inflight=500, max_image_inflight=16, connect_timeout=5, chat_timeout=30,
+                 image_timeout=60, hf_base_url=HF_BASE_URL, chat_models=None, image_models=None, hedge=True):
+        try:
+            _import_aiohttp()
+        except ImportError:
+            raise RuntimeError("aiohttp is required for AsyncAIHelper")
+        self.openai_api_key = openai_api_key
+        self.hf_api_key = hf_api_key
+        self.base_url = base_url
+        self.hf_base_url = hf_base_url
+        self.connect_timeout = connect_timeout
+        self.chat_timeout = chat_timeout
+        self.image_timeout = image_timeout
+        self.limits = {
+            "openrouter": asyncio.Semaphore(max_chat_inflight),
+            "huggingface": asyncio.Semaphore(max_image_inflight),
+        }
+        self.sessions = {}
+        self.chat_chain = ModelChain("chat", chat_models or [DEFAULT_CHAT_MODEL], None,
+                                     hedge_min=1.0, hedge_max=chat_timeout / 2, hedge=hedge)
+        self.image_chain = ModelChain("image", image_models or [DEFAULT_IMAGE_MODEL], None,
+                                      hedge_min=5.0, hedge_max=image_timeout / 2, hedge=hedge)
+
+    def _session(self, upstream):
+        # created lazily: aiohttp sessions must be made inside the running loop
+        s = self.sessions.get(upstream)
+        if s is None or s.closed:
+            s = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0, keepalive_timeout=60))
+            self.sessions[upstream] = s
+        return s
+
+    def _timeout(self, read_timeout):
+        return aiohttp.ClientTimeout(sock_connect=self.connect_timeout, total=read_timeout)
+
+    async def close(self):
+        for s in self.sessions.values():
+            await s.close()
+        self.sessions = {}
+
+    # ========== TEXT CHAT (OpenRouter) ==========
+    async def chat_reply(self, prompt, history=None, model=None, system=None):
+        try:
+            if model:
+                return await self._chat_once(model, prompt, history, system)
+            return await self.chat_chain.acall(lambda m: self._chat_once(m, prompt, history, system))
+        except Exception as e:
+            logger.error(f"OpenRouter error (async): {e}")
+            return CHAT_ERROR_REPLY
 
+    async def _chat_once(self, model, prompt, history, system):
+        t0 = time.perf_counter()
+        try:
+            url = f"{self.base_url}/chat/completions"
+            headers = {"Authorization": f"Bearer {self.openai_api_key}"}
+            data = build_chat_payload(prompt, history, model, system)
+            logger.info(f"Sending prompt to OpenRouter (async) model={model}: {prompt[:100]}...")
+            async with self.limits["openrouter"]:
+                async with self._session("openrouter").post(
+                        url, headers=headers, json=data, timeout=self._timeout(self.chat_timeout)) as resp:
+                    resp.raise_for_status()
+                    j = await resp.json(content_type=None)
         except Exception as e:
-            logger.error(f"HF error: {e}")
-            return None, f"⚠️ HF exception: {e}"
+            AI_SECONDS.labels("chat", model, _error_status(e)).observe(time.perf_counter() - t0)
+            raise
+        AI_SECONDS.labels("chat", model, "ok").observe(time.perf_counter() - t0)
+        return j["choices"][0]["message"]["content"]
+
+    # ========== IMAGE GENERATION (HuggingFace) ==========
+    async def generate_image(self, prompt, model=None):
+        if not self.hf_api_key:
+            return None, "⚠️ HuggingFace API key missing."
+        try:
+            if model:
+                return await self._image_once(model, prompt), None
+            return await self.image_chain.acall(lambda m: self._image_once(m, prompt)), None
+        except Exception as e:
+            logger.error(f"HF error (async): {e}")
+            return None, f"⚠️ HF error: {e}"
+
+    async def _image_once(self, model, prompt):
+        t0 = time.perf_counter()
+        try:
+            url = f"{self.hf_base_url}/{model}"
+            headers = {"Authorization": f"Bearer {self.hf_api_key}"}
+            logger.info(f"HF request (async) sent to {url} with prompt: {prompt}")
+            async with self.limits["huggingface"]:
+                async with self._session("huggingface").post(
+                        url, headers=headers, json={"inputs": prompt},
+                        timeout=self._timeout(self.image_timeout)) as resp:
+                    body = await resp.read()
+                    status = resp.status
+        except Exception as e:
+            AI_SECONDS.labels("image", model, _error_status(e)).observe(time.perf_counter() - t0)
+            raise
+        AI_SECONDS.labels("image", model, "ok" if status == 200 else str(status)).observe(time.perf_counter() - t0)
+        if status != 200:
+            logger.error(f"HF error {status} model={model}: {body[:300]!r}")
+            raise RuntimeError(f"HF {model} returned {status}")
+        logger.info("HF image generation success ✅")
+        return BytesIO(body)
+
+    def model_stats(self):
+        return {"chat": self.chat_chain.stats(), "image": self.image_chain.stats()}
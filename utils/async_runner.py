@@ -0,0 +1,46 @@
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRunner:
+    """Runs one asyncio event loop in a background thread.
+
+    Sync telebot handlers hand their slow AI work over with ``submit`` and
+    return straight away, so the handler pool is never held by upstream I/O.
+    """
+
+    def __init__(self, name="async-runner"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+
+    def start(self):
+        """Start the loop thread; coroutines submitted before this wait for it."""
+        self._thread.start()
+        return self
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro):
+        """Schedule ``coro`` on the loop; returns a concurrent.futures.Future."""
+        fut = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        fut.add_done_callback(self._log_error)
+        return fut
+
+    def run(self, coro, timeout=None):
+        """Run ``coro`` on the loop and block the calling thread for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        if self._thread.is_alive():
+            self._thread.join(timeout=5)
+
+    @staticmethod
+    def _log_error(fut):
+        if not fut.cancelled() and fut.exception() is not None:
+            logger.error("Async task failed: %s", fut.exception())
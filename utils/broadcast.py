@@ -0,0 +1,271 @@
+import time
+import queue
+import logging
+import threading
+
+from utils.ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+def get_retry_after(e):
+    """Return Telegram's retry_after (seconds) for a 429 error, else None."""
+    if getattr(e, "error_code", None) != 429:
+        return None
+    try:
+        return float((e.result_json or {}).get("parameters", {}).get("retry_after", 1))
+    except Exception:
+        return 1.0
+
+
+# 400 descriptions meaning the chat is gone for good (403 always is)
+DEAD_CHAT_ERRORS = ("chat not found", "bot was kicked", "bot is not a member", "group chat was deactivated",
+                    "chat was deleted", "user is deactivated", "peer_id_invalid")
+
+
+def get_migrate_to(e):
+    """New chat id when a group was upgraded to a supergroup, else None."""
+    try:
+        return (e.result_json or {}).get("parameters", {}).get("migrate_to_chat_id")
+    except Exception:
+        return None
+
+
+def is_dead_chat(e):
+    code = getattr(e, "error_code", None)
+    if code == 403:
+        return True
+    if code != 400:
+        return False
+    description = str(getattr(e, "description", None) or e).lower()
+    return any(s in description for s in DEAD_CHAT_ERRORS)
+
+
+class BroadcastEngine:
+    """Sends one message to many chats off the handler thread.
+
+    A global token bucket keeps us under Telegram's ~30 msg/s bot limit, a
+    small worker pool does the sending, every chat is paced to 1 msg/s and
+    a 429 ``retry_after`` pauses all workers. Progress is edited live into
+    one message in the admin's DM.
+
+    With a ``ledger`` (utils.db.Database) every target gets a delivery row
+    (sent / failed / dead / migrated, with the error code), flushed in
+    batches on each progress tick. Chats that are gone for good (403,
+    "chat not found", ...) are deactivated so later broadcasts skip them,
+    and a group upgraded to a supergroup is rewritten to its new id and
+    sent to there.
+    """
+
+    def __init__(self, bot, rate=28, workers=4, per_chat_interval=1.0,
+                 progress_interval=2.0, max_retries=3, ledger=None):
+        self.bot = bot
+        self.ledger = ledger
+        self.bucket = TokenBucket(rate, capacity=rate)
+        self.workers = workers
+        self.per_chat_interval = per_chat_interval
+        self.progress_interval = progress_interval
+        self.max_retries = max_retries
+        self._pause_until = 0.0
+        self._chat_last = {}
+        self._lock = threading.Lock()
+
+    def start(self, admin_id, targets, send_fn, label="broadcast"):
+        """Run ``send_fn(chat_id)`` for every target in a background thread.
+
+        Progress goes to ``admin_id``'s DM; pass None for a silent run.
+        """
+        t = threading.Thread(target=self._run, args=(admin_id, list(targets), send_fn, label),
+                             name=f"broadcast-{admin_id}", daemon=True)
+        t.start()
+        return t
+
+    # ========== INTERNALS ==========
+    def _run(self, admin_id, targets, send_fn, label):
+        state = {"sent": 0, "failed": 0, "pruned": 0, "total": len(targets)}
+        started = time.monotonic()
+        ledger = None
+        if self.ledger:
+            try:
+                ledger = _Ledger(self.ledger, label, len(targets))
+            except Exception as e:
+                logger.error("Broadcast ledger unavailable, sending without it: %s", e)
+        progress_id = None
+        if admin_id:
+            try:
+                m = self.bot.send_message(admin_id, self._progress_text(label, state))
+                progress_id = getattr(m, "message_id", None)
+            except Exception as e:
+                logger.warning("Broadcast progress message failed: %s", e)
+
+        jobs = queue.Queue()
+        for gid in targets:
+            jobs.put(gid)
+        threads = [
+            threading.Thread(target=self._worker, args=(jobs, send_fn, state, ledger), daemon=True)
+            for _ in range(min(self.workers, max(1, len(targets))))
+        ]
+        for t in threads:
+            t.start()
+
+        last_text = None
+        while any(t.is_alive() for t in threads):
+            for t in threads:
+                t.join(timeout=self.progress_interval / len(threads))
+            if ledger:
+                ledger.flush()
+            text = self._progress_text(label, state)
+            if progress_id and text != last_text:
+                last_text = text
+                self._edit(admin_id, progress_id, text)
+
+        self._prune_chat_last()
+        if ledger:
+            ledger.flush()
+            ledger.finish(state)
+        took = time.monotonic() - started
+        final = self._progress_text(label, state, done=True) + f"\n⏱ {took:.1f}s"
+        if ledger:
+            final += ledger.summary()
+        logger.info("Broadcast %s done: %s in %.1fs", label, state, took)
+        if progress_id:
+            self._edit(admin_id, progress_id, final)
+        elif admin_id:
+            try:
+                self.bot.send_message(admin_id, final)
+            except Exception:
+                pass
+
+    def _worker(self, jobs, send_fn, state, ledger):
+        while True:
+            try:
+                gid = jobs.get_nowait()
+            except queue.Empty:
+                return
+            ok, dead = self._send_one(gid, send_fn, ledger)
+            with self._lock:
+                state["sent" if ok else "failed"] += 1
+                if dead:
+                    state["pruned"] += 1
+
+    def _send_one(self, gid, send_fn, ledger=None):
+        """Returns (sent, chat_is_dead); records the outcome in ``ledger``."""
+        error = None
+        for _ in range(self.max_retries + 1):
+            self._wait_turn(gid)
+            try:
+                send_fn(gid)
+                if ledger:
+                    ledger.record(gid, "sent")
+                return True, False
+            except Exception as e:
+                error = e
+                new_id = get_migrate_to(e)
+                if new_id and ledger:
+                    logger.info("Broadcast: group %s migrated to %s", gid, new_id)
+                    ledger.record(gid, "migrated", e)
+                    ledger.migrate(gid, new_id)
+                    gid = new_id
+                    continue
+                retry_after = get_retry_after(e)
+                if retry_after is None:
+                    dead = is_dead_chat(e)
+                    logger.warning("Broadcast failed to %s: %s%s", gid, e, " (deactivated)" if dead and ledger else "")
+                    if ledger:
+                        ledger.record(gid, "dead" if dead else "failed", e)
+                    return False, dead and ledger is not None
+                logger.info("Broadcast hit 429, pausing %.1fs", retry_after)
+                with self._lock:
+                    self._pause_until = max(self._pause_until, time.monotonic() + retry_after)
+        logger.warning("Broadcast gave up on %s after %d retries", gid, self.max_retries)
+        if ledger:
+            ledger.record(gid, "failed", error)
+        return False, False
+
+    def _wait_turn(self, gid):
+        while True:
+            now = time.monotonic()
+            with self._lock:
+                wait = max(self._pause_until, self._chat_last.get(gid, 0.0) + self.per_chat_interval) - now
+                if wait <= 0:
+                    self._chat_last[gid] = now
+                    break
+            time.sleep(wait)
+        self.bucket.acquire()
+
+    def _prune_chat_last(self):
+        cutoff = time.monotonic() - self.per_chat_interval
+        with self._lock:
+            for gid in [g for g, t in self._chat_last.items() if t < cutoff]:
+                del self._chat_last[gid]
+
+    def _edit(self, chat_id, message_id, text):
+        try:
+            self.bot.edit_message_text(text, chat_id, message_id)
+        except Exception as e:
+            logger.debug("Broadcast progress edit failed: %s", e)
+
+    @staticmethod
+    def _progress_text(label, state, done=False):
+        remaining = state["total"] - state["sent"] - state["failed"]
+        head = f"✅ {label} finished" if done else f"📢 {label} in progress..."
+        text = f"{head}\nSent: {state['sent']}\nFailed: {state['failed']}\nRemaining: {remaining}"
+        if state.get("pruned"):
+            text += f"\nRemoved dead chats: {state['pruned']}"
+        return text
+
+
+class _Ledger:
+    """Delivery rows and dead chats of one broadcast, buffered by the workers
+    and written in batches by the broadcast's own thread (flush)."""
+
+    def __init__(self, db, label, total):
+        self.db = db
+        self.id = db.start_broadcast(label, total)
+        self._rows = []
+        self._dead = []
+        self._lock = threading.Lock()
+
+    def record(self, chat_id, status, error=None):
+        row = (self.id, chat_id, status, getattr(error, "error_code", None),
+               str(error)[:300] if error is not None else None, time.time())
+        with self._lock:
+            self._rows.append(row)
+            if status == "dead":
+                self._dead.append(chat_id)
+
+    def migrate(self, old, new):
+        try:
+            self.db.migrate_group(old, new)
+        except Exception as e:
+            logger.error("Broadcast ledger: migrating %s -> %s failed: %s", old, new, e)
+
+    def flush(self):
+        with self._lock:
+            rows, dead = self._rows, self._dead
+            self._rows, self._dead = [], []
+        try:
+            if rows:
+                self.db.add_deliveries(rows)
+            if dead:
+                self.db.deactivate_groups(dead)
+        except Exception as e:
+            logger.error("Broadcast ledger write failed: %s", e)
+
+    def summary(self):
+        """Failure breakdown from the written rows, for the final progress message."""
+        try:
+            rows = [r for r in self.db.delivery_summary(self.id) if r[0] != "sent"]
+        except Exception as e:
+            logger.error("Broadcast ledger read failed: %s", e)
+            return ""
+        if not rows:
+            return ""
+        lines = [f"• {status}{f' ({code})' if code else ''}: {n}" for status, code, n in rows]
+        return f"\nLedger #{self.id}:\n" + "\n".join(lines)
+
+    def finish(self, state):
+        try:
+            self.db.finish_broadcast(self.id, state["sent"], state["failed"])
+        except Exception as e:
+            logger.error("Broadcast ledger write failed: %s", e)
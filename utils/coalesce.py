@@ -0,0 +1,77 @@
+import time
+import heapq
+import logging
+import itertools
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ChatCoalescer:
+    """Per-chat buffer that turns a burst of messages into one callback.
+
+    The first message in a chat opens a ``window``-second window; the buffer
+    is handed to ``on_flush(chat_id, items)`` when the window closes or when
+    ``max_batch`` items have piled up, whichever comes first. One thread
+    keeps every chat's deadline; the callback runs via ``submit(fn, *args)``
+    (default: inline on that thread), so slow callbacks belong on a pool.
+    """
+
+    def __init__(self, on_flush, window=1.5, max_batch=8, submit=None):
+        self.on_flush = on_flush
+        self.window = window
+        self.max_batch = max_batch
+        self.submit = submit or (lambda fn, *args: fn(*args))
+        self._buffers = {}     # chat_id -> (items, token)
+        self._deadlines = []   # heap of (due, token, chat_id)
+        self._tokens = itertools.count()
+        self._cond = threading.Condition()
+
+    def start(self):
+        threading.Thread(target=self._run, name="chat-coalescer", daemon=True).start()
+        return self
+
+    def add(self, chat_id, item):
+        with self._cond:
+            entry = self._buffers.get(chat_id)
+            if entry is None:
+                token = next(self._tokens)
+                entry = self._buffers[chat_id] = ([], token)
+                heapq.heappush(self._deadlines, (time.monotonic() + self.window, token, chat_id))
+                self._cond.notify()
+            entry[0].append(item)
+            full = len(entry[0]) >= self.max_batch
+            if full:
+                del self._buffers[chat_id]
+        if full:
+            self._hand_off(chat_id, entry[0])
+
+    def pending(self):
+        with self._cond:
+            return sum(len(items) for items, _ in self._buffers.values())
+
+    # ========== INTERNALS ==========
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._deadlines:
+                    self._cond.wait()
+                    continue
+                due, token, chat_id = self._deadlines[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                heapq.heappop(self._deadlines)
+                entry = self._buffers.get(chat_id)
+                # a buffer already flushed as full (and maybe reopened) has a new token
+                if entry is None or entry[1] != token:
+                    continue
+                del self._buffers[chat_id]
+            self._hand_off(chat_id, entry[0])
+
+    def _hand_off(self, chat_id, items):
+        try:
+            self.submit(self.on_flush, chat_id, items)
+        except Exception:
+            logger.exception("Coalesced flush failed for chat %s", chat_id)
@@ -0,0 +1,93 @@
+import os
+import time
+import logging
+import threading
+
+from utils.ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class Compactor:
+    """Background job that folds old conversation turns into a rolling summary.
+
+    Every ``interval`` seconds it picks users with more than ``threshold`` raw
+    rows, summarizes everything but the newest ``keep_recent`` turns (at most
+    ``max_fold`` per pass) with ``summarize_fn(previous_summary, rows)``,
+    stores the summary and deletes the folded rows in one transaction, and
+    every ``vacuum_every`` passes runs an incremental VACUUM (a no-op until
+    an older db is converted once with ``main.py --vacuum``). Summaries are
+    rate-limited by their own token bucket and the thread runs niced.
+    """
+
+    def __init__(self, db, summarize_fn, threshold=200, keep_recent=40, max_fold=200,
+                 interval=300.0, summaries_per_minute=6, vacuum_every=12, on_compacted=None):
+        self.db = db
+        self.summarize_fn = summarize_fn
+        self.threshold = threshold
+        self.keep_recent = keep_recent
+        self.max_fold = max_fold
+        self.interval = interval
+        self.vacuum_every = vacuum_every
+        self.on_compacted = on_compacted
+        self.bucket = TokenBucket(summaries_per_minute / 60.0, capacity=1)
+        self._stop = threading.Event()
+        self._passes = 0
+        self._thread = threading.Thread(target=self._run, name="memory-compactor", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def run_once(self):
+        """One compaction pass; returns the number of users compacted."""
+        done = 0
+        for uid in self.db.users_over(self.threshold):
+            if self._stop.is_set():
+                break
+            self.bucket.acquire()
+            if self._compact_user(uid):
+                done += 1
+        self._passes += 1
+        if self.vacuum_every and self._passes % self.vacuum_every == 0:
+            try:
+                self.db.incremental_vacuum()
+            except Exception as e:
+                logger.warning("incremental vacuum failed: %s", e)
+        return done
+
+    def _compact_user(self, uid):
+        rows = self.db.get_old_memory(uid, self.keep_recent, limit=self.max_fold)
+        if not rows:
+            return False
+        previous = self.db.get_summary(uid)
+        try:
+            summary = self.summarize_fn(previous, [(role, content) for _, role, content in rows])
+        except Exception as e:
+            logger.warning("Summarizing memory for %s failed: %s", uid, e)
+            return False
+        if not summary:
+            return False
+        self.db.compact_memory(uid, summary, [r[0] for r in rows])
+        logger.info("Compacted %d memory rows for user %s", len(rows), uid)
+        if self.on_compacted:
+            self.on_compacted(uid, summary)
+        return True
+
+    def _run(self):
+        try:
+            # low priority: on Linux a thread can be niced on its own
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+        except (AttributeError, OSError):
+            pass
+        while not self._stop.wait(self.interval):
+            try:
+                t0 = time.monotonic()
+                n = self.run_once()
+                if n:
+                    logger.info("Memory compaction pass: %d users in %.1fs", n, time.monotonic() - t0)
+            except Exception:
+                logger.exception("Memory compaction pass failed:")
@@ -1,10 +1,304 @@
+import os
+import sqlite3
+import threading
+import time
+import logging
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# Schema: memory is append-only and always read per user newest-first,
+# so (user_id, ts) covers both the chat() read and count_users().
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS groups (
+    chat_id INTEGER PRIMARY KEY,
+    added_at REAL NOT NULL,
+    active INTEGER NOT NULL DEFAULT 1
+);
+CREATE TABLE IF NOT EXISTS memory (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    ts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_memory_user_ts ON memory(user_id, ts);
+CREATE TABLE IF NOT EXISTS memory_summary (
+    user_id TEXT PRIMARY KEY,
+    content TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS schedules (
+    job_id TEXT PRIMARY KEY,
+    payload TEXT,
+    media TEXT,
+    run_time TEXT,
+    recur TEXT,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS broadcasts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    label TEXT,
+    total INTEGER NOT NULL,
+    sent INTEGER,
+    failed INTEGER,
+    started_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS deliveries (
+    broadcast_id INTEGER NOT NULL,
+    chat_id INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    error_code INTEGER,
+    error TEXT,
+    ts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_deliveries_broadcast ON deliveries(broadcast_id);
+"""
+
+# columns added after the first release; ALTERed into older files on open
+MIGRATIONS = [
+    ("groups", "active", "ALTER TABLE groups ADD COLUMN active INTEGER NOT NULL DEFAULT 1"),
+]
+
+# Fixed SQL strings -> sqlite3 keeps them in its per-connection statement cache
+# a message from an inactive group means the bot is back in it
+SQL_ADD_GROUP = ("INSERT INTO groups(chat_id, added_at) VALUES (?, ?) "
+                 "ON CONFLICT(chat_id) DO UPDATE SET active = 1 WHERE active = 0")
+SQL_GET_GROUPS = "SELECT chat_id FROM groups WHERE active = 1 ORDER BY added_at"
+SQL_COUNT_INACTIVE_GROUPS = "SELECT COUNT(*) FROM groups WHERE active = 0"
+SQL_DEACTIVATE_GROUP = "UPDATE groups SET active = 0 WHERE chat_id = ?"
+SQL_MIGRATE_GROUP = "UPDATE OR IGNORE groups SET chat_id = ?, active = 1 WHERE chat_id = ?"
+SQL_DELETE_GROUP = "DELETE FROM groups WHERE chat_id = ?"
+SQL_START_BROADCAST = "INSERT INTO broadcasts(label, total, started_at) VALUES (?, ?, ?)"
+SQL_FINISH_BROADCAST = "UPDATE broadcasts SET sent = ?, failed = ?, finished_at = ? WHERE id = ?"
+SQL_ADD_DELIVERY = ("INSERT INTO deliveries(broadcast_id, chat_id, status, error_code, error, ts) "
+                    "VALUES (?, ?, ?, ?, ?, ?)")
+SQL_DELIVERY_SUMMARY = ("SELECT status, error_code, COUNT(*) FROM deliveries WHERE broadcast_id = ? "
+                        "GROUP BY status, error_code ORDER BY COUNT(*) DESC")
+SQL_ADD_MEMORY = "INSERT INTO memory(user_id, role, content, ts) VALUES (?, ?, ?, ?)"
+SQL_GET_MEMORY = "SELECT role, content FROM memory WHERE user_id = ? ORDER BY ts DESC, id DESC LIMIT ?"
+SQL_COUNT_USERS = "SELECT COUNT(DISTINCT user_id) FROM memory"
+SQL_GET_SUMMARY = "SELECT content FROM memory_summary WHERE user_id = ?"
+SQL_SET_SUMMARY = "INSERT OR REPLACE INTO memory_summary(user_id, content, updated_at) VALUES (?, ?, ?)"
+SQL_USERS_OVER = "SELECT user_id FROM memory GROUP BY user_id HAVING COUNT(*) > ? LIMIT ?"
+# oldest-first, capped at ? rows and never reaching into the newest ? turns
+SQL_GET_OLD_MEMORY = ("SELECT id, role, content FROM memory WHERE user_id = ? ORDER BY ts, id "
+                      "LIMIT max(0, min(?, (SELECT COUNT(*) FROM memory WHERE user_id = ?) - ?))")
+SQL_DELETE_MEMORY = "DELETE FROM memory WHERE id = ?"
+SQL_ADD_SCHEDULE = ("INSERT OR REPLACE INTO schedules(job_id, payload, media, run_time, recur, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)")
+SQL_LIST_SCHEDULES = "SELECT job_id, payload, media, run_time, recur FROM schedules ORDER BY created_at"
+SQL_CLEAR_SCHEDULES = "DELETE FROM schedules"
+SQL_REMOVE_SCHEDULE = "DELETE FROM schedules WHERE job_id = ?"
+
+DB_SECONDS = metrics.histogram("db_call_seconds", "Database method latency", ["method"],
+                               buckets=metrics.FAST_BUCKETS)
+DB_ERRORS = metrics.counter("db_errors_total", "Database method exceptions", ["method"])
+_timed = metrics.timed(DB_SECONDS, DB_ERRORS)
+
+
 class Database:
-    def __init__(self,path): pass
-    def add_group(self,g): pass
-    def get_groups(self): return []
-    def add_memory(self,u,r,c): pass
-    def get_memory(self,u,limit=5): return []
-    def add_schedule(self,a,b,c,d,e): pass
-    def clear_schedules(self): pass
-    def list_schedules(self): return []
-    def count_users(self): return 0
+    """SQLite storage for groups, chat memory and schedules.
+
+    Handlers run on the PriorityDispatcher's worker pools (plus the
+    background workers), so every thread gets its own connection (sqlite3
+    connections must not be shared across threads).
+    WAL mode lets those readers run alongside a single writer.
+    """
+
+    def __init__(self, path, cached_statements=64):
+        self.path = path
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        # the file is opened (and the schema applied) by the first query, not at startup
+        self._ready = False
+        self._init_lock = threading.Lock()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None,
+                                   check_same_thread=False,
+                                   cached_statements=self.cached_statements)
+            # must precede WAL setup to apply to a fresh file; older dbs are
+            # converted once, offline, by enable_incremental_vacuum() (main.py --vacuum)
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            if not self._ready:
+                with self._init_lock:
+                    if not self._ready:
+                        conn.executescript(SCHEMA)
+                        self._migrate(conn)
+                        self._ready = True
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _migrate(conn):
+        for table, column, ddl in MIGRATIONS:
+            if column not in [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]:
+                conn.execute(ddl)
+
+    def _batch(self, sql, rows):
+        """executemany in one transaction."""
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            conn.executemany(sql, rows)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # ========== GROUPS ==========
+    @_timed
+    def add_group(self, g):
+        self._conn().execute(SQL_ADD_GROUP, (int(g), time.time()))
+
+    @_timed
+    def get_groups(self):
+        """Groups the bot can still post in (see deactivate_groups)."""
+        return [r[0] for r in self._conn().execute(SQL_GET_GROUPS)]
+
+    @_timed
+    def count_inactive_groups(self):
+        return self._conn().execute(SQL_COUNT_INACTIVE_GROUPS).fetchone()[0]
+
+    @_timed
+    def deactivate_groups(self, chat_ids):
+        self._batch(SQL_DEACTIVATE_GROUP, ((int(g),) for g in chat_ids))
+
+    @_timed
+    def migrate_group(self, old, new):
+        """A group upgraded to a supergroup: keep it under its new id."""
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            conn.execute(SQL_MIGRATE_GROUP, (int(new), int(old)))
+            # still there only if the new id was already known
+            conn.execute(SQL_DELETE_GROUP, (int(old),))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.add_group(new)
+
+    # ========== BROADCAST LEDGER ==========
+    @_timed
+    def start_broadcast(self, label, total):
+        return self._conn().execute(SQL_START_BROADCAST, (label, int(total), time.time())).lastrowid
+
+    @_timed
+    def finish_broadcast(self, broadcast_id, sent, failed):
+        self._conn().execute(SQL_FINISH_BROADCAST, (int(sent), int(failed), time.time(), broadcast_id))
+
+    @_timed
+    def add_deliveries(self, rows):
+        """Batch insert of (broadcast_id, chat_id, status, error_code, error, ts) rows."""
+        self._batch(SQL_ADD_DELIVERY, rows)
+
+    @_timed
+    def delivery_summary(self, broadcast_id):
+        """[(status, error_code, count)] for one broadcast, most common first."""
+        return self._conn().execute(SQL_DELIVERY_SUMMARY, (broadcast_id,)).fetchall()
+
+    # ========== MEMORY ==========
+    @_timed
+    def add_memory(self, u, r, c):
+        self._conn().execute(SQL_ADD_MEMORY, (str(u), r, c or "", time.time()))
+
+    @_timed
+    def add_memories(self, rows):
+        """Batch insert of (user_id, role, content, ts) rows in one transaction."""
+        self._batch(SQL_ADD_MEMORY, ((str(u), r, c or "", ts) for u, r, c, ts in rows))
+
+    @_timed
+    def get_memory(self, u, limit=5):
+        """Rolling summary (if any) as a system turn, then the last ``limit`` turns."""
+        conn = self._conn()
+        rows = conn.execute(SQL_GET_MEMORY, (str(u), int(limit))).fetchall()
+        # newest-first from the index, chat_reply wants oldest-first
+        turns = [{"role": role, "content": content} for role, content in reversed(rows)]
+        summary = conn.execute(SQL_GET_SUMMARY, (str(u),)).fetchone()
+        if summary:
+            turns.insert(0, {"role": "system", "content": summary[0]})
+        return turns
+
+    # ========== COMPACTION ==========
+    @_timed
+    def get_summary(self, u):
+        row = self._conn().execute(SQL_GET_SUMMARY, (str(u),)).fetchone()
+        return row[0] if row else None
+
+    @_timed
+    def users_over(self, threshold, limit=50):
+        """Users with more than ``threshold`` raw memory rows."""
+        return [r[0] for r in self._conn().execute(SQL_USERS_OVER, (int(threshold), int(limit)))]
+
+    @_timed
+    def get_old_memory(self, u, keep_recent, limit=200):
+        """Oldest rows beyond the newest ``keep_recent``: [(id, role, content)], oldest-first."""
+        return self._conn().execute(SQL_GET_OLD_MEMORY, (str(u), int(limit), str(u), int(keep_recent))).fetchall()
+
+    @_timed
+    def compact_memory(self, u, summary, ids):
+        """Atomically store the new rolling summary and delete the folded rows."""
+        conn = self._conn()
+        conn.execute("BEGIN")
+        try:
+            conn.execute(SQL_SET_SUMMARY, (str(u), summary, time.time()))
+            conn.executemany(SQL_DELETE_MEMORY, ((i,) for i in ids))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def enable_incremental_vacuum(self):
+        """Convert a db created without auto_vacuum: one full VACUUM, holding the
+        write lock throughout, so only run it with the bot stopped."""
+        conn = self._conn()
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+
+    @_timed
+    def incremental_vacuum(self, pages=500):
+        """Return up to ``pages`` free pages to the filesystem."""
+        self._conn().execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+
+    @_timed
+    def count_users(self):
+        return self._conn().execute(SQL_COUNT_USERS).fetchone()[0]
+
+    # ========== SCHEDULES ==========
+    @_timed
+    def add_schedule(self, a, b, c, d, e):
+        self._conn().execute(SQL_ADD_SCHEDULE, (a, b, c, d, e, time.time()))
+
+    @_timed
+    def clear_schedules(self):
+        self._conn().execute(SQL_CLEAR_SCHEDULES)
+
+    @_timed
+    def remove_schedule(self, job_id):
+        self._conn().execute(SQL_REMOVE_SCHEDULE, (job_id,))
+
+    @_timed
+    def list_schedules(self):
+        return [
+            {"job_id": r[0], "payload": r[1], "media": r[2], "run_time": r[3], "recur": r[4]}
+            for r in self._conn().execute(SQL_LIST_SCHEDULES)
+        ]
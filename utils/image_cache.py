@@ -0,0 +1,224 @@
+import os
+import re
+import hashlib
+import logging
+import threading
+from io import BytesIO
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+_WS = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt):
+    return _WS.sub(" ", (prompt or "").lower()).strip(" .!?,")
+
+
+def cache_key(model, prompt):
+    return hashlib.sha256(f"{model}\n{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share one execution of ``fn``."""
+
+    class _Call:
+        __slots__ = ("done", "result", "error")
+
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+
+class ImageCache:
+    """Content-addressed, size-bounded LRU of generated images on disk.
+
+    ``<key>.img`` holds the bytes; ``<key>.fid`` holds the Telegram file_id
+    once the image has been sent, so repeats can be re-sent by id.
+
+    Several processes (shard workers) may share one directory: each keeps
+    its own index, adopts files another process wrote on a lookup miss, and
+    re-reads the directory on every ``put``, so ``max_bytes`` bounds the
+    directory rather than one process's share of it.
+    """
+
+    def __init__(self, directory, max_bytes=200 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._index = OrderedDict()   # key -> size, least recently used first
+        self._total = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # the directory is scanned on first use, not at startup
+        self._loaded = False
+
+    def _load(self):
+        # caller holds self._lock
+        if not self._loaded:
+            self._scan()
+
+    def _scan(self):
+        # caller holds self._lock
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".img"):
+                try:
+                    st = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, name[:-4], st.st_size))
+        self._index.clear()
+        self._total = 0
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._total += size
+        self._loaded = True
+
+    def _known(self, key):
+        # caller holds self._lock; another process may have written the file since our scan
+        if key in self._index:
+            self._index.move_to_end(key)
+            return True
+        try:
+            size = os.stat(self._path(key, "img")).st_size
+        except OSError:
+            return False
+        self._index[key] = size
+        self._total += size
+        return True
+
+    def _path(self, key, ext):
+        return os.path.join(self.directory, f"{key}.{ext}")
+
+    def get(self, key):
+        with self._lock:
+            self._load()
+            if not self._known(key):
+                return None
+        try:
+            with open(self._path(key, "img"), "rb") as f:
+                data = f.read()
+            os.utime(self._path(key, "img"))
+            return data
+        except OSError:
+            self._drop(key)
+            return None
+
+    def put(self, key, data):
+        tmp = self._path(key, f"{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, self._path(key, "img"))
+        with self._lock:
+            # the limit is for the directory: re-read it to count what other processes wrote
+            # (one listdir per generated image, which took seconds to make anyway)
+            self._scan()
+            evict = []
+            while self._total > self.max_bytes and len(self._index) > 1:
+                old, size = self._index.popitem(last=False)
+                self._total -= size
+                evict.append(old)
+        for old in evict:
+            self._remove_files(old)
+
+    def get_file_id(self, key):
+        with self._lock:
+            self._load()
+            if not self._known(key):
+                return None
+        try:
+            with open(self._path(key, "fid"), "r") as f:
+                return f.read().strip() or None
+        except OSError:
+            return None
+
+    def set_file_id(self, key, file_id):
+        with self._lock:
+            self._load()
+            if not self._known(key):
+                return
+        with open(self._path(key, "fid"), "w") as f:
+            f.write(file_id)
+
+    def _drop(self, key):
+        with self._lock:
+            self._load()
+            self._total -= self._index.pop(key, 0)
+        self._remove_files(key)
+
+    def _remove_files(self, key):
+        for ext in ("img", "fid"):
+            try:
+                os.remove(self._path(key, ext))
+            except OSError:
+                pass
+
+
+class CachedImageGenerator:
+    """Wraps ``generate_fn(prompt) -> (BytesIO|None, err)`` with cache + single-flight.
+
+    Returns a Telegram file_id (str) when the image was sent before, else a
+    fresh BytesIO. Call ``remember_sent`` with the sent message to record
+    its file_id. ``model`` goes into the cache key: pass whatever
+    identifies what ``generate_fn`` produces (a model, or a fallback chain).
+    """
+
+    def __init__(self, generate_fn, cache, model):
+        self.generate_fn = generate_fn
+        self.cache = cache
+        self.model = model
+        self.flights = SingleFlight()
+
+    def __call__(self, prompt):
+        key = cache_key(self.model, prompt)
+        file_id = self.cache.get_file_id(key)
+        if file_id:
+            return file_id, None
+        data = self.cache.get(key)
+        if data is None:
+            data, err = self.flights.do(key, lambda: self._generate(key, prompt))
+            if data is None:
+                return None, err
+        return BytesIO(data), None
+
+    def _generate(self, key, prompt):
+        img, err = self.generate_fn(prompt)
+        if img is None:
+            return None, err
+        data = img.getvalue()
+        try:
+            self.cache.put(key, data)
+        except OSError as e:
+            logger.warning("Image cache write failed: %s", e)
+        return data, None
+
+    def remember_sent(self, prompt, message):
+        photos = getattr(message, "photo", None)
+        if photos:
+            self.cache.set_file_id(cache_key(self.model, prompt), photos[-1].file_id)
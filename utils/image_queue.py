@@ -0,0 +1,117 @@
+import time
+import queue
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class ImageJob:
+    __slots__ = ("chat_id", "prompt", "reply_to", "enqueued_at", "started_at", "finished_at", "ok")
+
+    def __init__(self, chat_id, prompt, reply_to=None):
+        self.chat_id = chat_id
+        self.prompt = prompt
+        self.reply_to = reply_to
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self.ok = False
+
+    @property
+    def queue_wait(self):
+        return (self.started_at or time.monotonic()) - self.enqueued_at
+
+    @property
+    def gen_time(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+
+def _pct(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+class ImageJobQueue:
+    """Bounded queue + fixed worker pool for image generation.
+
+    ``generate_fn(prompt) -> (bytes_or_None, err)`` runs on a worker and
+    ``deliver_fn(job, img, err)`` sends the result, so handler threads only
+    enqueue. When the queue is full ``submit`` returns False right away.
+    """
+
+    def __init__(self, generate_fn, deliver_fn, workers=2, max_depth=20, history=200):
+        self.generate_fn = generate_fn
+        self.deliver_fn = deliver_fn
+        self._jobs = queue.Queue(maxsize=max_depth)
+        self._recent = deque(maxlen=history)
+        self._inflight = 0
+        self._rejected = 0
+        # lifetime totals; _recent only holds the last ``history`` jobs for latencies
+        self._done = 0
+        self._failed = 0
+        self._lock = threading.Lock()
+        self._workers = workers
+
+    def start(self):
+        for i in range(self._workers):
+            threading.Thread(target=self._worker, name=f"image-worker-{i}", daemon=True).start()
+        return self
+
+    def submit(self, chat_id, prompt, reply_to=None):
+        try:
+            self._jobs.put_nowait(ImageJob(chat_id, prompt, reply_to))
+            return True
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            return False
+
+    def stats(self):
+        with self._lock:
+            recent = list(self._recent)
+            inflight, rejected, done, failed = self._inflight, self._rejected, self._done, self._failed
+        waits = [j.queue_wait for j in recent]
+        gens = [j.gen_time for j in recent]
+        return {
+            "depth": self._jobs.qsize(),
+            "inflight": inflight,
+            "rejected": rejected,
+            "done": done,
+            "failed": failed,
+            "wait_p50": _pct(waits, 0.5), "wait_p95": _pct(waits, 0.95),
+            "gen_p50": _pct(gens, 0.5), "gen_p95": _pct(gens, 0.95),
+        }
+
+    def _worker(self):
+        while True:
+            job = self._jobs.get()
+            job.started_at = time.monotonic()
+            with self._lock:
+                self._inflight += 1
+            img, err = None, None
+            try:
+                img, err = self.generate_fn(job.prompt)
+            except Exception as e:
+                err = f"⚠️ Image error: {e}"
+                logger.error("Image job failed: %s", e)
+            job.finished_at = time.monotonic()
+            job.ok = img is not None
+            try:
+                self.deliver_fn(job, img, err)
+            except Exception as e:
+                job.ok = False
+                logger.error("Image delivery failed: %s", e)
+            with self._lock:
+                self._inflight -= 1
+                self._done += 1
+                if not job.ok:
+                    self._failed += 1
+                self._recent.append(job)
+            logger.info("Image job chat=%s ok=%s wait=%.2fs gen=%.2fs",
+                        job.chat_id, job.ok, job.queue_wait, job.gen_time)
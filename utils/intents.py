@@ -0,0 +1,72 @@
+import re
+
+IMAGE, CHAT, IGNORE = "image", "chat", "ignore"
+
+# keyword -> intent; multi-word phrases match across any whitespace
+DEFAULT_INTENTS = {
+    IMAGE: ["photo", "photos", "pic", "pics", "image", "images", "picture", "pictures",
+            "meme", "memes", "tasveer", "tasvir"],
+    IGNORE: [],
+}
+# when one message matches several intents, the earlier one here wins
+PRIORITY = (IGNORE, IMAGE)
+
+
+def _trie_pattern(words):
+    """Prefix-factored alternation ("pic|pics|picture" -> "pic(?:s|ture)?"), much cheaper to scan."""
+    root = {}
+    for w in words:
+        w = " ".join(w.lower().split())
+        if not w:
+            continue
+        node = root
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def emit(node):
+        branches = [(r"\s+" if ch == " " else re.escape(ch)) + emit(child)
+                    for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return "(?:" + body + ")?" if "" in node else body
+
+    return emit(root)
+
+
+class IntentMatcher:
+    """Routes a message to one intent in a single regex pass.
+
+    All keywords are compiled into one prefix-factored alternation, one
+    named group per intent, anchored on word boundaries, so "pic" matches
+    "ek pic bhejo" but not "epic" or "topic". Matching is on the lowercased
+    text. Text matching nothing is ``default`` (chat).
+    """
+
+    def __init__(self, intents=None, default=CHAT):
+        self.default = default
+        self.intents = {k: list(v) for k, v in (DEFAULT_INTENTS if intents is None else intents).items()}
+        order = [i for i in PRIORITY if i in self.intents] + [i for i in self.intents if i not in PRIORITY]
+        groups = [f"(?P<{name}>{alt})" for name, alt in ((n, _trie_pattern(self.intents[n])) for n in order) if alt]
+        self._single = len(groups) == 1
+        self._rank = {name: rank for rank, name in enumerate(order)}
+        self._regex = re.compile(r"\b(?:" + "|".join(groups) + r")\b") if groups else None
+
+    def route(self, text):
+        if not text or self._regex is None:
+            return self.default
+        text = text.lower()
+        m = self._regex.search(text)
+        if m is None:
+            return self.default
+        best = m.lastgroup
+        if self._single or self._rank[best] == 0:
+            return best
+        # a later keyword of a higher-priority intent still wins
+        for m in self._regex.finditer(text, m.end()):
+            if self._rank[m.lastgroup] < self._rank[best]:
+                best = m.lastgroup
+                if self._rank[best] == 0:
+                    break
+        return best
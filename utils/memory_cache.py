@@ -0,0 +1,128 @@
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+
+class _Turn:
+    __slots__ = ("role", "content")
+
+    def __init__(self, role, content):
+        self.role = role
+        self.content = content
+
+
+class MemoryCache:
+    """Write-behind cache in front of Database.add_memory/get_memory.
+
+    Keeps the last ``max_turns`` turns per user in RAM (LRU over users) and
+    batches inserts to disk from a background thread, so a warm chat() turn
+    never touches SQLite.
+    """
+
+    def __init__(self, db, max_turns=12, max_users=50000, flush_interval=0.3, flush_rows=200):
+        self.db = db
+        self.max_turns = max_turns
+        self.max_users = max_users
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self._users = OrderedDict()   # uid -> deque[_Turn]
+        self._summaries = {}          # uid -> rolling summary text (see Compactor)
+        self._pending = []            # (uid, role, content, ts) not yet on disk
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="memory-flusher", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    # ========== PUBLIC API (same shape as Database) ==========
+    def add_memory(self, u, r, c):
+        uid = str(u)
+        turns = self._turns(uid)
+        with self._lock:
+            turns.append(_Turn(r, c or ""))
+            self._pending.append((uid, r, c or "", time.time()))
+            if len(self._pending) >= self.flush_rows:
+                self._wake.set()
+
+    def get_memory(self, u, limit=5):
+        uid = str(u)
+        turns = self._turns(uid)
+        with self._lock:
+            items = list(turns)[-limit:] if limit else []
+            summary = self._summaries.get(uid)
+        out = [{"role": t.role, "content": t.content} for t in items]
+        if summary:
+            out.insert(0, {"role": "system", "content": summary})
+        return out
+
+    def set_summary(self, u, summary):
+        """Called after compaction so cached users see the new summary."""
+        uid = str(u)
+        with self._lock:
+            if uid in self._users:
+                self._summaries[uid] = summary
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return 0
+            try:
+                self.db.add_memories(rows)
+            except Exception as e:
+                logger.error("Memory flush failed (%d rows re-queued): %s", len(rows), e)
+                with self._lock:
+                    self._pending[:0] = rows
+                return 0
+            return len(rows)
+
+    def close(self):
+        self._stopped = True
+        self._wake.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=5)
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            return {"users": len(self._users), "pending": len(self._pending)}
+
+    # ========== INTERNALS ==========
+    def _turns(self, uid):
+        with self._lock:
+            turns = self._users.get(uid)
+            if turns is not None:
+                self._users.move_to_end(uid)
+                return turns
+            has_pending = any(p[0] == uid for p in self._pending)
+        # cold user: make sure an evicted user's unflushed turns are on disk first
+        if has_pending:
+            self.flush()
+        history = self.db.get_memory(uid, limit=self.max_turns)
+        summary = None
+        if history and history[0]["role"] == "system":
+            summary = history.pop(0)["content"]
+        loaded = deque((_Turn(h["role"], h["content"]) for h in history), maxlen=self.max_turns)
+        with self._lock:
+            if uid not in self._users and summary:
+                self._summaries[uid] = summary
+            turns = self._users.setdefault(uid, loaded)
+            self._users.move_to_end(uid)
+            while len(self._users) > self.max_users:
+                old_uid, _ = self._users.popitem(last=False)
+                self._summaries.pop(old_uid, None)
+            return turns
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
@@ -0,0 +1,278 @@
+import time
+import logging
+import functools
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# seconds; an implicit +Inf bucket follows the last bound
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+
+
+class _CounterValue:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self._lock:
+            self.value += n
+
+
+class _HistogramValue:
+    __slots__ = ("bounds", "counts", "count", "sum", "_lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th observation (inf if past the last)."""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if not total:
+            return 0.0
+        rank, seen = p * total, 0
+        for i, c in enumerate(counts):
+            seen += c
+            if c and seen >= rank:
+                return self.bounds[i] if i < len(self.bounds) else float("inf")
+        return float("inf")
+
+    def snapshot(self):
+        """(cumulative [(le, count)], count, sum)"""
+        with self._lock:
+            counts, total, s = list(self.counts), self.count, self.sum
+        cumulative, seen = [], 0
+        for bound, c in zip(self.bounds + (float("inf"),), counts):
+            seen += c
+            cumulative.append((bound, seen))
+        return cumulative, total, s
+
+
+class _Family:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children = {}   # label values as passed -> child
+        self._series = {}     # label values as strings -> child
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+            key = tuple(str(v) for v in values)
+            with self._lock:
+                child = self._series.get(key)
+                if child is None:
+                    child = self._series[key] = self._new()
+                # raw values are cached too so the hot path skips str()
+                self._children[values] = child
+        return child
+
+    def children(self):
+        with self._lock:
+            return list(self._series.items())
+
+    def _new(self):
+        raise NotImplementedError
+
+
+class Counter(_Family):
+    kind = "counter"
+
+    def _new(self):
+        return _CounterValue()
+
+    def inc(self, n=1):
+        self.labels().inc(n)
+
+
+class Histogram(_Family):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+
+class Gauge(_Family):
+    """Read at scrape time from ``fn()``; nothing to update on the hot path."""
+    kind = "gauge"
+
+    def __init__(self, name, help_text, fn):
+        super().__init__(name, help_text)
+        self.fn = fn
+
+
+class Registry:
+    def __init__(self):
+        self._families = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, *args, **kwargs):
+        with self._lock:
+            fam = self._families.get(name)
+            if fam is None:
+                fam = self._families[name] = cls(name, *args, **kwargs)
+            elif not isinstance(fam, cls):
+                raise ValueError(f"metric {name} already registered as {fam.kind}")
+            return fam
+
+    def counter(self, name, help_text, labelnames=()):
+        return self._get(Counter, name, help_text, labelnames)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help_text, labelnames, buckets)
+
+    def gauge(self, name, help_text, fn):
+        fam = self._get(Gauge, name, help_text, fn)
+        fam.fn = fn
+        return fam
+
+    def families(self):
+        with self._lock:
+            return list(self._families.values())
+
+    def render(self):
+        """Prometheus text exposition format (0.0.4)."""
+        out = []
+        for fam in self.families():
+            out.append(f"# HELP {fam.name} {fam.help}")
+            out.append(f"# TYPE {fam.name} {fam.kind}")
+            if isinstance(fam, Gauge):
+                try:
+                    out.append(f"{fam.name} {_num(fam.fn())}")
+                except Exception as e:
+                    logger.debug("gauge %s failed: %s", fam.name, e)
+                continue
+            for key, child in fam.children():
+                pairs = list(zip(fam.labelnames, key))
+                if isinstance(fam, Counter):
+                    out.append(f"{fam.name}{_labels(pairs)} {_num(child.value)}")
+                    continue
+                cumulative, total, s = child.snapshot()
+                for bound, n in cumulative:
+                    out.append(f"{fam.name}_bucket{_labels(pairs + [('le', _num(bound))])} {n}")
+                out.append(f"{fam.name}_sum{_labels(pairs)} {_num(s)}")
+                out.append(f"{fam.name}_count{_labels(pairs)} {total}")
+        return "\n".join(out) + "\n"
+
+    def summary(self, top=5):
+        """Short human-readable digest: the ``top`` children of each histogram by total time."""
+        lines = []
+        for fam in self.families():
+            if not isinstance(fam, Histogram):
+                continue
+            children = [(key, child) for key, child in fam.children() if child.count]
+            if not children:
+                continue
+            lines.append(f"■ {fam.name}")
+            children.sort(key=lambda kc: kc[1].sum, reverse=True)
+            for key, child in children[:top]:
+                label = ",".join(key) or "-"
+                lines.append(f"  {label}: n={child.count} avg={child.sum / child.count * 1000:.1f}ms "
+                             f"p95≤{_ms(child.percentile(0.95))}")
+        return "\n".join(lines)
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+histogram = REGISTRY.histogram
+gauge = REGISTRY.gauge
+
+
+def timed(hist, errors=None, label=None):
+    """Decorator: observe call latency into ``hist.labels(<fn name>)``,
+    count raised exceptions in ``errors`` (same label)."""
+    def deco(fn):
+        name = label or fn.__name__
+        child = hist.labels(name)
+        err = errors.labels(name) if errors is not None else None
+        clock = time.perf_counter
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = clock()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                if err is not None:
+                    err.inc()
+                raise
+            finally:
+                child.observe(clock() - t0)
+
+        return wrapper
+    return deco
+
+
+def serve(port, host="127.0.0.1", registry=REGISTRY):
+    """Serve ``GET /metrics`` from a daemon thread; returns the server."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info("Metrics on http://%s:%d/metrics", host, port)
+    return server
+
+
+def _num(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(v) if isinstance(v, float) else str(v)
+
+
+def _ms(v):
+    return "inf" if v == float("inf") else f"{v * 1000:.1f}ms"
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
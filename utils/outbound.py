@@ -0,0 +1,303 @@
+import time
+import heapq
+import random
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+import requests
+from telebot import types
+from urllib3.exceptions import NewConnectionError
+
+from utils import metrics
+from utils.broadcast import get_retry_after
+from utils.ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+SEND_SECONDS = metrics.histogram("telegram_call_seconds", "Telegram Bot API call latency", ["method"])
+SEND_TOTAL = metrics.counter("telegram_sends_total", "Outbound sends by result", ["method", "result"])
+WAIT_SECONDS = metrics.histogram("outbound_queue_wait_seconds", "Time a send waited in the outbound queue")
+# repeating these changes nothing, so they may also be retried after a 5xx / dropped connection
+IDEMPOTENT_METHODS = frozenset({"edit_message_text", "send_chat_action"})
+
+
+class _Send:
+    __slots__ = ("method", "args", "kwargs", "droppable", "future", "enqueued_at", "attempts")
+
+    def __init__(self, method, args, kwargs, droppable):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.droppable = droppable
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+        self.attempts = 0
+
+
+class _Chat:
+    __slots__ = ("queue", "tokens", "last", "scheduled", "busy")
+
+    def __init__(self, capacity, now):
+        self.queue = deque()
+        self.tokens = capacity
+        self.last = now
+        self.scheduled = False
+        self.busy = False
+
+
+class OutboundDispatcher:
+    """Single path for every outgoing Telegram call.
+
+    Sends are queued per chat (strict FIFO inside a chat) and drained by a
+    small worker pool under a global token bucket plus a per-chat one
+    (Telegram: ~1 msg/s per chat, ~20 msg/min per group). A 429 puts the
+    send back at the head of its chat and parks that chat for
+    ``retry_after`` plus jitter. Connection failures before the request went
+    out back off exponentially; a 5xx or a connection lost mid-request is
+    not retried (the message may already be posted) except for
+    IDEMPOTENT_METHODS.
+    Droppable sends (chat actions, stickers) are refused when the queue is
+    under pressure and discarded when they went stale waiting.
+
+    The bot-shaped methods return a Future with the telebot result;
+    ``sync`` is a bot-like view that blocks on it, for code that needs the
+    sent Message (streaming, broadcasts, scheduler).
+    """
+
+    def __init__(self, bot, rate=25, burst=25, chat_rate=1.0, chat_burst=3,
+                 group_rate=20 / 60, group_burst=5, workers=4, max_retries=3,
+                 backoff=0.5, jitter=0.25, shed_depth=500, chat_shed_depth=10,
+                 droppable_ttl=5.0, sync_timeout=120, sweep_interval=60.0):
+        self.bot = bot
+        self.global_bucket = TokenBucket(rate, burst)
+        self.chat_rate, self.chat_burst = float(chat_rate), float(chat_burst)
+        self.group_rate, self.group_burst = float(group_rate), float(group_burst)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.jitter = jitter
+        self.shed_depth = shed_depth
+        self.chat_shed_depth = chat_shed_depth
+        self.droppable_ttl = droppable_ttl
+        self.sync_timeout = sync_timeout
+        self.sweep_interval = sweep_interval
+        self._chats = {}              # chat_id -> _Chat
+        self._ready = []              # heap of (ready_at, seq, chat_id)
+        self._seq = 0
+        self._depth = 0
+        self._inflight = 0
+        self._next_sweep = time.monotonic() + sweep_interval
+        self._cond = threading.Condition()
+        self.sync = _SyncView(self)
+        self._workers = workers
+        metrics.gauge("outbound_queue_depth", "Sends waiting in the outbound queue", lambda: self._depth)
+
+    def start(self):
+        """Start the sender threads (sends queued before this wait for them)."""
+        for i in range(self._workers):
+            threading.Thread(target=self._worker, name=f"outbound-{i}", daemon=True).start()
+        return self
+
+    # ========== BOT-SHAPED API (each returns a Future) ==========
+    def send_message(self, chat_id, text, **kwargs):
+        return self.submit(chat_id, "send_message", chat_id, text, **kwargs)
+
+    def reply_to(self, message, text, **kwargs):
+        # a deleted original must not turn the reply into an error
+        kwargs.pop("allow_sending_without_reply", None)
+        kwargs.setdefault("reply_parameters", types.ReplyParameters(message.message_id, allow_sending_without_reply=True))
+        return self.submit(message.chat.id, "send_message", message.chat.id, text, **kwargs)
+
+    def send_photo(self, chat_id, photo, **kwargs):
+        return self.submit(chat_id, "send_photo", chat_id, photo, **kwargs)
+
+    def send_video(self, chat_id, video, **kwargs):
+        return self.submit(chat_id, "send_video", chat_id, video, **kwargs)
+
+    def send_document(self, chat_id, document, **kwargs):
+        return self.submit(chat_id, "send_document", chat_id, document, **kwargs)
+
+    def send_sticker(self, chat_id, sticker, droppable=True, **kwargs):
+        return self.submit(chat_id, "send_sticker", chat_id, sticker, droppable=droppable, **kwargs)
+
+    def send_chat_action(self, chat_id, action, **kwargs):
+        return self.submit(chat_id, "send_chat_action", chat_id, action, droppable=True, **kwargs)
+
+    def edit_message_text(self, text, chat_id, message_id, **kwargs):
+        return self.submit(chat_id, "edit_message_text", text, chat_id, message_id, **kwargs)
+
+    # ========== CORE ==========
+    def submit(self, chat_id, method, *args, droppable=False, **kwargs):
+        """Queue ``bot.<method>(*args, **kwargs)`` behind earlier sends to ``chat_id``."""
+        item = _Send(method, args, kwargs, droppable)
+        now = time.monotonic()
+        with self._cond:
+            chat = self._chats.get(chat_id)
+            if droppable and (self._depth >= self.shed_depth
+                              or (chat is not None and len(chat.queue) >= self.chat_shed_depth)):
+                SEND_TOTAL.labels(method, "dropped").inc()
+                item.future.set_result(None)
+                return item.future
+            if chat is None:
+                chat = self._chats[chat_id] = _Chat(self._capacity(chat_id), now)
+            chat.queue.append(item)
+            self._depth += 1
+            if not chat.scheduled and not chat.busy:
+                self._schedule(chat_id, chat, now)
+            if now >= self._next_sweep:
+                self._sweep(now)
+        return item.future
+
+    def stats(self):
+        with self._cond:
+            out = {"depth": self._depth, "inflight": self._inflight, "chats": len(self._chats)}
+        for result in ("sent", "failed", "retried", "dropped"):
+            out[result] = 0
+        for (_, result), c in SEND_TOTAL.children():
+            out["sent" if result == "ok" else result] += c.value
+        wait = WAIT_SECONDS.labels()
+        out["wait_p50"], out["wait_p95"] = wait.percentile(0.5), wait.percentile(0.95)
+        out["send"] = {m: (h.percentile(0.5), h.percentile(0.95), h.count) for (m,), h in SEND_SECONDS.children()}
+        return out
+
+    # ========== INTERNALS ==========
+    def _capacity(self, chat_id):
+        return self.group_burst if _is_group(chat_id) else self.chat_burst
+
+    def _refill(self, chat_id, chat, now):
+        rate, cap = (self.group_rate, self.group_burst) if _is_group(chat_id) else (self.chat_rate, self.chat_burst)
+        chat.tokens = min(cap, chat.tokens + (now - chat.last) * rate)
+        chat.last = now
+        return rate
+
+    def _schedule(self, chat_id, chat, now, not_before=0.0):
+        # caller holds self._cond
+        rate = self._refill(chat_id, chat, now)
+        ready = now if chat.tokens >= 1 else now + (1 - chat.tokens) / rate
+        self._seq += 1
+        heapq.heappush(self._ready, (max(ready, not_before), self._seq, chat_id))
+        chat.scheduled = True
+        self._cond.notify()
+
+    def _sweep(self, now):
+        # idle chats whose bucket has refilled are indistinguishable from new ones
+        idle = []
+        for cid, c in self._chats.items():
+            if not c.queue and not c.busy and not c.scheduled:
+                self._refill(cid, c, now)
+                if c.tokens >= self._capacity(cid):
+                    idle.append(cid)
+        for cid in idle:
+            del self._chats[cid]
+        self._next_sweep = now + self.sweep_interval
+
+    def _next(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self._ready and self._ready[0][0] <= now:
+                    _, _, chat_id = heapq.heappop(self._ready)
+                    chat = self._chats[chat_id]
+                    chat.scheduled = False
+                    self._refill(chat_id, chat, now)
+                    chat.tokens -= 1
+                    chat.busy = True
+                    self._depth -= 1
+                    self._inflight += 1
+                    return chat_id, chat, chat.queue.popleft()
+                self._cond.wait(self._ready[0][0] - now if self._ready else None)
+
+    def _done(self, chat_id, chat, retry=None, delay=0.0):
+        with self._cond:
+            self._inflight -= 1
+            chat.busy = False
+            if retry is not None:
+                chat.queue.appendleft(retry)
+                self._depth += 1
+            if chat.queue:
+                now = time.monotonic()
+                self._schedule(chat_id, chat, now, not_before=now + delay)
+
+    def _worker(self):
+        while True:
+            chat_id, chat, item = self._next()
+            waited = time.monotonic() - item.enqueued_at
+            if item.droppable and waited > self.droppable_ttl:
+                SEND_TOTAL.labels(item.method, "dropped").inc()
+                item.future.set_result(None)
+                self._done(chat_id, chat)
+                continue
+            if item.attempts == 0:
+                WAIT_SECONDS.observe(waited)
+            self.global_bucket.acquire()
+            item.attempts += 1
+            t0 = time.monotonic()
+            try:
+                result = getattr(self.bot, item.method)(*item.args, **item.kwargs)
+            except Exception as e:
+                SEND_SECONDS.labels(item.method).observe(time.monotonic() - t0)
+                delay = self._retry_delay(e, item.method, item.attempts)
+                if delay is not None and item.attempts <= self.max_retries:
+                    logger.info("Outbound %s to %s: retry %d in %.1fs (%s)",
+                                item.method, chat_id, item.attempts, delay, e)
+                    SEND_TOTAL.labels(item.method, "retried").inc()
+                    self._done(chat_id, chat, retry=item, delay=delay)
+                    continue
+                logger.warning("Outbound %s to %s failed: %s", item.method, chat_id, e)
+                SEND_TOTAL.labels(item.method, "failed").inc()
+                item.future.set_exception(e)
+                self._done(chat_id, chat)
+                continue
+            SEND_SECONDS.labels(item.method).observe(time.monotonic() - t0)
+            SEND_TOTAL.labels(item.method, "ok").inc()
+            item.future.set_result(result)
+            self._done(chat_id, chat)
+
+    def _retry_delay(self, e, method, attempt):
+        """Seconds to wait before retrying ``e``, or None if it is not retryable."""
+        retry_after = get_retry_after(e)
+        if retry_after is not None:
+            return retry_after * (1 + random.uniform(0, self.jitter))
+        # a 5xx or a dropped connection may come after Telegram already delivered
+        # the message; resending would post it twice, so only replay what is
+        # known not to have been sent, or is harmless to repeat
+        if not (_never_sent(e) or method in IDEMPOTENT_METHODS):
+            return None
+        code = getattr(e, "error_code", None)
+        if code is not None and code < 500:
+            return None   # 400/403 etc.: the request itself is bad
+        return self.backoff * (2 ** (attempt - 1)) * (1 + random.uniform(0, self.jitter))
+
+
+def _never_sent(e):
+    """True for errors raised while connecting, before the request went out."""
+    if isinstance(e, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(e, requests.exceptions.ConnectionError):
+        reason = getattr(e.args[0], "reason", None) if e.args else None
+        return isinstance(reason, NewConnectionError)
+    return False
+
+
+def _is_group(chat_id):
+    # group and channel ids are negative
+    try:
+        return int(chat_id) < 0
+    except (TypeError, ValueError):
+        return True
+
+
+class _SyncView:
+    """``dispatcher.sync.send_message(...)`` -> the Message, raising on failure."""
+
+    def __init__(self, dispatcher):
+        self._dispatcher = dispatcher
+
+    def __getattr__(self, name):
+        fn = getattr(self._dispatcher, name)
+
+        def call(*args, **kwargs):
+            return fn(*args, **kwargs).result(timeout=self._dispatcher.sync_timeout)
+
+        return call
@@ -0,0 +1,132 @@
+import time
+import logging
+import threading
+from collections import deque
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+# tiers, most urgent first
+ADMIN, DIRECT, AMBIENT = 0, 1, 2
+TIER_NAMES = ("admin", "direct", "ambient")
+
+UPDATES_TOTAL = metrics.counter("bot_updates_total", "Updates by priority tier and outcome", ["priority", "result"])
+UPDATE_WAIT = metrics.histogram("bot_update_wait_seconds", "Time an update waited for a handler thread", ["priority"])
+
+
+class _Call:
+    __slots__ = ("fn", "args")
+
+    def __init__(self, fn, args):
+        self.fn = fn
+        self.args = args
+
+
+class PriorityDispatcher:
+    """Runs update handlers on worker pools ordered by priority.
+
+    Installed in place of ``bot.process_new_updates``; each update is then
+    handed to ``process`` (default: telebot's own, in which case the bot
+    must be created with ``threaded=False`` so handlers run on these threads).
+    ``classify(update)`` returns ADMIN, DIRECT or AMBIENT. Workers of a tier
+    also take work from every more urgent tier, most urgent first, so the
+    ADMIN threads are reserved for admin commands and callbacks and a
+    burst of 30 s AI replies can never hold them.
+
+    Ambient updates older than ``shed_age`` seconds are dropped instead of
+    handled, as are the oldest ones once ``max_ambient`` are waiting: a
+    late reply to group chatter is worth less than keeping up. ``run()``
+    queues other work (e.g. coalesced group replies) on a tier the same way.
+    """
+
+    def __init__(self, bot, classify, process=None, workers=(2, 4, 8), shed_age=20.0, max_ambient=500):
+        self.bot = bot
+        self.classify = classify
+        self.shed_age = shed_age
+        self.max_ambient = max_ambient
+        self._process = process or bot.process_new_updates
+        self._queues = [deque() for _ in TIER_NAMES]
+        self._cond = threading.Condition()
+        self._workers = workers
+        for tier, name in enumerate(TIER_NAMES):
+            metrics.gauge(f"bot_update_queue_depth_{name}", f"{name.capitalize()} updates waiting",
+                          lambda q=self._queues[tier]: len(q))
+
+    def install(self):
+        self.bot.process_new_updates = self.submit
+        return self
+
+    def start(self):
+        for tier, n in enumerate(self._workers):
+            for i in range(n):
+                threading.Thread(target=self._worker, args=(tier,),
+                                 name=f"updates-{TIER_NAMES[tier]}-{i}", daemon=True).start()
+        return self
+
+    def submit(self, updates):
+        now = time.monotonic()
+        for update in updates:
+            # polling resumes from last_update_id, which telebot only advances while processing
+            if update.update_id > self.bot.last_update_id:
+                self.bot.last_update_id = update.update_id
+            try:
+                tier = self.classify(update)
+            except Exception as e:
+                logger.debug("Update classification failed: %s", e)
+                tier = DIRECT
+            self._enqueue(tier, now, update)
+
+    def run(self, tier, fn, *args):
+        """Queue ``fn(*args)`` on ``tier`` like an update (same pools, same shedding)."""
+        self._enqueue(tier, time.monotonic(), _Call(fn, args))
+
+    def stats(self):
+        with self._cond:
+            out = {name: {"depth": len(q)} for name, q in zip(TIER_NAMES, self._queues)}
+        for (name, result), c in UPDATES_TOTAL.children():
+            out[name][result] = c.value
+        for (name,), h in UPDATE_WAIT.children():
+            out[name]["wait_p50"], out[name]["wait_p95"] = h.percentile(0.5), h.percentile(0.95)
+        return out
+
+    # ========== INTERNALS ==========
+    def _enqueue(self, tier, now, item):
+        with self._cond:
+            q = self._queues[tier]
+            q.append((now, item))
+            if tier == AMBIENT and len(q) > self.max_ambient:
+                q.popleft()
+                UPDATES_TOTAL.labels(TIER_NAMES[tier], "shed").inc()
+            self._cond.notify_all()
+
+    def _next(self, max_tier):
+        # caller holds self._cond
+        for tier in range(max_tier + 1):
+            if self._queues[tier]:
+                return (tier,) + self._queues[tier].popleft()
+        return None
+
+    def _worker(self, max_tier):
+        while True:
+            with self._cond:
+                item = self._next(max_tier)
+                while item is None:
+                    self._cond.wait()
+                    item = self._next(max_tier)
+            tier, enqueued_at, update = item
+            name = TIER_NAMES[tier]
+            waited = time.monotonic() - enqueued_at
+            if tier == AMBIENT and waited > self.shed_age:
+                UPDATES_TOTAL.labels(name, "shed").inc()
+                continue
+            UPDATE_WAIT.labels(name).observe(waited)
+            try:
+                if isinstance(update, _Call):
+                    update.fn(*update.args)
+                else:
+                    self._process([update])
+                UPDATES_TOTAL.labels(name, "handled").inc()
+            except Exception as e:
+                UPDATES_TOTAL.labels(name, "failed").inc()
+                logger.error("Update handler failed (%s): %s", name, e)
@@ -0,0 +1,71 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# rough chat-format overhead per message (role + separators)
+MESSAGE_OVERHEAD = 4
+
+
+def estimate_tokens(text):
+    """Cheap local token estimate: ~4 UTF-8 bytes per token, no tokenizer needed.
+
+    Hinglish/emoji text is byte-heavy, so this errs on the generous side.
+    """
+    if not text:
+        return 0
+    return (len(text.encode("utf-8")) + 3) // 4
+
+
+def truncate_to_tokens(text, max_tokens):
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    # keep the start; cut on the byte budget and drop any split character
+    cut = text.encode("utf-8")[: max_tokens * 4].decode("utf-8", "ignore")
+    return cut.rstrip() + "…"
+
+
+class PromptBuilder:
+    """Builds chat_reply input under a token budget.
+
+    The persona is one fixed system message (identical bytes every turn, so
+    upstream prompt caching can reuse it); history is filled newest-first
+    until ``budget_tokens`` is used up, and any single turn longer than
+    ``max_turn_tokens`` is truncated.
+    """
+
+    def __init__(self, system_prompt, budget_tokens=1500, max_turn_tokens=300,
+                 summary_prefix="Earlier conversation summary: "):
+        self.system_prompt = system_prompt
+        self.summary_prefix = summary_prefix
+        self.system_tokens = estimate_tokens(system_prompt) + MESSAGE_OVERHEAD
+        self.budget_tokens = budget_tokens
+        self.max_turn_tokens = max_turn_tokens
+
+    def build(self, user_text, history=None):
+        """Returns (history_to_send, user_text_to_send, estimated_prompt_tokens)."""
+        turns = list(history or [])
+        # chat() stores the current user turn before building; don't send it twice
+        if turns and turns[-1].get("role") == "user" and turns[-1].get("content") == user_text:
+            turns.pop()
+        user_text = truncate_to_tokens(user_text or "", self.max_turn_tokens)
+        used = self.system_tokens + estimate_tokens(user_text) + MESSAGE_OVERHEAD
+        picked = []
+        # a rolling summary (system turn) is kept ahead of any raw turn
+        summaries = [h for h in turns if h.get("role") == "system"]
+        turns = [h for h in turns if h.get("role") != "system"]
+        head = []
+        for h in summaries:
+            content = self.summary_prefix + truncate_to_tokens(h.get("content") or "", self.max_turn_tokens)
+            cost = estimate_tokens(content) + MESSAGE_OVERHEAD
+            if used + cost <= self.budget_tokens:
+                head.append({"role": "system", "content": content})
+                used += cost
+        for h in reversed(turns):
+            content = truncate_to_tokens(h.get("content") or "", self.max_turn_tokens)
+            cost = estimate_tokens(content) + MESSAGE_OVERHEAD
+            if used + cost > self.budget_tokens:
+                break
+            picked.append({"role": h["role"], "content": content})
+            used += cost
+        picked.reverse()
+        return head + picked, user_text, used
@@ -0,0 +1,124 @@
+import time
+import threading
+
+
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` tokens/s, bursts up to ``capacity``."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._last
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._last = now
+
+    def try_acquire(self, n=1):
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= n:
+                self._tokens -= n
+                return True
+            return False
+
+    def acquire(self, n=1):
+        """Block until ``n`` tokens are available."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= n:
+                    self._tokens -= n
+                    return
+                wait = (n - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class KeyedTokenBuckets:
+    """Many token buckets keyed by id (user, chat, ...), memory-bounded.
+
+    A bucket that has refilled to capacity is identical to a fresh one, so
+    a periodic per-stripe sweep simply deletes it: only keys active in the
+    last ``capacity / rate`` seconds stay in memory. Keys are spread over
+    ``stripes`` locks so handler threads rarely contend.
+    """
+
+    def __init__(self, rate, capacity=1, stripes=16, sweep_interval=30.0):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.sweep_interval = sweep_interval
+        self._mask = stripes - 1
+        assert stripes & self._mask == 0, "stripes must be a power of two"
+        now = time.monotonic()
+        self._stripes = [({}, threading.Lock(), [now + sweep_interval]) for _ in range(stripes)]
+
+    def allow(self, key, n=1):
+        buckets, lock, next_sweep = self._stripes[hash(key) & self._mask]
+        now = time.monotonic()
+        with lock:
+            if now >= next_sweep[0]:
+                self._sweep(buckets, now)
+                next_sweep[0] = now + self.sweep_interval
+            b = buckets.get(key)
+            if b is None:
+                tokens = self.capacity
+                b = buckets[key] = [tokens, now]
+            else:
+                tokens = min(self.capacity, b[0] + (now - b[1]) * self.rate)
+            if tokens >= n:
+                b[0], b[1] = tokens - n, now
+                return True
+            b[0], b[1] = tokens, now
+            return False
+
+    def refund(self, key, n=1):
+        buckets, lock, _ = self._stripes[hash(key) & self._mask]
+        with lock:
+            b = buckets.get(key)
+            if b is not None:
+                b[0] = min(self.capacity, b[0] + n)
+
+    def _sweep(self, buckets, now):
+        full_after = self.capacity / self.rate
+        idle = [k for k, b in buckets.items() if now - b[1] >= full_after - b[0] / self.rate]
+        for k in idle:
+            del buckets[k]
+
+    def __len__(self):
+        return sum(len(b) for b, _, _ in self._stripes)
+
+
+class RateLimiter:
+    """Per-user, per-chat and global token buckets for AI replies.
+
+    The global bucket protects the OpenRouter budget; a request must pass
+    all three, and tokens taken from earlier dimensions are refunded when a
+    later one says no.
+    """
+
+    def __init__(self, user_rate=0.1, user_burst=1, chat_rate=0.5, chat_burst=5,
+                 global_rate=5.0, global_burst=20, sweep_interval=30.0):
+        self.users = KeyedTokenBuckets(user_rate, user_burst, sweep_interval=sweep_interval)
+        self.chats = KeyedTokenBuckets(chat_rate, chat_burst, sweep_interval=sweep_interval)
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+
+    def allow(self, user_id, chat_id=None):
+        if not self.users.allow(user_id):
+            return False
+        if chat_id is not None and not self.chats.allow(chat_id):
+            self.users.refund(user_id)
+            return False
+        if not self.global_bucket.try_acquire():
+            self.users.refund(user_id)
+            if chat_id is not None:
+                self.chats.refund(chat_id)
+            return False
+        return True
+
+    def stats(self):
+        return {"user_buckets": len(self.users), "chat_buckets": len(self.chats)}
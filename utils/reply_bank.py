@@ -0,0 +1,157 @@
+import time
+import random
+import logging
+import threading
+from collections import OrderedDict
+
+from utils import metrics
+from utils.ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+LOOKUPS = metrics.counter("reply_bank_lookups_total", "Reply bank lookups by result", ["bank", "result"])
+
+
+class _Entry:
+    __slots__ = ("replies", "filled_at", "pending")
+
+    def __init__(self):
+        self.replies = []
+        self.filled_at = 0.0
+        self.pending = False
+
+
+class ReplyBank:
+    """Pre-generated replies for prompts that depend on one small key (an emoji).
+
+    Keeps up to ``per_key`` varied replies per key and serves a random one
+    instantly. A miss returns None and schedules nothing: the caller asks
+    upstream itself and ``add()``s the answer (or ``warm()``s the key when
+    it can't ask now), so a cold key costs one upstream call. Keys short
+    of ``per_key`` replies, or older than ``ttl`` seconds (still served
+    meanwhile), are topped up by one background thread calling
+    ``generate_fn(key)``, paced at ``fill_rate`` calls/s so warming never
+    competes with live traffic. At most ``max_keys`` keys are
+    kept, least recently used evicted first.
+    """
+
+    def __init__(self, generate_fn, name="bank", per_key=5, ttl=6 * 3600, max_keys=300,
+                 fill_rate=0.2, warm_keys=()):
+        self.generate_fn = generate_fn
+        self.name = name
+        self.per_key = per_key
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._entries = OrderedDict()
+        self._todo = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pace = TokenBucket(fill_rate, 1)
+        self.warm(warm_keys)
+
+    def start(self):
+        """Start the background filler; keys warmed before this wait for it."""
+        threading.Thread(target=self._run, name=f"reply-bank-{self.name}", daemon=True).start()
+        return self
+
+    def warm(self, keys):
+        """Queue ``keys`` for background filling ahead of their first lookup."""
+        for key in keys:
+            self._schedule(key)
+
+    def get(self, key):
+        """A banked reply for ``key`` (topping the key up if due), or None on a miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            reply = random.choice(entry.replies) if entry and entry.replies else None
+        if reply is None:
+            LOOKUPS.labels(self.name, "miss").inc()
+            return None
+        LOOKUPS.labels(self.name, "stale" if now - entry.filled_at > self.ttl else "hit").inc()
+        self._schedule(key)
+        return reply
+
+    def add(self, key, reply):
+        if not reply:
+            return
+        with self._lock:
+            entry = self._entry(key)
+            if reply not in entry.replies:
+                entry.replies.append(reply)
+                del entry.replies[:-self.per_key]
+            entry.filled_at = time.monotonic()
+
+    def stats(self):
+        with self._lock:
+            out = {"keys": len(self._entries), "replies": sum(len(e.replies) for e in self._entries.values()),
+                   "pending": len(self._todo)}
+        for (bank, result), c in LOOKUPS.children():
+            if bank == self.name:
+                out[result] = c.value
+        return out
+
+    # ========== INTERNALS ==========
+    def _entry(self, key):
+        # caller holds self._lock
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _Entry()
+            while len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+        self._entries.move_to_end(key)
+        return entry
+
+    def _needs_fill(self, entry):
+        return len(entry.replies) < self.per_key or time.monotonic() - entry.filled_at > self.ttl
+
+    def _schedule(self, key):
+        with self._lock:
+            entry = self._entry(key)
+            if entry.pending or not self._needs_fill(entry):
+                return
+            entry.pending = True
+            self._todo.append(key)
+        self._wake.set()
+
+    def _fill(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            stale = entry is not None and bool(entry.replies) and time.monotonic() - entry.filled_at > self.ttl
+            missing = self.per_key if stale or entry is None else self.per_key - len(entry.replies)
+        # a stale key is regenerated from scratch, one reply at a time
+        fresh = []
+        for _ in range(missing):
+            self._pace.acquire()
+            try:
+                reply = self.generate_fn(key)
+            except Exception as e:
+                logger.debug("Reply bank %s: generating for %r failed: %s", self.name, key, e)
+                reply = None
+            if not reply:
+                break
+            if not stale:
+                self.add(key, reply)
+            elif reply not in fresh:
+                fresh.append(reply)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            if fresh:
+                # keep older replies only to make up the count until the next refresh
+                entry.replies = (fresh + [r for r in entry.replies if r not in fresh])[:self.per_key]
+                entry.filled_at = time.monotonic()
+            entry.pending = False
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            with self._lock:
+                key = self._todo.pop(0) if self._todo else None
+                if key is None:
+                    self._wake.clear()
+                    continue
+            self._fill(key)
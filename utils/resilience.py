@@ -0,0 +1,244 @@
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from concurrent.futures import wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """closed -> open after ``failure_threshold`` consecutive failures;
+    open -> half-open after ``reset_timeout`` s, where one trial call decides."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def release(self):
+        """A call that was let through but abandoned (cancelled) counts as neither outcome."""
+        with self._lock:
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """EWMA of successful call latency plus a small window for percentiles."""
+
+    def __init__(self, alpha=0.2, window=100):
+        self.alpha = alpha
+        self.ewma = None
+        self._window = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.ewma = seconds if self.ewma is None else self.alpha * seconds + (1 - self.alpha) * self.ewma
+            self._window.append(seconds)
+
+    def penalize(self, seconds):
+        """Failures push the EWMA up (so the chain re-orders) without skewing percentiles."""
+        with self._lock:
+            self.ewma = seconds if self.ewma is None else self.alpha * seconds + (1 - self.alpha) * self.ewma
+
+    def percentile(self, p):
+        with self._lock:
+            values = sorted(self._window)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(len(values) * p))]
+
+
+class ModelChain:
+    """Ordered fallback chain of upstream models with hedging.
+
+    ``call(fn)`` runs ``fn(model)`` on the best available model; if it has
+    not answered by that model's p90 latency (clamped to
+    [hedge_min, hedge_max]) the next model is fired as well and the first
+    success wins. Failures fail over immediately. Each model has a circuit
+    breaker, and the chain is re-ordered by EWMA latency. ``acall(fn)`` is
+    the same for a coroutine ``fn`` (no executor needed).
+    """
+
+    def __init__(self, name, models, executor, hedge_min=1.0, hedge_max=10.0,
+                 failure_threshold=5, reset_timeout=30.0, hedge=True):
+        self.name = name
+        self.models = list(models)
+        self.executor = executor
+        self.hedge_min = hedge_min
+        self.hedge_max = hedge_max
+        self.hedge = hedge
+        self.breakers = {m: CircuitBreaker(failure_threshold, reset_timeout) for m in self.models}
+        self.latency = {m: LatencyTracker() for m in self.models}
+
+    def order(self):
+        """Models whose breaker allows a call, fastest EWMA first; untried ones after, in config order."""
+        def key(im):
+            ewma = self.latency[im[1]].ewma
+            return ewma is None, ewma or 0.0, im[0]
+
+        ranked = sorted(enumerate(self.models), key=key)
+        return [m for _, m in ranked if self.breakers[m].state != "open"]
+
+    def hedge_delay(self, model):
+        p90 = self.latency[model].percentile(0.9)
+        if p90 is None:
+            return self.hedge_max
+        return min(self.hedge_max, max(self.hedge_min, p90))
+
+    def call(self, fn):
+        candidates = self.order()
+        pending = {}
+        errors = []
+
+        def launch():
+            # breaker.allow() is asked only when we really fire (half-open = one trial)
+            while candidates:
+                model = candidates.pop(0)
+                if self.breakers[model].allow():
+                    pending[self.executor.submit(self._timed, model, fn)] = model
+                    return model
+            return None
+
+        current = launch()
+        if current is None:
+            raise RuntimeError(f"{self.name}: every model's circuit is open")
+        while pending:
+            can_hedge = self.hedge and bool(candidates)
+            done, _ = wait(list(pending), timeout=self.hedge_delay(current) if can_hedge else None,
+                           return_when=FIRST_COMPLETED)
+            if not done:
+                hedged = launch()
+                if hedged:
+                    current = hedged
+                    logger.info("%s: hedging with %s", self.name, hedged)
+                continue
+            for fut in done:
+                model = pending.pop(fut)
+                if fut.exception() is None:
+                    return fut.result()
+                errors.append(f"{model}: {fut.exception()}")
+            if not pending:
+                current = launch() or current
+        raise RuntimeError(f"{self.name}: all models failed ({'; '.join(errors)})")
+
+    async def acall(self, fn):
+        candidates = self.order()
+        pending = {}
+        errors = []
+
+        def launch():
+            while candidates:
+                model = candidates.pop(0)
+                if self.breakers[model].allow():
+                    pending[asyncio.ensure_future(self._atimed(model, fn))] = model
+                    return model
+            return None
+
+        current = launch()
+        if current is None:
+            raise RuntimeError(f"{self.name}: every model's circuit is open")
+        try:
+            while pending:
+                can_hedge = self.hedge and bool(candidates)
+                done, _ = await asyncio.wait(list(pending), timeout=self.hedge_delay(current) if can_hedge else None,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = launch()
+                    if hedged:
+                        current = hedged
+                        logger.info("%s: hedging with %s", self.name, hedged)
+                    continue
+                for task in done:
+                    model = pending.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    errors.append(f"{model}: {task.exception()}")
+                if not pending:
+                    current = launch() or current
+        finally:
+            # unlike threads, the losing requests can be called off
+            for task in pending:
+                task.cancel()
+        raise RuntimeError(f"{self.name}: all models failed ({'; '.join(errors)})")
+
+    def record(self, model, seconds, ok):
+        """Feed one call's outcome to ``model``'s breaker and latency tracker.
+
+        call()/acall() do this themselves; it is public for calls made
+        outside them (streams, which can't be hedged).
+        """
+        if ok:
+            self.latency[model].observe(seconds)
+            self.breakers[model].record_success()
+        else:
+            self.breakers[model].record_failure()
+            self.latency[model].penalize(max(seconds, self.hedge_max))
+
+    def _timed(self, model, fn):
+        t0 = time.monotonic()
+        try:
+            result = fn(model)
+        except Exception:
+            self.record(model, time.monotonic() - t0, False)
+            raise
+        self.record(model, time.monotonic() - t0, True)
+        return result
+
+    async def _atimed(self, model, fn):
+        t0 = time.monotonic()
+        try:
+            result = await fn(model)
+        except asyncio.CancelledError:
+            self.breakers[model].release()
+            raise
+        except Exception:
+            self.record(model, time.monotonic() - t0, False)
+            raise
+        self.record(model, time.monotonic() - t0, True)
+        return result
+
+    def stats(self):
+        return {
+            m: {
+                "state": self.breakers[m].state,
+                "ewma": self.latency[m].ewma,
+                "p90": self.latency[m].percentile(0.9),
+            }
+            for m in self.models
+        }
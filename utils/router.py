@@ -0,0 +1,95 @@
+class _Route:
+    __slots__ = ("func", "handler")
+
+    def __init__(self, func, handler):
+        self.func = func
+        self.handler = handler
+
+
+class Router:
+    """Update dispatch by table lookup instead of telebot's linear filter chain.
+
+    Messages are looked up by command name first, then by content type;
+    ``func`` guards are only evaluated for the handlers of that one slot,
+    in registration order, so a catch-all text handler no longer shadows
+    commands registered after it. Callback queries are looked up by exact
+    ``data``, then by the longest registered ``prefix``, then fall back to
+    the ``default`` handler. Decorators mirror telebot's names so handler
+    code reads the same.
+    """
+
+    def __init__(self):
+        self._commands = {}
+        self._content = {}
+        self._callbacks = {}
+        self._prefixes = {}
+        self._prefix_lens = []
+        self._default_callback = None
+        self._routes = []
+
+    def message_handler(self, commands=None, content_types=None, func=None):
+        def deco(fn):
+            route = self._add(func, fn)
+            if commands:
+                for name in commands:
+                    self._commands[name] = route
+            else:
+                for ct in content_types or ["text"]:
+                    self._content.setdefault(ct, []).append(route)
+            return fn
+        return deco
+
+    def callback_query_handler(self, data=None, prefix=None, default=False):
+        def deco(fn):
+            route = self._add(None, fn)
+            for d in [data] if isinstance(data, str) else data or ():
+                self._callbacks[d] = route
+            for p in [prefix] if isinstance(prefix, str) else prefix or ():
+                self._prefixes[p] = route
+            self._prefix_lens = sorted({len(p) for p in self._prefixes}, reverse=True)
+            if default:
+                self._default_callback = route
+            return fn
+        return deco
+
+    def wrap(self, decorator):
+        """Apply ``decorator`` to every registered handler (e.g. metrics.timed)."""
+        for route in self._routes:
+            route.handler = decorator(route.handler)
+
+    def process_new_updates(self, updates):
+        for update in updates:
+            if update.message is not None:
+                self.route_message(update.message)
+            elif update.callback_query is not None:
+                self.route_callback(update.callback_query)
+
+    def route_message(self, msg):
+        text = msg.text
+        if text and text[0] == "/":
+            # "/cmd@BotName args" -> "cmd", as telebot.util.extract_command does
+            route = self._commands.get(text.split(maxsplit=1)[0][1:].split("@", 1)[0])
+            if route is not None and (route.func is None or route.func(msg)):
+                return route.handler(msg)
+        for route in self._content.get(msg.content_type, ()):
+            if route.func is None or route.func(msg):
+                return route.handler(msg)
+
+    def route_callback(self, call):
+        data = call.data or ""
+        route = self._callbacks.get(data)
+        if route is None:
+            for n in self._prefix_lens:
+                route = self._prefixes.get(data[:n])
+                if route is not None:
+                    break
+            else:
+                route = self._default_callback
+        if route is not None:
+            return route.handler(call)
+
+    # ========== INTERNALS ==========
+    def _add(self, func, fn):
+        route = _Route(func, fn)
+        self._routes.append(route)
+        return route
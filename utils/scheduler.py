@@ -1,5 +1,200 @@
+import os
+import uuid
+import time
+import logging
+import threading
+from datetime import datetime
+
+import pytz
+from sqlalchemy import create_engine, event, select
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.cron import CronTrigger
+
+logger = logging.getLogger(__name__)
+
+RUN_TIME_FORMAT = "%Y-%m-%d %H:%M"
+RECURRENCES = ("none", "daily", "weekly", "monthly")
+# 400s meaning "this file_id isn't a <method> file", worth trying the next send method on
+WRONG_MEDIA_ERRORS = ("wrong file identifier", "wrong remote file identifier", "can't use file of type",
+                      "wrong type of the web page content", "type of file mismatch")
+
+
+def is_wrong_media_type(e):
+    if getattr(e, "error_code", None) != 400:
+        return False
+    description = str(getattr(e, "description", None) or e).lower()
+    return any(s in description for s in WRONG_MEDIA_ERRORS)
+
+# Jobs are pickled into the jobstore by reference, so the callable is a
+# module-level function and the live manager is looked up at run time.
+_manager = None
+
+
+def run_scheduled_broadcast(job_id, payload, media, recur):
+    if _manager is None:
+        logger.error("Scheduled job %s fired without a SchedulerManager", job_id)
+        return
+    _manager._run_broadcast(job_id, payload, media, recur)
+
+
+def _sqlite_pragmas(dbapi_conn, _record):
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.close()
+
+
 class SchedulerManager:
-    def __init__(self,bot,db,timezone): pass
-    def schedule_broadcast(self,a,b,c,d): return 'jobid'
-    def cancel_all(self): pass
-    def restore_jobs_from_db(self): pass
+    """Scheduled broadcasts on APScheduler with a persistent SQLite jobstore.
+
+    Jobs survive restarts in ``jobstore_path``; ``restore_jobs_from_db``
+    only re-adds schedules the jobstore does not know about (e.g. rows
+    written before the jobstore existed), with a single id query.
+
+    With several processes on one jobstore only one may run jobs: the
+    others pass ``active=False`` (they add/remove jobs but never fire
+    them) and the active one re-reads the jobstore every
+    ``poll_interval`` seconds to pick up jobs added elsewhere.
+    """
+
+    def __init__(self, bot, db, timezone, broadcaster=None, report_to=None,
+                 jobstore_path=os.path.join("data", "jobs.sqlite"), max_workers=4, misfire_grace_time=600,
+                 active=True, poll_interval=None):
+        global _manager
+        self.bot = bot
+        self.db = db
+        self.broadcaster = broadcaster
+        self.report_to = report_to
+        self.tz = pytz.timezone(timezone)
+        self.misfire_grace_time = misfire_grace_time
+        d = os.path.dirname(jobstore_path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        engine = create_engine(f"sqlite:///{jobstore_path}")
+        event.listen(engine, "connect", _sqlite_pragmas)
+        self.jobstore = SQLAlchemyJobStore(engine=engine)
+        self.scheduler = BackgroundScheduler(
+            jobstores={"default": self.jobstore},
+            executors={"default": ThreadPoolExecutor(max_workers)},
+            job_defaults={"coalesce": True, "max_instances": 1, "misfire_grace_time": misfire_grace_time},
+            timezone=self.tz,
+        )
+        _manager = self
+        self.scheduler.start(paused=not active)
+        if active and poll_interval:
+            threading.Thread(target=self._poll, args=(poll_interval,), name="scheduler-poll", daemon=True).start()
+
+    # ========== TRIGGERS ==========
+    def make_trigger(self, run_time, recur):
+        recur = (recur or "none").lower()
+        if recur not in RECURRENCES:
+            raise ValueError(f"recurrence must be one of {', '.join(RECURRENCES)}")
+        try:
+            dt = self.tz.localize(datetime.strptime(run_time.strip(), RUN_TIME_FORMAT))
+        except (ValueError, AttributeError):
+            raise ValueError(f"time must look like YYYY-MM-DD HH:MM, got {run_time!r}")
+        if recur == "none":
+            return DateTrigger(run_date=dt, timezone=self.tz)
+        fields = {"hour": dt.hour, "minute": dt.minute, "start_date": dt, "timezone": self.tz}
+        if recur == "weekly":
+            fields["day_of_week"] = dt.weekday()
+        elif recur == "monthly":
+            fields["day"] = dt.day
+        return CronTrigger(**fields)
+
+    # ========== PUBLIC API ==========
+    def schedule_broadcast(self, run_time, payload, media, recur, job_id=None):
+        trigger = self.make_trigger(run_time, recur)
+        job_id = job_id or uuid.uuid4().hex[:12]
+        self.scheduler.add_job(run_scheduled_broadcast, trigger, id=job_id, replace_existing=True,
+                               args=[job_id, payload, media, (recur or "none").lower()])
+        return job_id
+
+    def cancel_all(self):
+        self.scheduler.remove_all_jobs()
+
+    def restore_jobs_from_db(self):
+        t0 = time.perf_counter()
+        known = self._jobstore_ids()
+        now = datetime.now(self.tz)
+        restored = skipped = 0
+        for row in self.db.list_schedules():
+            job_id = row["job_id"]
+            if job_id in known:
+                continue
+            recur = (row.get("recur") or "none").lower()
+            try:
+                trigger = self.make_trigger(row["run_time"], recur)
+            except ValueError as e:
+                logger.warning("Skipping schedule %s: %s", job_id, e)
+                skipped += 1
+                continue
+            if recur == "none" and (now - trigger.run_date).total_seconds() > self.misfire_grace_time:
+                self.db.remove_schedule(job_id)
+                skipped += 1
+                continue
+            self.scheduler.add_job(run_scheduled_broadcast, trigger, id=job_id, replace_existing=True,
+                                   args=[job_id, row["payload"], row["media"], recur])
+            restored += 1
+        logger.info("Scheduler restore: %d in jobstore, %d re-added, %d skipped in %.3fs",
+                    len(known), restored, skipped, time.perf_counter() - t0)
+        return restored
+
+    def shutdown(self):
+        self.scheduler.shutdown(wait=False)
+
+    # ========== INTERNALS ==========
+    def _poll(self, interval):
+        while self.scheduler.running:
+            time.sleep(interval)
+            self.scheduler.wakeup()
+
+    def _jobstore_ids(self):
+        with self.jobstore.engine.connect() as conn:
+            return {r[0] for r in conn.execute(select(self.jobstore.jobs_t.c.id))}
+
+    def _run_broadcast(self, job_id, payload, media, recur):
+        groups = self.db.get_groups()
+        logger.info("Running scheduled broadcast %s to %d groups", job_id, len(groups))
+        send = self._media_sender(media, payload) if media else (lambda gid: self.bot.send_message(gid, payload))
+        label = f"Scheduled broadcast {job_id}"
+        if self.broadcaster:
+            self.broadcaster.start(self.report_to, groups, send, label=label).join()
+        else:
+            for gid in groups:
+                try:
+                    send(gid)
+                except Exception as e:
+                    logger.warning("%s failed to %s: %s", label, gid, e)
+        if recur == "none":
+            self.db.remove_schedule(job_id)
+
+    def _media_sender(self, file_id, caption):
+        # only the file_id is stored, so find out once which send method accepts it
+        methods = [self.bot.send_photo, self.bot.send_video, self.bot.send_document]
+        found = []
+        lock = threading.Lock()
+
+        def send(gid):
+            with lock:
+                known = found[0] if found else None
+            if known:
+                return known(gid, file_id, caption=caption or "")
+            last_error = None
+            for m in methods:
+                try:
+                    m(gid, file_id, caption=caption or "")
+                    with lock:
+                        found[:] = [m]
+                    return
+                except Exception as e:
+                    # anything else (chat not found, kicked, ...) fails the same for every method
+                    if not is_wrong_media_type(e):
+                        raise
+                    last_error = e
+            raise last_error
+
+        return send
@@ -0,0 +1,86 @@
+import os
+import time
+import logging
+import threading
+import multiprocessing
+
+logger = logging.getLogger(__name__)
+
+SHARD_ENV = "BOT_SHARD"
+
+
+def update_chat_id(update):
+    """Chat an update belongs to (raw Bot API dict), or the sender for chat-less updates."""
+    for kind in ("message", "edited_message", "channel_post", "edited_channel_post",
+                 "my_chat_member", "chat_member", "chat_join_request"):
+        obj = update.get(kind)
+        if obj:
+            return obj["chat"]["id"]
+    cq = update.get("callback_query")
+    if cq:
+        msg = cq.get("message") or {}
+        return (msg.get("chat") or {}).get("id") or cq["from"]["id"]
+    for obj in update.values():
+        if isinstance(obj, dict) and isinstance(obj.get("from"), dict):
+            return obj["from"]["id"]
+    return 0
+
+
+def shard_of(update, shards):
+    return abs(int(update_chat_id(update))) % shards
+
+
+class ShardRouter:
+    """Routes raw updates to ``workers`` processes by hash of chat_id.
+
+    Every update of a chat lands on the same worker's FIFO queue, so per-chat
+    order is kept while chats spread over CPU cores. Workers are spawned
+    (fresh interpreters, nothing inherited mid-flight) with ``BOT_SHARD`` set
+    to their index and run ``target(index, queue)``; a dead worker is
+    restarted on the same queue.
+    """
+
+    def __init__(self, target, workers, max_pending=10000, check_interval=5.0):
+        self.target = target
+        self.ctx = multiprocessing.get_context("spawn")
+        self.queues = [self.ctx.Queue(max_pending) for _ in range(workers)]
+        self.procs = [None] * workers
+        self.routed = [0] * workers
+        self.check_interval = check_interval
+        self._stopped = False
+        for i in range(workers):
+            self._spawn(i)
+        threading.Thread(target=self._monitor, name="shard-monitor", daemon=True).start()
+
+    def route(self, update):
+        i = shard_of(update, len(self.queues))
+        self.routed[i] += 1
+        self.queues[i].put(update)
+
+    def stop(self, timeout=10):
+        self._stopped = True
+        for q in self.queues:
+            q.put(None)
+        for p in self.procs:
+            p.join(timeout)
+            if p.is_alive():
+                p.terminate()
+
+    def _spawn(self, i):
+        # the child re-imports the bot module at start; this tells it which shard it is
+        os.environ[SHARD_ENV] = str(i)
+        try:
+            p = self.ctx.Process(target=self.target, args=(i, self.queues[i]), name=f"shard-{i}", daemon=True)
+            p.start()
+        finally:
+            os.environ.pop(SHARD_ENV, None)
+        self.procs[i] = p
+        logger.info("Shard %d started (pid %s)", i, p.pid)
+
+    def _monitor(self):
+        while not self._stopped:
+            time.sleep(self.check_interval)
+            for i, p in enumerate(self.procs):
+                if not self._stopped and not p.is_alive():
+                    logger.error("Shard %d exited with %s, restarting", i, p.exitcode)
+                    self._spawn(i)
@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# Small cross-process state (sessions, admins, bot identity, rate-limit
+# buckets) lives here so sharded worker processes see one copy of it.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    ns TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (ns, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    last REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+SQL_KV_GET = "SELECT value FROM kv WHERE ns = ? AND key = ?"
+SQL_KV_PUT = ("INSERT INTO kv (ns, key, value, updated_at) VALUES (?, ?, ?, ?) "
+              "ON CONFLICT(ns, key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at")
+SQL_KV_UPDATE = "UPDATE kv SET value = ?, updated_at = ? WHERE ns = ? AND key = ?"
+SQL_KV_DELETE = "DELETE FROM kv WHERE ns = ? AND key = ?"
+SQL_KV_KEYS = "SELECT key FROM kv WHERE ns = ?"
+SQL_BUCKET_GET = "SELECT tokens, last FROM buckets WHERE key = ?"
+SQL_BUCKET_PUT = "INSERT OR REPLACE INTO buckets (key, tokens, last) VALUES (?, ?, ?)"
+SQL_BUCKET_SWEEP = "DELETE FROM buckets WHERE last < ?"
+SQL_BUCKET_COUNT = "SELECT COUNT(*) FROM buckets WHERE key LIKE ?"
+
+
+class SharedStore:
+    """SQLite key/value store shared by every process on the host (WAL)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        # the file is opened (and the schema applied) by the first query, not at startup
+        self._ready = False
+        self._init_lock = threading.Lock()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if not self._ready:
+                with self._init_lock:
+                    if not self._ready:
+                        conn.executescript(SCHEMA)
+                        self._ready = True
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Write transaction (BEGIN IMMEDIATE: one writer at a time across processes)."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get(self, ns, key, default=None):
+        row = self._conn().execute(SQL_KV_GET, (ns, str(key))).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def put(self, ns, key, value):
+        self._conn().execute(SQL_KV_PUT, (ns, str(key), json.dumps(value), time.time()))
+
+    def update(self, ns, key, value):
+        """Like put(), but only if the key still exists."""
+        self._conn().execute(SQL_KV_UPDATE, (json.dumps(value), time.time(), ns, str(key)))
+
+    def delete(self, ns, key):
+        self._conn().execute(SQL_KV_DELETE, (ns, str(key)))
+
+    def keys(self, ns):
+        return [r[0] for r in self._conn().execute(SQL_KV_KEYS, (ns,))]
+
+
+class _SyncedDict(dict):
+    """A value read from SharedDict; item writes are written back whole."""
+
+    def __init__(self, owner, key, data):
+        super().__init__(data)
+        self._owner = owner
+        self._key = key
+
+    def _save(self):
+        self._owner.store.update(self._owner.ns, self._key, dict(self))
+
+    def __setitem__(self, k, v):
+        super().__setitem__(k, v)
+        self._save()
+
+    def __delitem__(self, k):
+        super().__delitem__(k)
+        self._save()
+
+    def pop(self, k, *default):
+        v = super().pop(k, *default)
+        self._save()
+        return v
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self._save()
+
+
+class SharedDict:
+    """dict-like view of one namespace; keys are kept as strings, values are JSON.
+
+    ``get()`` returns a dict that writes itself back on mutation, so code
+    like ``sess = d.get(uid); sess["state"] = "x"`` works unchanged. A
+    write-back after the key was popped is dropped, never resurrected.
+    """
+
+    def __init__(self, store, ns):
+        self.store = store
+        self.ns = ns
+
+    def get(self, key, default=None):
+        value = self.store.get(self.ns, key)
+        if value is None:
+            return default
+        return _SyncedDict(self, str(key), value) if isinstance(value, dict) else value
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.store.put(self.ns, key, value)
+
+    def __delitem__(self, key):
+        self.store.delete(self.ns, key)
+
+    def __contains__(self, key):
+        return self.store.get(self.ns, key) is not None
+
+    def pop(self, key, default=None):
+        value = self.store.get(self.ns, key)
+        self.store.delete(self.ns, key)
+        return default if value is None else value
+
+    def keys(self):
+        return self.store.keys(self.ns)
+
+
+class SharedSet:
+    """Set of ints in one namespace (used for ADMINS)."""
+
+    def __init__(self, store, ns):
+        self.store = store
+        self.ns = ns
+
+    def add(self, item):
+        self.store.put(self.ns, int(item), True)
+
+    def discard(self, item):
+        self.store.delete(self.ns, int(item))
+
+    def __contains__(self, item):
+        try:
+            return self.store.get(self.ns, int(item)) is not None
+        except (TypeError, ValueError):
+            return False
+
+    def __iter__(self):
+        return iter([int(k) for k in self.store.keys(self.ns)])
+
+    def __len__(self):
+        return len(self.store.keys(self.ns))
+
+
+class SharedRateLimiter:
+    """RateLimiter (utils/ratelimit.py) with its buckets in the SharedStore,
+    so every worker process draws from the same per-user/chat/global budget.
+
+    All three buckets are checked and charged in one write transaction;
+    wall-clock time is used since monotonic clocks differ per process.
+    """
+
+    def __init__(self, store, user_rate=0.1, user_burst=1, chat_rate=0.5, chat_burst=5,
+                 global_rate=5.0, global_burst=20, sweep_interval=60.0):
+        self.store = store
+        self.limits = {
+            "u": (float(user_rate), float(user_burst)),
+            "c": (float(chat_rate), float(chat_burst)),
+            "g": (float(global_rate), float(global_burst)),
+        }
+        # a bucket idle this long has refilled whatever its kind
+        self.idle_after = max(cap / rate for rate, cap in self.limits.values())
+        self.sweep_interval = sweep_interval
+        self._next_sweep = 0.0
+
+    def allow(self, user_id, chat_id=None):
+        keys = [("u", f"u:{user_id}"), ("g", "g")]
+        if chat_id is not None:
+            keys.insert(1, ("c", f"c:{chat_id}"))
+        now = time.time()
+        with self.store.transaction() as conn:
+            refilled = []
+            for kind, key in keys:
+                rate, cap = self.limits[kind]
+                row = conn.execute(SQL_BUCKET_GET, (key,)).fetchone()
+                tokens = cap if row is None else min(cap, row[0] + (now - row[1]) * rate)
+                if tokens < 1:
+                    return False
+                refilled.append((key, tokens - 1, now))
+            conn.executemany(SQL_BUCKET_PUT, refilled)
+            if now >= self._next_sweep:
+                conn.execute(SQL_BUCKET_SWEEP, (now - self.idle_after,))
+                self._next_sweep = now + self.sweep_interval
+        return True
+
+    def stats(self):
+        conn = self.store._conn()
+        return {
+            "user_buckets": conn.execute(SQL_BUCKET_COUNT, ("u:%",)).fetchone()[0],
+            "chat_buckets": conn.execute(SQL_BUCKET_COUNT, ("c:%",)).fetchone()[0],
+        }
@@ -0,0 +1,109 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class Startup:
+    """Timed startup phases, for ``--profile-startup``.
+
+    ``mark(name)`` closes a phase that ran inline since the previous mark
+    (the sections of an import); ``phase(name)`` times a block; ``parallel``
+    runs independent phases on their own threads and waits for all of them.
+    A failing phase is logged and recorded, never raised: the bot should
+    come up with whatever subsystems are available.
+    """
+
+    def __init__(self):
+        self.t0 = self._last = time.perf_counter()
+        self.phases = []
+        self._lock = threading.Lock()
+
+    def mark(self, name):
+        now = time.perf_counter()
+        self._record(name, now - self._last, None)
+        self._last = now
+
+    @contextmanager
+    def phase(self, name):
+        t0 = time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as e:
+            error = e
+            logger.error("Startup phase %s failed: %s", name, e)
+        finally:
+            self._record(name, time.perf_counter() - t0, error)
+            self._last = time.perf_counter()
+
+    def parallel(self, **phases):
+        t0 = time.perf_counter()
+
+        def run(name, fn):
+            with self.phase(name):
+                fn()
+
+        threads = [threading.Thread(target=run, args=item, name=f"startup-{item[0]}") for item in phases.items()]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self._record("(parallel: " + ", ".join(phases) + ")", time.perf_counter() - t0, None)
+        self._last = time.perf_counter()
+
+    def report(self):
+        lines = [f"{'phase':40s} {'ms':>8s}"]
+        for name, seconds, error in self.phases:
+            lines.append(f"{name:40s} {seconds * 1000:8.1f}" + (f"  FAILED: {error}" if error else ""))
+        lines.append(f"{'total':40s} {(self._last - self.t0) * 1000:8.1f}")
+        return "\n".join(lines)
+
+    def _record(self, name, seconds, error):
+        with self._lock:
+            self.phases.append((name, seconds, error))
+
+
+def retry_in_background(fn, name, first_delay=1.0, max_delay=300.0):
+    """Call ``fn()`` on a daemon thread until it returns truthy, backing off between tries."""
+    def run():
+        delay = first_delay
+        while True:
+            try:
+                if fn():
+                    return
+            except Exception as e:
+                logger.warning("%s failed: %s, retrying in %.0fs", name, e, delay)
+            time.sleep(delay)
+            delay = min(delay * 2, max_delay)
+
+    threading.Thread(target=run, name=name, daemon=True).start()
+
+
+class Lazy:
+    """Builds ``factory()`` on first attribute access (thread-safe).
+
+    Truthy without building, so ``if ai:`` keeps meaning "AI is configured".
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._obj = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        obj = self._obj
+        if obj is None:
+            with self._lock:
+                if self._obj is None:
+                    self._obj = self._factory()
+                obj = self._obj
+        return obj
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+    def __bool__(self):
+        return True
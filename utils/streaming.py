@@ -0,0 +1,73 @@
+import time
+import logging
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_MAX_TEXT = 4096
+
+# the latency a user actually feels with streaming on
+TTFT_SECONDS = metrics.histogram("chat_ttft_seconds", "Time until the first streamed reply text is visible")
+
+
+def stream_reply(bot, msg, chunks, first_chars=40, edit_interval=1.5):
+    """Send a streamed AI reply as one message that grows via edits.
+
+    The first message goes out once ``first_chars`` characters arrived, then
+    it is edited at most every ``edit_interval`` seconds (Telegram throttles
+    edits per chat), with one final edit for the full text. Partial text is
+    sent unformatted (a cut-off "<b" would fail HTML parsing); only the final
+    edit uses the bot's parse mode, falling back to plain text if it fails.
+    Returns (full_text, time_to_first_visible_token or None).
+    """
+    started = time.monotonic()
+    text = ""
+    shown = ""
+    sent = None
+    ttft = None
+    last_edit = 0.0
+
+    def send(body, parse_mode):
+        nonlocal sent, ttft
+        if sent is None:
+            sent = bot.reply_to(msg, body, parse_mode=parse_mode, allow_sending_without_reply=True)
+            ttft = time.monotonic() - started
+        else:
+            bot.edit_message_text(body, sent.chat.id, sent.message_id, parse_mode=parse_mode)
+
+    def show(body, final=False):
+        nonlocal shown, last_edit
+        body = body[:TELEGRAM_MAX_TEXT]
+        if not body.strip() or (body == shown and not final):
+            return
+        try:
+            # "" = no parse mode; None = the bot's default (HTML)
+            send(body, None if final else "")
+        except Exception as e:
+            # "message is not modified", bad markup and friends: keep streaming
+            logger.debug("stream send failed: %s", e)
+            if final:
+                try:
+                    send(body, "")
+                except Exception as e:
+                    logger.debug("stream send failed: %s", e)
+        shown = body
+        last_edit = time.monotonic()
+
+    try:
+        for piece in chunks:
+            text += piece
+            if sent is None:
+                if len(text) >= first_chars:
+                    show(text + " …")
+            elif time.monotonic() - last_edit >= edit_interval:
+                show(text + " …")
+    except Exception as e:
+        logger.error("Reply stream broke off: %s", e)
+    show(text, final=True)
+    if ttft is not None:
+        TTFT_SECONDS.observe(ttft)
+    logger.info("Streamed reply: ttft=%s total=%.2fs chars=%d",
+                f"{ttft:.2f}s" if ttft is not None else "n/a", time.monotonic() - started, len(text))
+    return text, ttft
@@ -0,0 +1,101 @@
+import hmac
+import json
+import queue
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telebot import types
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """Receives Telegram updates over HTTPS-terminated POSTs.
+
+    Each request only checks the secret token header and queues the raw
+    body, then acks with 200; one dispatcher thread parses updates in
+    arrival order and hands them to ``bot.process_new_updates``, which puts
+    them on the PriorityDispatcher's pools. When ``max_pending`` bodies are
+    waiting the server answers 503 so Telegram retries later; a body over
+    ``max_body`` bytes is refused with 413 before it is read. ``GET /``
+    is a health check for load balancers. A ``sink`` callable, if given,
+    receives each raw update dict instead (used to fan out to shard workers).
+    """
+
+    def __init__(self, bot, secret, path="/webhook", host="0.0.0.0", port=8443, max_pending=1000, sink=None,
+                 max_body=1 << 20):
+        self.bot = bot
+        self.max_body = max_body
+        self.sink = sink or self._process
+        self.secret = secret.encode("utf-8")
+        self.path = path
+        self.pending = queue.Queue(maxsize=max_pending)
+        self.received = 0
+        self.rejected = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                server._receive(self)
+
+            def do_GET(self):
+                self._respond(200, b"ok")
+
+            def _respond(self, status, body=b""):
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, fmt, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        threading.Thread(target=self._dispatch, name="webhook-dispatch", daemon=True).start()
+
+    def serve_forever(self):
+        host, port = self.httpd.server_address[:2]
+        logger.info("Webhook listening on %s:%d%s", host, port, self.path)
+        self.httpd.serve_forever()
+
+    def shutdown(self):
+        self.httpd.shutdown()
+
+    # ========== INTERNALS ==========
+    def _receive(self, h):
+        if h.path.split("?", 1)[0] != self.path:
+            return h._respond(404)
+        token = (h.headers.get(SECRET_HEADER) or "").encode("utf-8")
+        if not hmac.compare_digest(token, self.secret):
+            self.rejected += 1
+            return h._respond(403)
+        try:
+            length = int(h.headers.get("Content-Length") or 0)
+        except ValueError:
+            return h._respond(400)
+        if length > self.max_body:
+            self.rejected += 1
+            return h._respond(413)
+        body = h.rfile.read(length)
+        try:
+            self.pending.put_nowait(body)
+        except queue.Full:
+            logger.warning("Webhook backlog full (%d), asking Telegram to retry", self.pending.maxsize)
+            return h._respond(503)
+        self.received += 1
+        h._respond(200)
+
+    def _process(self, update):
+        self.bot.process_new_updates([types.Update.de_json(update)])
+
+    def _dispatch(self):
+        while True:
+            body = self.pending.get()
+            try:
+                self.sink(json.loads(body))
+            except Exception as e:
+                logger.error("Bad webhook update: %s", e)